@@ -0,0 +1,92 @@
+"""
+Memory and accuracy of the reduced precision rollout buffers (MPPIConfig.precision)
+against the float32 path, planning a point robot to a goal with the analytic model.
+
+The reduced precision planners replan from the states visited by the float32
+planner, so the drift is the per-command difference of the plans and does not
+compound.
+
+    python3 mixed_precision.py --num_samples 1000 --horizon 30 --device cuda:0
+"""
+import argparse
+import time
+
+import torch
+
+from mppiisaac.dynamics.analytic import PointRobot
+from mppiisaac.planner.mppi import MPPIPlanner, MPPIConfig
+
+
+def make_planner(precision, num_samples, horizon, device, mode):
+    model = PointRobot(dt=0.05)
+    goal = torch.tensor([2.0, -1.0], device=device)
+    cfg = MPPIConfig(
+        num_samples=num_samples,
+        horizon=horizon,
+        device=device,
+        mppi_mode=mode,
+        sampling_method="halton" if mode == "halton-spline" else "random",
+        qmc_sequence="halton",
+        lambda_=0.1,
+        noise_sigma=[[1.0, 0, 0], [0, 1.0, 0], [0, 0, 0.1]],
+        u_min=[-1.0],
+        u_max=[1.0],
+        u_per_command=horizon,
+        sample_null_action=True,
+        precision=precision,
+    )
+    cost = lambda state: torch.linalg.norm(state[:, model.index("x", "y")] - goal, dim=1)
+    return model, MPPIPlanner(cfg, model.nx, model, cost)
+
+
+def rollout_bytes(planner):
+    """
+        Bytes held by the K x T sample, action, noise and cost buffers of the last command
+    """
+    buffers = [planner.workspace.actions, planner.workspace.costs, planner.workspace.states, planner.perturbed_action]
+    buffers += [planner.delta if planner.mppi_mode == "halton-spline" else planner.noise]
+    return sum(b.numel() * b.element_size() for b in buffers if torch.is_tensor(b))
+
+
+def run(num_samples, horizon, device, mode, steps):
+    print(f"K={num_samples} T={horizon} mode={mode} device={device}")
+
+    model, planner = make_planner("float32", num_samples, horizon, device, mode)
+    state = model.initial_state([0.0, 0.0, 0.0], device=device)
+    states, reference = [], []
+    for _ in range(steps):
+        states.append(state)
+        reference.append(planner.command(state))
+        state = model(state.unsqueeze(0), reference[-1][0].unsqueeze(0))[0][0]
+    reference = torch.stack(reference)
+
+    for precision in ["float32", "bfloat16", "float16"]:
+        # Warm up outside the timing
+        make_planner(precision, num_samples, horizon, device, mode)[1].command(states[0])
+        _, planner = make_planner(precision, num_samples, horizon, device, mode)
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        t_start = time.perf_counter()
+        plans = torch.stack([planner.command(s) for s in states])
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        t = (time.perf_counter() - t_start) / steps
+
+        peak = f"  peak {torch.cuda.max_memory_allocated() / 2 ** 20:.1f} MiB" if device.startswith("cuda") else ""
+        drift = torch.abs(plans - reference)
+        print(
+            f"{precision + ':':10s}{t * 1e3:9.3f} ms/command  rollout buffers {rollout_bytes(planner) / 2 ** 20:8.2f} MiB{peak}"
+            f"  plan drift max {drift.max().item():.2e} mean {drift.mean().item():.2e}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=1000)
+    parser.add_argument("--horizon", type=int, default=30)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--mode", type=str, default="halton-spline")
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+    run(args.num_samples, args.horizon, args.device, args.mode, args.steps)
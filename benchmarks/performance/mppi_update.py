@@ -0,0 +1,71 @@
+"""
+Per-iteration cost of the MPPI distribution update and action perturbation,
+eager against MPPIConfig.compile=True, on random rollouts.
+
+    python3 mppi_update.py --num_samples 1000 --horizon 20 --nu 7
+"""
+import argparse
+import time
+
+import torch
+
+from mppiisaac.planner.mppi import MPPIPlanner, MPPIConfig
+
+
+def make_planner(num_samples, horizon, nu, device, compile):
+    cfg = MPPIConfig(
+        num_samples=num_samples,
+        horizon=horizon,
+        device=device,
+        noise_sigma=torch.eye(nu).tolist(),
+        u_min=[-1.0],
+        u_max=[1.0],
+        update_cov=True,
+        compile=compile,
+    )
+    planner = MPPIPlanner(cfg, 2 * nu, dynamics=None, running_cost=None)
+    planner.workspace.resize(num_samples, horizon)
+    return planner
+
+
+def time_update(planner, costs, actions, iterations):
+    def iteration():
+        planner._perturb_actions(
+            planner.mean_action, actions, planner.scale_tril, planner.u_min, planner.u_max
+        )
+        planner._update_distribution(costs, actions)
+
+    # Warm up, this triggers compilation
+    for _ in range(5):
+        iteration()
+
+    t_start = time.perf_counter()
+    for _ in range(iterations):
+        iteration()
+    if planner.tensor_args["device"].startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - t_start) / iterations
+
+
+def run(num_samples, horizon, nu, device, iterations):
+    costs = torch.rand(num_samples, horizon, device=device)
+    actions = torch.randn(num_samples, horizon, nu, device=device)
+
+    t_eager = time_update(make_planner(num_samples, horizon, nu, device, False), costs, actions, iterations)
+    t_compiled = time_update(make_planner(num_samples, horizon, nu, device, True), costs, actions, iterations)
+
+    print(f"K={num_samples} T={horizon} nu={nu} device={device}")
+    print(f"eager:    {t_eager * 1e6:10.1f} us/iteration")
+    print(f"compiled: {t_compiled * 1e6:10.1f} us/iteration")
+    print(f"saved:    {(t_eager - t_compiled) * 1e6:10.1f} us/iteration")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=1000)
+    parser.add_argument("--horizon", type=int, default=20)
+    parser.add_argument("--nu", type=int, default=7)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    run(args.num_samples, args.horizon, args.nu, args.device, args.iterations)
@@ -0,0 +1,87 @@
+"""
+Per tick latency of reset_robot_state, which runs at the start of every
+compute_action, against rebuilding the dof state from a python list and
+pushing the full dof and root state tensors as the wrappers used to.
+
+The torch backend runs anywhere, --backend isaacgym needs IsaacGym and a gpu.
+
+    python3 robot_reset.py --num_envs 1000 --actors point_robot boxer --backend isaacgym
+"""
+import argparse
+import os
+import time
+
+import torch
+import yaml
+
+import mppiisaac
+from mppiisaac.planner.sim_backend import ActorWrapper, IsaacGymConfig
+from mppiisaac.planner.torch_sim_wrapper import TorchSimWrapper
+
+
+def make_sim(backend, actor_names, num_envs, device):
+    actors = []
+    for name in actor_names:
+        with open(f"{os.path.dirname(mppiisaac.__file__)}/../conf/actors/{name}.yaml") as f:
+            actors.append(ActorWrapper(**yaml.safe_load(f)))
+    init_positions = [[2.0 * i, 0.0, 0.05] for i in range(len(actors))]
+    if backend == "isaacgym":
+        from mppiisaac.planner.isaacgym_wrapper import IsaacGymWrapper
+
+        return IsaacGymWrapper(IsaacGymConfig(), actors, init_positions, num_envs), "cuda:0"
+    return TorchSimWrapper(IsaacGymConfig(), actors, init_positions, num_envs, device=device), device
+
+
+def list_reset(sim, q, qdot, device):
+    """
+        Per tick work of the former reset: a python list of interleaved q / qdot, converted, repeated for all envs and
+        pushed with the full root state, differential drive bases set one by one
+    """
+    layout = sim.robot_dof_layout
+    for i, base in enumerate(layout.base_q.tolist()):
+        handle = sim.env_cfg[sim.robot_indices[layout.base_robots[i]].item()].handle
+        sim.set_state_tensor_by_pos_vel(handle, [q[j] for j in base], [qdot[j] for j in base])
+    dof_state = []
+    for dof in layout.q_idx.tolist():
+        dof_state += [q[dof], qdot[dof]] if dof < layout.num_q else [0, 0]
+    dof_state = torch.tensor(dof_state).type(torch.float32).to(device).repeat(sim.num_envs, 1)
+    sim.set_dof_state_tensor(dof_state)
+    sim.set_root_state_tensor(sim.root_state)
+    if isinstance(sim, TorchSimWrapper):
+        # The torch backend updates its rigid bodies and contacts on every reset
+        sim._refresh()
+
+
+def timed(fn, device, repeat):
+    fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    t_start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - t_start) / repeat
+
+
+def run(backend, actor_names, num_envs, device, repeat):
+    sim, device = make_sim(backend, actor_names, num_envs, device)
+    num_q = sim.robot_dof_layout.num_q
+    q, qdot = [0.1 * i for i in range(num_q)], [0.01 * i for i in range(num_q)]
+
+    print(f"K={num_envs} backend={backend} actors={actor_names} device={device}")
+    t_list = timed(lambda: list_reset(sim, q, qdot, device), device, repeat)
+    t_indexed = timed(lambda: sim.reset_robot_state(q, qdot), device, repeat)
+    print(f"list reset    {t_list * 1e6:9.1f} us/tick")
+    print(f"indexed reset {t_indexed * 1e6:9.1f} us/tick")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", type=str, default="torch", choices=["torch", "isaacgym"])
+    parser.add_argument("--actors", type=str, nargs="+", default=["point_robot", "boxer"])
+    parser.add_argument("--num_envs", type=int, default=1000)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    run(args.backend, args.actors, args.num_envs, args.device, args.repeat)
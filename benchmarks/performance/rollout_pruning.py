@@ -0,0 +1,81 @@
+"""
+Simulated sample steps, time and plan quality of successive halving over the
+horizon (MPPIConfig.prune_segment) on a point robot driving to a goal around a
+round obstacle, with the analytic model.
+
+Pruning trades bookkeeping for fewer simulated steps, so it only pays off when a
+step is expensive. An analytic point robot step is almost free, with the defaults
+the pruned planners are slower than the unpruned one. --substeps integrates every
+step in that many substeps to emulate a more expensive simulator step:
+
+    python3 rollout_pruning.py --num_samples 1000 --horizon 30 --segments 0 5 10
+    python3 rollout_pruning.py --num_samples 1000 --horizon 30 --segments 0 5 10 --substeps 20
+"""
+import argparse
+import time
+
+import torch
+
+from mppiisaac.dynamics.analytic import PointRobot
+from mppiisaac.planner.mppi import MPPIPlanner, MPPIConfig
+
+
+def run(num_samples, horizon, device, segments, fraction, steps, substeps):
+    model = PointRobot(dt=0.05 / substeps)
+    goal = torch.tensor([2.0, 0.0], device=device)
+    obstacle = torch.tensor([1.0, 0.05], device=device)
+
+    def cost(state):
+        pos = state[:, model.index("x", "y")]
+        collision = torch.linalg.norm(pos - obstacle, dim=1) < 0.4
+        return torch.linalg.norm(pos - goal, dim=1) + 100.0 * collision
+
+    def dynamics(state, u, t=None):
+        for _ in range(substeps):
+            state, u = model(state, u)
+        return state, u
+
+    print(f"K={num_samples} T={horizon} fraction={fraction} substeps={substeps} device={device}")
+    for segment in segments:
+        cfg = MPPIConfig(
+            num_samples=num_samples,
+            horizon=horizon,
+            device=device,
+            noise_sigma=[[1.0, 0, 0], [0, 1.0, 0], [0, 0, 0.1]],
+            u_min=[-1.0],
+            u_max=[1.0],
+            sample_null_action=True,
+            prune_segment=segment or None,
+            prune_fraction=fraction,
+        )
+        state = model.initial_state([0.0, 0.0, 0.0], device=device)
+        # Warm up outside the timing, otherwise the first configuration pays for it
+        MPPIPlanner(cfg, model.nx, dynamics, cost).command(state)
+        planner = MPPIPlanner(cfg, model.nx, dynamics, cost)
+        sample_steps, total_cost = 0, 0.0
+        t_start = time.perf_counter()
+        for _ in range(steps):
+            action = planner.command(state)
+            sample_steps += planner.rollout_steps
+            state = dynamics(state.unsqueeze(0), action.unsqueeze(0))[0][0]
+            total_cost += cost(state.unsqueeze(0)).item()
+        t = (time.perf_counter() - t_start) / steps
+
+        print(
+            f"segment {segment or '-':>3}: {t * 1e3:9.3f} ms/command  "
+            f"simulated {sample_steps / (steps * num_samples * horizon):6.1%} of the sample steps  "
+            f"closed loop cost {total_cost:8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=1000)
+    parser.add_argument("--horizon", type=int, default=30)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--segments", type=int, nargs="+", default=[0, 5, 10])
+    parser.add_argument("--fraction", type=float, default=0.5)
+    parser.add_argument("--steps", type=int, default=60)
+    parser.add_argument("--substeps", type=int, default=1)
+    args = parser.parse_args()
+    run(args.num_samples, args.horizon, args.device, args.segments, args.fraction, args.steps, args.substeps)
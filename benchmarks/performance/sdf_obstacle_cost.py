@@ -0,0 +1,65 @@
+"""
+Time of the obstacle cost of K samples against N spherical obstacles, computed
+against every obstacle as in the point robot benchmark objective and with one
+lookup in a SignedDistanceGrid, and the time to rebake the grid after one
+obstacle moved.
+
+    python3 sdf_obstacle_cost.py --num_samples 1000 --obstacles 1 10 100 --device cuda:0
+"""
+import argparse
+import time
+
+import torch
+
+from mppiisaac.utils.sdf_grid import SignedDistanceGrid
+
+
+def timed(fn, device, repeat):
+    fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    t_start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - t_start) / repeat
+
+
+def run(num_samples, obstacles, resolution, device, repeat):
+    print(f"K={num_samples} resolution={resolution} device={device}")
+    torch.manual_seed(0)
+    pos = torch.rand(num_samples, 2, device=device) * 8 - 4
+
+    for num_obstacles in obstacles:
+        centers = torch.rand(num_obstacles, 2, device=device) * 8 - 4
+        sdf = SignedDistanceGrid([-5.0, -5.0], [5.0, 5.0], resolution, device=device)
+        t_start = time.perf_counter()
+        for i, c in enumerate(centers.tolist()):
+            sdf.set_obstacle(f"sphere{i}", "sphere", c, [0.2])
+        sdf.update()
+        t_bake = time.perf_counter() - t_start
+
+        per_obstacle = lambda: torch.sum(1 / torch.linalg.norm(centers - pos.unsqueeze(1), axis=2), axis=1)
+        lookup = lambda: 1 / torch.clamp(sdf.distance(pos), min=0.01)
+
+        def move():
+            sdf.set_obstacle("sphere0", "sphere", (centers[0] + 0.1 * torch.randn(2, device=device)).tolist(), [0.2])
+            sdf.update()
+
+        print(
+            f"N={num_obstacles:4d}: per obstacle {timed(per_obstacle, device, repeat) * 1e6:9.1f} us  "
+            f"grid lookup {timed(lookup, device, repeat) * 1e6:9.1f} us  "
+            f"bake {t_bake * 1e3:8.2f} ms  move one {timed(move, device, repeat) * 1e3:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_samples", type=int, default=1000)
+    parser.add_argument("--obstacles", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--resolution", type=float, default=0.05)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+    run(args.num_samples, args.obstacles, args.resolution, args.device, args.repeat)
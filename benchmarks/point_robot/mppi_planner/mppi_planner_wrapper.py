@@ -2,6 +2,7 @@ from omegaconf import OmegaConf
 from plannerbenchmark.generic.planner import Planner
 from mppiisaac.planner.isaacgym_wrapper import IsaacGymWrapper
 from mppiisaac.planner.mppi_isaac import MPPIisaacPlanner
+from mppiisaac.utils.sdf_grid import SignedDistanceGrid
 
 import torch
 
@@ -33,8 +34,10 @@ class ObjectiveOld(object):
         return nav_cost * self.w_nav + obs_cost * self.w_obs
 
 class Objective(object):
-    def __init__(self, goal, device):
+    def __init__(self, goal, device, sdf=None):
         self.nav_goal = torch.tensor(goal, device=device)
+        # Optional SignedDistanceGrid of the obstacles, replaces the distance to every obstacle by one grid lookup
+        self.sdf = sdf
 
         self.w_nav = 1.0
         self.w_obs = 0.5
@@ -52,10 +55,13 @@ class Objective(object):
         # sim.net_cf
 
         # This can cause steady state error if the goal is close to an obstacle, better use contact forces later on
-        obs_cost = torch.sum(
-            1 / torch.linalg.norm(obs_positions[:, :, :2] - pos.unsqueeze(1), axis=2),
-            axis=1,
-        )
+        if self.sdf is not None:
+            obs_cost = 1 / torch.clamp(self.sdf.distance(pos), min=0.01)
+        else:
+            obs_cost = torch.sum(
+                1 / torch.linalg.norm(obs_positions[:, :, :2] - pos.unsqueeze(1), axis=2),
+                axis=1,
+            )
 
         return nav_cost * self.w_nav + obs_cost * self.w_obs
 
@@ -80,7 +86,12 @@ class MPPIPlanner(Planner):
     def setGoal(self, motionPlanningGoal):
         cfg = OmegaConf.create(self.cfg)
         goal_position = motionPlanningGoal.sub_goals()[0].position()
-        objective = Objective(goal_position, cfg.mppi.device)
+        sdf = None
+        if cfg.get('obstacle_sdf'):
+            sdf = SignedDistanceGrid(
+                cfg.obstacle_sdf.lower, cfg.obstacle_sdf.upper, cfg.obstacle_sdf.resolution, device=cfg.mppi.device
+            )
+        objective = Objective(goal_position, cfg.mppi.device, sdf=sdf)
         if not hasattr(self, '_planner'):
             self._planner = MPPIisaacPlanner(cfg, objective)
 
@@ -101,8 +112,11 @@ class MPPIPlanner(Planner):
     def computeAction(self, **kwargs):
         ob = kwargs
         obst = ob["FullSensor"]["obstacles"]
-        for o in obst.values():
+        for i, o in enumerate(obst.values()):
             o['type'] = 'sphere'
+            # Named like the obstacle actors of the sim, only obstacles that moved are rebaked into the grid
+            if self._planner.objective.sdf is not None:
+                self._planner.objective.sdf.set_obstacle(f"sphere{i}", 'sphere', o['position'], o['size'])
 
         action = self._planner.compute_action(
             q=ob["joint_state"]["position"],
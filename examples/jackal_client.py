@@ -11,6 +11,8 @@ from mppiisaac.utils.config_store import ExampleConfig
 
 
 class Objective(object):
+    required_tensors = ["root_state"]
+
     def __init__(self, cfg, device):
         self.nav_goal = torch.tensor(cfg.goal, device=cfg.mppi.device)
 
@@ -20,6 +20,8 @@ urdf_file = (
 )
 
 class Objective(object):
+    required_tensors = ["root_state"]
+
     def __init__(self, cfg, device):
         self.nav_goal = torch.tensor(cfg.goal, device=cfg.mppi.device)
 
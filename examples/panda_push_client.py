@@ -35,6 +35,9 @@ class Objective(object):
         self.w_push_align=         45#4.2
         self.w_collision=          0.0
 
+        # Terminate rollouts once the contact force on the obstacle exceeds this, None to keep scoring them
+        self.max_obst_contact_force = None
+
     
         # Task configration for comparison with baselines
         self.ee_index = 9
@@ -112,6 +115,8 @@ class Objective(object):
             + self.w_collision * coll
         )
 
+        if self.max_obst_contact_force is not None:
+            return total_cost, coll > self.max_obst_contact_force
         return total_cost
 
 @hydra.main(version_base=None, config_path="../conf", config_name="config_panda_push")
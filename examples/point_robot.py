@@ -18,6 +18,8 @@ from mppiisaac.priors.fabrics_point import FabricsPointPrior
 
 
 class Objective(object):
+    required_tensors = ["dof_state"]
+
     def __init__(self, cfg, device):
         self.nav_goal = torch.tensor(cfg.goal, device=cfg.mppi.device)
 
@@ -0,0 +1,80 @@
+import math
+import os
+
+import pytest
+import torch
+import yaml
+
+import mppiisaac
+from mppiisaac.dynamics.analytic import DifferentialDrive, JointIntegrator, OmniBase, PointRobot, model_for_actor
+from mppiisaac.planner.mppi import MPPIPlanner, MPPIConfig
+
+
+def load_actor(name):
+    with open(f"{os.path.dirname(mppiisaac.__file__)}/../conf/actors/{name}.yaml") as f:
+        return yaml.safe_load(f)
+
+
+@pytest.mark.parametrize("name, model_type, nx", [
+    ("point_robot", JointIntegrator, 6),
+    ("heijn", JointIntegrator, 6),
+    ("panda", JointIntegrator, 14),
+    ("omnipanda", JointIntegrator, 24),
+    ("boxer", DifferentialDrive, 6),
+    ("jackal", DifferentialDrive, 6),
+])
+def test_models_match_actor_configs(name, model_type, nx):
+    model = model_for_actor(load_actor(name))
+    assert isinstance(model, model_type)
+    assert model.nx == nx
+
+    state = torch.zeros(5, model.nx)
+    next_state, u = model(state, torch.ones(5, model.nu))
+    assert next_state.shape == state.shape and u.shape == (5, model.nu)
+
+
+def test_joint_integrator_respects_urdf_limits():
+    panda = model_for_actor(load_actor("panda"))
+    state, u = panda(torch.zeros(1, 14), torch.full((1, 7), 10.0))
+    assert torch.allclose(u, torch.tensor([[2.175] * 4 + [2.61] * 3]))
+    # Joint 4 of the panda has limits [-3.0718, -0.0698]
+    assert state[0, panda.index("panda_joint4")].item() == pytest.approx(-0.0698)
+
+
+def test_differential_drive_uses_isaacgym_wheel_kinematics():
+    model = DifferentialDrive.from_actor(load_actor("jackal"), dt=0.1)
+    u = torch.tensor([[1.0, 0.5]])
+
+    r, L = 0.14, 0.4
+    expected = torch.tensor([[1.0 / r - L * 0.5 / (2 * r), 1.0 / r + L * 0.5 / (2 * r)]]).repeat(1, 2)
+    assert torch.allclose(model.wheel_velocities(u), expected)
+
+    state, applied = model(model.initial_state([0.0, 0.0, math.pi / 2]).unsqueeze(0), u)
+    assert torch.allclose(applied, u)
+    heading = math.pi / 2 + 0.5 * 0.1 * 0.5
+    x, y, theta = state[0, model.index("x", "y", "theta")].tolist()
+    assert (x, y, theta) == pytest.approx((0.1 * math.cos(heading), 0.1 * math.sin(heading), math.pi / 2 + 0.05))
+
+
+def test_omni_base_moves_in_body_frame():
+    model = OmniBase(dt=1.0)
+    state = model.initial_state([0.0, 0.0, math.pi / 2]).unsqueeze(0)
+    state, _ = model(state, torch.tensor([[1.0, 0.0, 0.0]]))
+    assert state[0, model.index("x", "y")].tolist() == pytest.approx([0.0, 1.0], abs=1e-6)
+
+
+def test_planner_drives_point_robot_to_goal():
+    model = PointRobot(dt=0.05)
+    goal = torch.tensor([1.0, -0.5])
+    cfg = MPPIConfig(
+        num_samples=200, horizon=20, device="cpu", noise_sigma=[[1.0, 0, 0], [0, 1.0, 0], [0, 0, 0.1]],
+        u_min=[-1.0], u_max=[1.0], sample_null_action=True,
+    )
+    cost = lambda state: torch.linalg.norm(state[:, model.index("x", "y")] - goal, dim=1)
+    planner = MPPIPlanner(cfg, model.nx, model, cost)
+
+    state = model.initial_state([0.0, 0.0, 0.0])
+    for _ in range(60):
+        state, _ = model(state.unsqueeze(0), planner.command(state).unsqueeze(0))
+        state = state[0]
+    assert torch.linalg.norm(state[model.index("x", "y")] - goal) < 0.1
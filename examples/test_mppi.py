@@ -0,0 +1,342 @@
+import json
+import numpy as np
+import scipy.interpolate as si
+import torch
+
+from mppiisaac.planner.mppi import MPPIPlanner, MPPIConfig
+from mppiisaac.planner.batched_mppi import BatchedMPPIPlanner
+from mppiisaac.planner.sharded_rollout import ShardedRollout
+
+
+def point_mass(state, u, t=None):
+    return state + 0.1 * u, u
+
+
+class PointMassModel:
+    def __init__(self, worker_idx, num_samples):
+        self.dynamics = point_mass
+
+    def running_cost(self, state):
+        return torch.sum((state - 1) ** 2, dim=1)
+
+
+def make_config(**kwargs):
+    cfg = dict(
+        num_samples=32,
+        horizon=12,
+        device="cpu",
+        noise_sigma=[[1.0, 0.0], [0.0, 1.0]],
+        u_min=[-1.0],
+        u_max=[1.0],
+        update_cov=True,
+        filter_u=True,
+        sample_null_action=True,
+    )
+    cfg.update(kwargs)
+    return MPPIConfig(**cfg)
+
+
+def test_halton_splines_match_scipy_smoothing_splines():
+    for interpolating in [False, True]:
+        planner = MPPIPlanner(
+            make_config(qmc_sequence="sobol", interpolating_splines=interpolating), 2, point_mass, lambda s: s[:, 0]
+        )
+        samples = planner.get_samples(32)
+        knots = planner.knot_points.view(32, 2, planner.n_knots).numpy()
+
+        # Same as fitting every (sample, action) spline with scipy, smoothing with s=0.5 unless interpolating
+        x, xx = np.linspace(0, planner.n_knots, planner.n_knots), np.linspace(0, planner.n_knots, planner.T)
+        expected = np.zeros((32, planner.T, 2))
+        for i in range(32):
+            for j in range(2):
+                spl = si.splrep(x, knots[i, j], k=planner.degree, s=0.0 if interpolating else 0.5)
+                expected[i, :, j] = si.splev(xx, spl, ext=3)
+        assert torch.allclose(samples, torch.from_numpy(expected).float(), atol=1e-5)
+
+    assert planner._noise_bank_key().spline == "interpolating"
+
+
+def test_batched_planner_matches_independent_planners():
+    goals = torch.tensor([[1.0, 1.0], [-1.0, 0.5], [0.3, -2.0]])
+
+    expected = []
+    for goal in goals:
+        planner = MPPIPlanner(make_config(), 2, point_mass, lambda s, g=goal: torch.sum((s - g) ** 2, dim=1))
+        state = torch.zeros(2)
+        for _ in range(4):
+            state = state + 0.1 * planner.command(state)
+        expected.append(state)
+
+    goals_per_rollout = goals.repeat_interleave(32, dim=0)
+    planner = BatchedMPPIPlanner(
+        make_config(), 2, point_mass, lambda s: torch.sum((s - goals_per_rollout) ** 2, dim=1), num_problems=3
+    )
+    state = torch.zeros(3, 2)
+    for _ in range(4):
+        state = state + 0.1 * planner.command(state)
+
+    assert torch.allclose(state, torch.stack(expected), atol=1e-6)
+
+
+def test_rollout_workspace_is_reused_and_states_are_optional():
+    cost = lambda s: torch.sum((s - 1) ** 2, dim=1)
+    plans = {}
+    for retain_states in [True, False]:
+        planner = MPPIPlanner(make_config(retain_states=retain_states), 2, point_mass, cost)
+        state, actions, buffers = torch.zeros(2), [], set()
+        for _ in range(4):
+            actions.append(planner.command(state))
+            state = state + 0.1 * actions[-1]
+            workspace = planner.workspace
+            buffers.add(tuple(
+                None if b is None else b.data_ptr()
+                for b in [workspace.states, workspace.actions, workspace.costs, workspace.cost_total]
+            ))
+        plans[retain_states] = torch.stack(actions)
+
+        # The same buffers are filled by every command
+        assert len(buffers) == 1
+        assert (planner.states is None) != retain_states
+
+    assert torch.equal(plans[True], plans[False])
+
+
+def test_command_iterates_until_deadline_or_iteration_limit():
+    planner = MPPIPlanner(
+        make_config(anytime_max_iterations=3, anytime_tol=0.0), 2, point_mass, lambda s: torch.sum((s - 1) ** 2, dim=1)
+    )
+
+    _, report = planner.command(torch.zeros(2), return_report=True)
+    assert report.iterations == 1
+
+    _, report = planner.command(torch.zeros(2), deadline_s=10.0, return_report=True)
+    assert report.iterations == 3
+    assert not report.converged
+
+
+def test_command_returns_the_best_plan_within_the_deadline():
+    for cfg in [dict(), dict(chunk_size=10), dict(mppi_mode="simple", sampling_method="random", lambda_=0.1)]:
+        # Every iteration sees a different constant cost offset, the second one the lowest
+        offsets, plans, costs, states = [0.0, -5.0, 3.0, 4.0], [], [], []
+        planner = MPPIPlanner(
+            make_config(anytime_max_iterations=4, anytime_tol=0.0, filter_u=False, u_per_command=12, **cfg),
+            2,
+            point_mass,
+            lambda s: torch.sum((s - 1) ** 2, dim=1) + offsets[len(plans)],
+        )
+        optimize = planner._optimize
+
+        def recording_optimize():
+            plan = optimize()
+            plans.append(plan.clone())
+            costs.append(planner.weighted_cost.item())
+            states.append(planner._iteration_state())
+            return plan
+
+        planner._optimize = recording_optimize
+
+        plan, report = planner.command(torch.zeros(2), deadline_s=10.0, return_report=True)
+        assert report.iterations == 4
+        assert min(range(4), key=costs.__getitem__) == 1
+        assert not torch.equal(plans[1], plans[-1])
+        assert torch.equal(plan, plans[1])
+        # The next command shifts the returned plan and samples with the rest of its distribution
+        assert torch.equal(planner.U if cfg.get("mppi_mode") == "simple" else planner.mean_action, plans[1])
+        for name in ["best_traj", "cov_action", "scale_tril", "beta", "eta", "ess", "weighted_cost"]:
+            value, expected = getattr(planner, name), states[1][name]
+            assert torch.equal(value, expected) if torch.is_tensor(expected) else value == expected, name
+        if cfg.get("mppi_mode") != "simple":
+            assert not torch.equal(states[1]["cov_action"], states[-1]["cov_action"])
+            assert not torch.equal(states[1]["best_traj"], states[-1]["best_traj"])
+
+
+def test_adaptive_samples_follow_the_effective_sample_size():
+    rows, scale = [], [0.0]
+
+    def dynamics(state, u, t=None):
+        rows.append(u.shape[0])
+        return point_mass(state, u)
+
+    planner = MPPIPlanner(
+        make_config(adaptive_samples=True, min_samples=8, ess_min=3.0, ess_max=5.0, samples_growth=1.5),
+        2,
+        dynamics,
+        lambda s: scale[0] * torch.sum((s - 1) ** 2, dim=1),
+    )
+
+    def command():
+        rows.clear()
+        K_active = planner.K_active
+        planner.command(torch.zeros(2))
+        # Only the active samples are rolled out, the zero-noise sample is one of them
+        assert rows == [K_active] * 12
+        assert planner.active_idx.shape[0] == planner.K_active and planner.active_idx[-1] == 31
+        assert 8 <= planner.K_active <= 32
+        return planner.K_active
+
+    # Equal costs weigh all samples the same, far more effective samples than needed
+    assert [command() for _ in range(5)] == [21, 14, 9, 8, 8]
+    # A steep cost leaves a single effective sample
+    scale[0] = 1e4
+    assert [command() for _ in range(5)] == [12, 18, 27, 32, 32]
+
+
+def test_chunked_rollouts_match_full_rollouts():
+    results = []
+    for chunk_size in [None, 7]:
+        planner = MPPIPlanner(
+            make_config(chunk_size=chunk_size), 2, point_mass, lambda s: torch.sum((s - 1) ** 2, dim=1)
+        )
+        state = torch.zeros(2)
+        for _ in range(4):
+            state = state + 0.1 * planner.command(state)
+        results.append((state, planner.cov_action, planner.beta))
+
+    for full, chunked in zip(*results):
+        assert torch.allclose(full, chunked, atol=1e-5)
+
+
+def test_sharded_rollouts_match_single_process_rollouts():
+    planner = MPPIPlanner(make_config(), 2, point_mass, PointMassModel(0, 32).running_cost)
+    engine = ShardedRollout(PointMassModel, num_workers=3, num_samples=32, horizon=12, nx=2, nu=2)
+    try:
+        sharded = MPPIPlanner(make_config(), 2, None, None, rollout_engine=engine)
+        state = torch.zeros(2)
+        for _ in range(3):
+            action = planner.command(state)
+            assert torch.allclose(action, sharded.command(state))
+            assert torch.allclose(planner.states, sharded.states)
+            state = state + 0.1 * action
+    finally:
+        engine.close()
+
+
+def test_profiler_collects_phase_stats_and_chrome_trace(tmp_path):
+    planner = MPPIPlanner(make_config(), 2, point_mass, lambda s: torch.sum((s - 1) ** 2, dim=1))
+    planner.command(torch.zeros(2))
+    assert planner.stats() == {}
+
+    planner = MPPIPlanner(make_config(profile=True), 2, point_mass, lambda s: torch.sum((s - 1) ** 2, dim=1))
+    for _ in range(3):
+        planner.command(torch.zeros(2))
+
+    stats = planner.stats()
+    assert stats["command"]["count"] == 3
+    assert stats["dynamics"]["count"] == 3 * 12
+    assert stats["rollout"]["p50_ms"] <= stats["rollout"]["p99_ms"] <= stats["command"]["max_ms"]
+
+    path = tmp_path / "trace.json"
+    planner.profiler.export_chrome_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert {"command", "sample", "rollout", "update_distribution", "filter"} <= {e["name"] for e in events}
+
+
+def test_seeded_planners_are_independent_and_replayable():
+    def run(planner, steps=3):
+        state, actions = torch.zeros(2), []
+        for _ in range(steps):
+            actions.append(planner.command(state))
+            state = state + 0.1 * actions[-1]
+        return torch.stack(actions)
+
+    for mode in ["simple", "halton-spline"]:
+        cfg = dict(mppi_mode=mode, sampling_method="random", lambda_=0.1, seed=3)
+        cost = lambda s: torch.sum((s - 1) ** 2, dim=1)
+        a = MPPIPlanner(make_config(**cfg), 2, point_mass, cost)
+        b = MPPIPlanner(make_config(**cfg), 2, point_mass, cost)
+
+        # Drawing from the global RNG or another planner does not change the samples
+        first = run(a)
+        torch.randn(100)
+        assert torch.equal(first, run(b))
+
+        snapshot = a.get_state()
+        replay = run(a)
+        a.set_state(snapshot)
+        assert torch.equal(replay, run(a))
+
+
+def test_reduced_precision_rollouts_accumulate_in_float32():
+    cost = lambda s: torch.sum((s - 1) ** 2, dim=1)
+
+    for cfg in [dict(mppi_mode="simple", sampling_method="random", lambda_=0.1), dict(), dict(chunk_size=10)]:
+        plans = {}
+        for precision in ["float32", "bfloat16", "float16"]:
+            planner = MPPIPlanner(make_config(precision=precision, **cfg), 2, point_mass, cost)
+            state, actions = torch.zeros(2), []
+            for _ in range(5):
+                actions.append(planner.command(state))
+                state = state + 0.1 * actions[-1]
+            plans[precision] = torch.stack(actions)
+
+            assert planner.workspace.actions.dtype == planner.workspace.costs.dtype == getattr(torch, precision)
+            assert planner.cost_total.dtype == plans[precision].dtype == torch.float32
+
+        assert torch.allclose(plans["bfloat16"], plans["float32"], atol=1e-2)
+        assert torch.allclose(plans["float16"], plans["float32"], atol=1e-3)
+
+
+def test_pruned_rollouts_simulate_fewer_steps_and_rank_pruned_samples_last():
+    cost = lambda s: torch.sum((s - 1) ** 2, dim=1)
+    planner = MPPIPlanner(make_config(prune_segment=3, update_cov=False), 2, point_mass, cost)
+    state = torch.zeros(2)
+    for _ in range(8):
+        state = state + 0.1 * planner.command(state)
+
+    # 32 samples for 3 steps, then 17, 9 and 5 of them
+    assert planner.rollout_steps == 3 * (32 + 17 + 9 + 5)
+    survived = planner.pruner.pruned_at == 12
+    assert survived[-1], "the null action is never pruned"
+    assert torch.isfinite(planner.total_costs).all()
+    assert planner.total_costs[~survived].min() >= planner.total_costs[survived][:-1].max()
+
+    # Sharded workers prune among their own samples
+    engine = ShardedRollout(PointMassModel, num_workers=2, num_samples=32, horizon=12, nx=2, nu=2)
+    try:
+        sharded = MPPIPlanner(make_config(prune_segment=3, update_cov=False), 2, None, None, rollout_engine=engine)
+        sharded_state = torch.zeros(2)
+        for _ in range(8):
+            sharded_state = sharded_state + 0.1 * sharded.command(sharded_state)
+        # The second shard holds the null action
+        assert sharded.rollout_steps == 3 * (16 + 8 + 4 + 2) + 3 * (16 + 9 + 5 + 3)
+        assert torch.allclose(sharded_state, state, atol=0.1)
+    finally:
+        engine.close()
+
+
+class WallModel(PointMassModel):
+    # Rollouts that cross x = 0.5 terminate
+    def running_cost(self, state):
+        return torch.sum((state - 1) ** 2, dim=1), state[:, 0] > 0.5
+
+
+def test_terminated_rollouts_freeze_cost_and_zero_commands():
+    state = torch.tensor([0.45, 0.0])
+    planner = MPPIPlanner(make_config(termination_penalty=10.0), 2, point_mass, WallModel(0, 32).running_cost)
+    action = planner.command(state)
+
+    terminated_at = planner.terminated_at
+    costs = planner.workspace.costs
+    terminated = terminated_at < 12
+    assert terminated.any() and not terminated.all()
+    for k in torch.nonzero(terminated).flatten().tolist():
+        t = terminated_at[k]
+        assert planner.states[k, t, 0] > 0.5 and (planner.states[k, :t, 0] <= 0.5).all()
+        frozen = torch.sum((planner.states[k, t] - 1) ** 2) + 10.0
+        assert torch.allclose(costs[k, t:], frozen.expand(12 - t))
+        assert (planner.actions[k, t + 1:] == 0).all()
+
+    # Pruned rollouts stop simulating terminated samples but score them the same
+    pruned = MPPIPlanner(make_config(termination_penalty=10.0, prune_segment=100), 2, point_mass, WallModel(0, 32).running_cost)
+    assert torch.allclose(pruned.command(state), action)
+    assert torch.equal(pruned.terminated_at, terminated_at)
+    assert pruned.rollout_steps == int(torch.sum(torch.clamp(terminated_at + 1, max=12)))
+
+    # Sharded rollouts terminate the same samples
+    engine = ShardedRollout(WallModel, num_workers=2, num_samples=32, horizon=12, nx=2, nu=2)
+    try:
+        sharded = MPPIPlanner(make_config(termination_penalty=10.0), 2, None, None, rollout_engine=engine)
+        assert torch.allclose(sharded.command(state), action)
+        assert torch.equal(sharded.terminated_at, terminated_at)
+    finally:
+        engine.close()
@@ -0,0 +1,250 @@
+import pytest
+import torch
+from scipy import signal
+
+from mppiisaac.planner.mppi import bspline
+from mppiisaac.utils.mppi_utils import bspline_basis_matrix, bspline_batch, SavGolFilter
+
+
+@pytest.mark.parametrize("horizon, n_knots, degree", [(20, 10, 1), (30, 15, 1), (12, 6, 2), (30, 7, 3)])
+def test_bspline_batch_matches_scipy(horizon, n_knots, degree):
+    torch.manual_seed(0)
+    knots = torch.randn(8, 3, n_knots, dtype=torch.float64)
+
+    samples = bspline_batch(knots, n=horizon, degree=degree)
+
+    assert samples.shape == (8, 3, horizon)
+    for i in range(knots.shape[0]):
+        for j in range(knots.shape[1]):
+            expected = bspline(knots[i, j], n=horizon, degree=degree, s=0)
+            assert torch.allclose(samples[i, j], expected, atol=1e-9)
+
+
+def test_bspline_basis_matrix_is_cached():
+    a = bspline_basis_matrix(20, 10, 1)
+    b = bspline_basis_matrix(20, 10, 1)
+    assert a is b
+    # Interpolating splines reproduce constants
+    assert torch.allclose(a.sum(dim=1), torch.ones(20))
+
+
+def test_noise_bank_regenerates_stale_bank(tmp_path):
+    import json
+    import numpy as np
+    from mppiisaac.utils.noise_bank import NoiseBankCache, NoiseBankKey
+
+    key = NoiseBankKey(10, 12, 2, 2, 1, 0, str(torch.float32))
+    bank = NoiseBankCache(cache_dir=str(tmp_path)).get(key, lambda: torch.randn(10, 12, 2))
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".json", ".npy"]
+
+    # A fresh cache loads the stored bank instead of regenerating it
+    loaded = NoiseBankCache(cache_dir=str(tmp_path)).get(key, lambda: torch.zeros(10, 12, 2))
+    assert torch.equal(bank, loaded)
+
+    # A sidecar that does not describe the key invalidates the stored bank
+    meta_file = next(tmp_path.glob("*.json"))
+    meta = json.loads(meta_file.read_text())
+    meta_file.write_text(json.dumps({**meta, "shape": [10, 12, 3]}))
+    regenerated = NoiseBankCache(cache_dir=str(tmp_path)).get(key, lambda: torch.zeros(10, 12, 2))
+    assert torch.equal(regenerated, torch.zeros(10, 12, 2))
+    new_meta = json.loads(meta_file.read_text())
+    assert new_meta["shape"] == meta["shape"] and new_meta["sha256"] != meta["sha256"]
+
+    # Contents corrupted in place with the same shape do not match the digest of the sidecar
+    stored = np.load(next(tmp_path.glob("*.npy")), mmap_mode="r+")
+    stored[3, 4, 1] = 7.0
+    stored.flush()
+    del stored
+    regenerated = NoiseBankCache(cache_dir=str(tmp_path)).get(key, lambda: torch.ones(10, 12, 2))
+    assert torch.equal(regenerated, torch.ones(10, 12, 2))
+    assert torch.equal(NoiseBankCache(cache_dir=str(tmp_path)).get(key, lambda: torch.zeros(10, 12, 2)), regenerated)
+
+
+@pytest.mark.parametrize("window, order", [(9, 2), (5, 3), (7, 1)])
+def test_savgol_filter_matches_scipy(window, order):
+    torch.manual_seed(0)
+    u = torch.randn(3, 20, 4, dtype=torch.float64)
+    sgf = SavGolFilter(window, order, dtype=torch.float64)
+
+    expected = torch.from_numpy(signal.savgol_filter(u.numpy(), window, order, axis=-2, mode="interp"))
+
+    assert torch.allclose(sgf(u), expected, atol=1e-10)
+    assert torch.allclose(sgf(u[0]), expected[0], atol=1e-10)
+
+
+def test_compiled_update_matches_eager_update():
+    from mppiisaac.utils.mppi_utils import compile_fn, mppi_update, step_discounts
+
+    torch.manual_seed(0)
+    compiled = compile_fn(mppi_update)
+    discounts = step_discounts(0.95, 12)
+    mean_action, cov_action, beta = torch.zeros(12, 2), torch.ones(2), torch.tensor(1.0)
+
+    # Changing numbers of samples, as with adaptive samples or chunks
+    for K in [32, 20, 27]:
+        costs, actions = torch.rand(K, 12), torch.randn(K, 12, 2)
+        # The update scans the costs in place
+        expected = mppi_update(costs.clone(), actions, mean_action, cov_action, beta, discounts, update_cov=True)
+        result = compiled(costs.clone(), actions, mean_action, cov_action, beta, discounts, update_cov=True)
+        for name, value in expected.items():
+            assert torch.allclose(result[name], value, atol=1e-5), name
+
+    # Errors of the function itself are not swallowed
+    with pytest.raises(RuntimeError):
+        compiled(torch.rand(8, 12), torch.randn(8, 11, 2), mean_action, cov_action, beta, discounts)
+    with pytest.raises(RuntimeError):
+        compile_fn(mppi_update)(torch.rand(8, 12), torch.randn(8, 11, 2), mean_action, cov_action, beta, discounts)
+
+
+def test_first_primes_matches_trial_division():
+    from mppiisaac.utils.low_discrepancy import first_primes
+
+    primes = [n for n in range(2, 600) if all(n % d for d in range(2, int(n ** 0.5) + 1))]
+    assert first_primes(len(primes)) == primes
+
+
+@pytest.mark.parametrize("sequence", ["halton", "sobol"])
+@pytest.mark.parametrize("scramble", [False, True])
+def test_low_discrepancy_sequences_are_stratified_and_skippable(sequence, scramble):
+    from scipy.stats import qmc
+    from mppiisaac.utils.low_discrepancy import ScrambledHalton, ScrambledSobol
+
+    cls = ScrambledHalton if sequence == "halton" else ScrambledSobol
+    seq = cls(4, scramble=scramble, seed=1, dtype=torch.float64)
+    points = seq.draw(256)
+
+    # Blocks drawn after skipping continue the same sequence
+    seq.reset().fast_forward(100)
+    assert torch.equal(seq.draw(50), points[100:150])
+
+    assert ((points >= 0) & (points < 1)).all()
+    if sequence == "sobol":
+        # 2^8 points fill every interval of width 1/256 exactly once in every dimension
+        counts = torch.stack([torch.bincount((points[:, d] * 256).long(), minlength=256) for d in range(4)])
+        assert (counts == 1).all()
+    else:
+        # b^k points fill every interval of width 1/b^k exactly once in dimension base b
+        for d, n in enumerate([256, 243, 125, 49]):
+            counts = torch.bincount((points[:n, d] * n + 1e-9).long(), minlength=n)
+            assert (counts == 1).all()
+
+    # Much lower discrepancy than pseudo-random points
+    random = torch.rand(256, 4, generator=torch.Generator().manual_seed(0), dtype=torch.float64)
+    assert qmc.discrepancy(points.numpy()) < 0.5 * qmc.discrepancy(random.numpy())
+
+
+def test_scrambled_sequences_depend_on_seed():
+    from mppiisaac.utils.low_discrepancy import ScrambledHalton, ScrambledSobol
+
+    for cls in [ScrambledHalton, ScrambledSobol]:
+        assert not torch.equal(cls(6, seed=0).draw(64), cls(6, seed=1).draw(64))
+        gaussian = cls(6, seed=0).draw_gaussian(4096)
+        assert torch.isfinite(gaussian).all()
+        assert torch.allclose(gaussian.mean(dim=0), torch.zeros(6), atol=0.05)
+        assert torch.allclose(gaussian.std(dim=0), torch.ones(6), atol=0.05)
+
+
+def test_ghalton_samples_do_not_fall_back_without_ghalton(monkeypatch):
+    import mppiisaac.utils.mppi_utils as mppi_utils
+
+    monkeypatch.setattr(mppi_utils, "ghalton", None)
+    with pytest.raises(ImportError):
+        mppi_utils.generate_gaussian_halton_samples(16, 4, use_ghalton=True)
+    assert mppi_utils.generate_gaussian_halton_samples(16, 4, use_ghalton=False).shape == (16, 4)
+
+
+def reference_cost_to_go(costs, discounts):
+    expected = costs.double().clone()
+    for t in range(costs.shape[-1] - 2, -1, -1):
+        expected[..., t] += float(discounts[t]) * expected[..., t + 1]
+    return expected
+
+
+@pytest.mark.parametrize("horizon", [12, 400])
+def test_discounted_cost_to_go_is_exact_for_long_horizons(horizon):
+    from mppiisaac.utils.mppi_utils import discount_sequence, discounted_cost_to_go_, step_discounts
+
+    torch.manual_seed(0)
+    costs = torch.rand(16, horizon, dtype=torch.float64) - 0.2
+    discounts = step_discounts((0.9 + 0.1 * torch.rand(horizon - 1)).tolist(), horizon, dtype=torch.float64)
+    expected = reference_cost_to_go(costs, discounts)
+
+    result = costs.clone()
+    assert discounted_cost_to_go_(result, discounts) is result
+    assert torch.allclose(result, expected, rtol=1e-12)
+    # The first step is the discounted sum with the cumulative discounts
+    gamma_seq = discount_sequence(discounts.tolist(), horizon, dtype=torch.float64)
+    assert torch.allclose(result[:, 0], costs @ gamma_seq[0], rtol=1e-12)
+
+    # Single precision keeps the tail of the horizon
+    costs32 = costs.float()
+    discounted_cost_to_go_(costs32, step_discounts(discounts.tolist(), horizon))
+    assert torch.allclose(costs32.double(), expected, rtol=1e-4, atol=1e-5)
+
+
+def test_discounted_cost_to_go_after_zero_discounts_and_underflow():
+    from mppiisaac.utils.mppi_utils import discounted_cost_to_go_, step_discounts
+
+    # Every step follows the recurrence, also the steps after a zero discount
+    discounts = step_discounts([0.5, 0.0, 0.5, 0.5, 0.5], 6, dtype=torch.float64)
+    result = discounted_cost_to_go_(torch.ones(2, 6, dtype=torch.float64), discounts)
+    assert torch.equal(result, torch.tensor([[1.5, 1.0, 1.875, 1.75, 1.5, 1.0]] * 2, dtype=torch.float64))
+
+    costs = torch.rand(4, 6, dtype=torch.float64)
+    assert torch.allclose(discounted_cost_to_go_(costs.clone(), discounts), reference_cost_to_go(costs, discounts))
+
+    # 0.9^T underflows single precision long before T = 1000, the tail still sums to about 1 / (1 - 0.9)
+    result = discounted_cost_to_go_(torch.ones(3, 1000), 0.9)
+    expected = reference_cost_to_go(torch.ones(3, 1000), [0.9] * 999)
+    assert torch.allclose(result.double(), expected, rtol=1e-5)
+    assert torch.allclose(result[:, :880], torch.full((3, 880), 10.0), rtol=1e-5)
+
+    # Scalar and per-step discounts give the same scan
+    costs = torch.rand(4, 50)
+    assert torch.allclose(
+        discounted_cost_to_go_(costs.clone(), 0.9), discounted_cost_to_go_(costs.clone(), step_discounts(0.9, 50))
+    )
+
+
+@pytest.mark.parametrize("lower, upper", [([-2.0, -2.0], [2.0, 2.0]), ([-2.0, -2.0, -1.0], [2.0, 2.0, 1.0])])
+def test_signed_distance_grid_rebuilds_incrementally(lower, upper):
+    from mppiisaac.planner.sim_backend import ActorWrapper
+    from mppiisaac.utils.sdf_grid import SignedDistanceGrid
+
+    actors = [
+        ActorWrapper(type="robot", name="robot"),
+        ActorWrapper(type="sphere", name="sphere", init_pos=[-1.0, 0.5, 0.0], size=[0.3]),
+        ActorWrapper(type="box", name="box", init_pos=[0.8, -0.5, 0.0], init_ori=[0, 0, 0.3826834, 0.9238795], size=[0.6, 0.4, 0.5]),
+    ]
+    sdf = SignedDistanceGrid(lower, upper, 0.05)
+    sdf.add_actors(actors)
+    sdf.set_obstacle("pillar", "sphere", [0.0, 1.2, 0.0], [0.2])
+    assert len(sdf) == 3
+
+    torch.manual_seed(0)
+    points = torch.rand(2000, 3) * 3.6 - 1.8
+    points[:, 2] *= 0.5
+    slots = torch.arange(3)
+    exact = sdf._obstacle_distance(points[:, : sdf.ndim], slots).min(dim=1).values
+    assert torch.allclose(sdf.distance(points), exact, atol=0.05)
+    assert sdf.distance(points.view(40, 50, 3)).shape == (40, 50)
+
+    # Moving one obstacle only touches the grid points it affects and matches a grid built from scratch
+    full = sdf.evaluations
+    sdf.set_obstacle("box", "box", [0.6, -0.8, 0.0], [0.6, 0.4, 0.5], yaw=0.3)
+    sdf.set_obstacle("pillar", "sphere", [0.0, 1.2, 0.0], [0.2])
+    sdf.remove_obstacle("sphere")
+    sdf.update()
+    assert 0 < sdf.evaluations < full
+
+    fresh = SignedDistanceGrid(lower, upper, 0.05)
+    fresh.set_obstacle("pillar", "sphere", [0.0, 1.2, 0.0], [0.2])
+    fresh.set_obstacle("box", "box", [0.6, -0.8, 0.0], [0.6, 0.4, 0.5], yaw=0.3)
+    fresh.update()
+    assert torch.allclose(sdf.grid, fresh.grid, atol=1e-6)
+
+    # Nothing changed, nothing to rebuild
+    sdf.evaluations = 0
+    sdf.set_obstacle("pillar", "sphere", [0.0, 1.2, 0.0], [0.2])
+    sdf.update()
+    assert sdf.evaluations == 0
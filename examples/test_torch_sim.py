@@ -0,0 +1,243 @@
+from types import SimpleNamespace
+
+import torch
+
+from mppiisaac.planner.mppi import MPPIConfig
+from mppiisaac.planner.mppi_isaac import MPPIisaacPlanner
+from mppiisaac.planner.sim_backend import ActorWrapper, IsaacGymConfig, RobotDofLayout, SimBackend
+from mppiisaac.planner.torch_sim_wrapper import TorchSimWrapper
+
+
+class PointRobotObjective(object):
+    # Same cost as examples/point_robot.py
+    required_tensors = ["dof_state"]
+
+    def __init__(self, goal):
+        self.nav_goal = torch.tensor(goal)
+
+    def compute_cost(self, sim):
+        pos = torch.cat((sim.dof_state[:, 0].unsqueeze(1), sim.dof_state[:, 2].unsqueeze(1)), 1)
+        return torch.clamp(torch.linalg.norm(pos - self.nav_goal, axis=1) - 0.05, min=0, max=1999)
+
+
+def make_sim(num_envs=4, obstacles=()):
+    actors = [ActorWrapper(type="robot", name="point_robot", urdf_file="point_robot.urdf", fixed=True)]
+    actors += [ActorWrapper(**obst) for obst in obstacles]
+    return TorchSimWrapper(IsaacGymConfig(dt=0.05), actors, [[0.0, 0.0, 0.05]], num_envs)
+
+
+def test_torch_backend_implements_sim_backend():
+    sim = make_sim()
+    assert isinstance(sim, SimBackend)
+    assert sim.root_state.shape == (4, 1, 13)
+    assert sim.dof_state.shape == (4, 6)
+    assert sim.net_cf.shape == (4 * sim.num_bodies, 3)
+
+
+def test_torch_backend_contact_forces_push_robot_away_from_sphere():
+    sim = make_sim(obstacles=[dict(type="sphere", name="sphere0", size=[0.3], init_pos=[0.6, 0.0, 0.0], fixed=True)])
+    sim.reset_robot_state([0.0, 0.0, 0.0], [0.0, 0.0, 0.0])
+    assert (sim.net_cf == 0).all()
+
+    sim.apply_robot_cmd_velocity(torch.tensor([[2.0, 0.0, 0.0]]).repeat(4, 1))
+    sim.step()
+    sim.step()
+    net_cf = sim.net_cf.view(4, sim.num_bodies, 3)
+    # The robot sphere of radius 0.2 at x=0.2 penetrates the sphere at x=0.6 by 0.1
+    assert torch.allclose(net_cf[:, 0, 0], torch.full((4,), -100.0))
+    assert torch.allclose(net_cf[:, 1], -net_cf[:, 0])
+
+
+def make_point_robot_config(**mppi):
+    return SimpleNamespace(
+        mppi=MPPIConfig(
+            num_samples=100, horizon=15, device="cpu", lambda_=0.1, u_min=[-1.0], u_max=[1.0],
+            noise_sigma=[[1.0, 0, 0], [0, 1.0, 0], [0, 0, 0.1]], sample_null_action=True, **mppi,
+        ),
+        isaacgym=IsaacGymConfig(dt=0.05, backend="torch"),
+        actors=["point_robot"],
+        initial_actor_positions=[[0.0, 0.0, 0.05]],
+        nx=6,
+    )
+
+
+def test_point_robot_objective_runs_unchanged_on_torch_backend():
+    goal = [1.0, -0.5]
+    planner = MPPIisaacPlanner(make_point_robot_config(), PointRobotObjective(goal))
+    assert planner.sim.required_tensors == ["dof_state"]
+    model = planner.sim.robots[0][1]
+
+    state = model.initial_state([0.0, 0.0, 0.0])
+    for _ in range(50):
+        action = planner.compute_action(state[0::2], state[1::2])
+        state, _ = model(state.unsqueeze(0), action.unsqueeze(0))
+        state = state[0]
+    assert torch.linalg.norm(state[[0, 2]] - torch.tensor(goal)) < 0.15
+
+
+def test_server_commands_restart_every_chunk_from_the_sent_state():
+    from mppiisaac.planner.mppi_isaac import bytes_to_torch, torch_to_bytes
+
+    goal = [1.0, -0.5]
+    planners = [MPPIisaacPlanner(make_point_robot_config(chunk_size=chunk_size), PointRobotObjective(goal)) for chunk_size in [None, 30]]
+    for planner in planners:
+        # An earlier local command must not leak into the server commands
+        planner.compute_action(torch.tensor([-1.0, 0.5, 0.0]), torch.zeros(3))
+
+    sent = planners[0].sim
+    dof_state = sent.dof_state.clone()
+    for x in [0.2, 0.4]:
+        dof_state[:, 0::2] = torch.tensor([x, 0.1, 0.0])
+        actions = []
+        for planner in planners:
+            planner.reset_rollout_sim(torch_to_bytes(dof_state), torch_to_bytes(sent.root_state), torch_to_bytes(sent.rigid_body_state))
+            actions.append(bytes_to_torch(planner.command()))
+            assert torch.equal(planner.start_dof_state, dof_state)
+        assert torch.allclose(actions[0], actions[1], atol=1e-5)
+
+
+def test_robot_dof_layout_matches_per_dof_command_mapping():
+    robots = [
+        (ActorWrapper(type="robot", name="arm"), 3),
+        (ActorWrapper(type="robot", name="base", differential_drive=True, wheel_radius=0.1, wheel_base=0.4, wheel_count=4), 6),
+        (ActorWrapper(type="robot", name="point"), 2),
+    ]
+    layout = RobotDofLayout(robots)
+    assert (layout.num_commands, layout.num_dofs) == (3 + 4 + 2, 11)
+
+    torch.manual_seed(0)
+    u = torch.randn(5, layout.num_commands)
+
+    # Per dof mapping as IsaacGymWrapper.apply_robot_cmd_velocity did it before the layout was compiled
+    expected = torch.zeros(5, layout.num_dofs)
+    u_idx, dof_idx = 0, 0
+    for actor, dof_count in robots:
+        for i in range(dof_count):
+            if actor.differential_drive and i >= dof_count - actor.wheel_count:
+                r, L = actor.wheel_radius, actor.wheel_base
+                left = u[:, u_idx] / r - L * u[:, u_idx + 1] / (2 * r)
+                right = u[:, u_idx] / r + L * u[:, u_idx + 1] / (2 * r)
+                expected[:, dof_idx : dof_idx + actor.wheel_count] = torch.stack((left, right), 1).repeat(1, 2)
+                u_idx += 2
+                dof_idx += actor.wheel_count
+                break
+            expected[:, dof_idx] = u[:, u_idx]
+            u_idx += 1
+            dof_idx += 1
+
+    out = torch.full((5, layout.num_dofs), float("nan"))
+    assert layout.velocity_targets(u, out=out) is out
+    assert torch.allclose(out, expected)
+
+    # Robot states hold the base pose instead of the wheels, which start at rest
+    q, qdot = list(range(10)), [-float(i) for i in range(10)]
+    dof_state = torch.full((5, 2 * layout.num_dofs), float("nan"))
+    base_q, base_qdot = layout.reset_state(q, qdot, out=dof_state)
+    assert torch.equal(base_q, torch.tensor([[3.0, 4.0, 5.0]])) and torch.equal(base_qdot, -base_q)
+    positions = torch.tensor([0, 1, 2, 6, 7, 0, 0, 0, 0, 8, 9], dtype=torch.float32)
+    assert torch.equal(dof_state[:, 0::2], positions.expand(5, -1))
+    assert torch.equal(dof_state[:, 1::2], -positions.expand(5, -1))
+
+
+def test_obstacle_updates_broadcast_into_all_envs_by_name():
+    sim = make_sim(obstacles=[dict(type="sphere", name="sphere0", size=[0.3], init_pos=[2.0, 0.0, 0.0], fixed=True)])
+    assert sim.actor_index_by_name == {"point_robot": 0, "sphere0": 1}
+
+    obstacles = {
+        "a": {"position": [1.0, 2.0, 0.0], "velocity": [0.0, 0.0, 0.0], "size": [0.3]},
+        "b": {"position": [-1.0, 0.5, 0.0], "velocity": [0.1, 0.0, 0.0], "size": [0.2]},
+    }
+    sim.update_root_state_tensor_by_obstacles(obstacles)
+    assert sim.actor_index_by_name["sphere1"] == 2
+    assert torch.equal(sim.root_state[:, 1, :3], torch.tensor([[1.0, 2.0, 0.0]]).expand(4, -1))
+    assert torch.equal(sim.root_state[:, 2, :3], torch.tensor([[-1.0, 0.5, 0.0]]).expand(4, -1))
+    assert torch.allclose(sim.root_state[:, 2, 7], torch.full((4,), 0.1))
+
+    states = torch.zeros(2, 13)
+    states[:, 6] = 1.0
+    states[:, 0] = torch.tensor([3.0, 4.0])
+    sim.set_actor_root_states(states, [2, 1])
+    assert torch.equal(sim.root_state[:, [2, 1], 0], torch.tensor([[3.0, 4.0]]).expand(4, -1))
+    # Rigid bodies follow their root
+    assert torch.equal(sim.rigid_body_state[:, 1, 0], torch.full((4,), 4.0))
+
+
+def test_obstacle_pool_serves_new_and_resized_obstacles_without_restart():
+    cfg = IsaacGymConfig(dt=0.05, obstacle_pool_slots=1, obstacle_pool_sphere_radii=[0.1, 0.3], obstacle_pool_box_sizes=[])
+    actors = [ActorWrapper(type="robot", name="point_robot", urdf_file="point_robot.urdf", fixed=True)]
+    sim = TorchSimWrapper(cfg, actors, [[0.0, 0.0, 0.05]], 4)
+    assert sim.obstacle_positions.shape == (4, 0, 3)
+
+    def update(**sizes):
+        obstacles = {
+            name: {"position": [float(i), 1.0, 0.0], "velocity": [0.0, 0.0, 0.0], "size": size}
+            for i, (name, size) in enumerate(sizes.items())
+        }
+        root_state = sim.root_state
+        sim.update_root_state_tensor_by_obstacles(obstacles)
+        return sim.root_state is not root_state
+
+    # Served by the closest slot within tolerance
+    assert not update(a=[0.28])
+    sphere0 = sim.actor_index_by_name["sphere0"]
+    assert sim.env_cfg[sphere0].size == [0.3]
+    assert torch.equal(sim.obstacle_positions[:, :, :2], torch.tensor([[[0.0, 1.0]]]).expand(4, -1, -1))
+
+    # Resizing moves the obstacle to another slot and parks the old one, which serves the next obstacle
+    assert not update(a=[0.1])
+    assert sim.actor_index_by_name["sphere0"] != sphere0
+    assert sim.root_state[0, sphere0, 2] == -10.0
+    assert not update(a=[0.1], b=[0.3])
+    assert sim.actor_index_by_name["sphere1"] == sphere0
+    assert sim.obstacle_positions.shape == (4, 2, 3)
+    assert not update(a=[0.1], b=[0.3])
+
+    # Only an exhausted pool restarts the simulator
+    assert update(a=[0.1], b=[0.3], c=[1.0])
+    assert sim.obstacle_pool.stats() == {"served": 3, "released": 1, "exhausted": 1, "slots": 2, "free": 0}
+    assert sim.env_cfg[sim.actor_index_by_name["sphere2"]].size == [1.0]
+    assert torch.equal(sim.root_state[0, sim.actor_index_by_name["sphere2"], :2], torch.tensor([2.0, 1.0]))
+
+
+def test_derived_state_tensors_refresh_on_demand():
+    sim = make_sim(obstacles=[dict(type="sphere", name="sphere0", size=[0.3], init_pos=[0.6, 0.0, 0.0], fixed=True)])
+    refreshes = []
+    refresh = sim._refresh
+    sim._refresh = lambda: (refreshes.append(1), refresh())
+
+    sim.apply_robot_cmd_velocity(torch.tensor([[2.0, 0.0, 0.0]]).repeat(4, 1))
+    sim.step()
+    sim.step()
+    assert sim.dof_state[0, 0] > 0 and not refreshes
+
+    # The contact forces of the last step, computed once on their first access
+    assert torch.allclose(sim.net_cf.view(4, sim.num_bodies, 3)[:, 0, 0], torch.full((4,), -100.0))
+    assert torch.equal(sim.rigid_body_state[:, 0, 0], sim.dof_state[:, 0])
+    assert len(refreshes) == 1
+
+    # Required tensors are refreshed by every step
+    sim.require_tensors(["net_cf"])
+    sim.step()
+    assert len(refreshes) == 2
+    sim.net_cf
+    assert len(refreshes) == 2
+
+
+def test_written_state_tensors_are_read_back_without_a_step():
+    sim = make_sim(obstacles=[dict(type="sphere", name="sphere0", size=[0.3], init_pos=[2.0, 0.0, 0.0], fixed=True)])
+    sim.apply_robot_cmd_velocity(torch.tensor([[1.0, 0.0, 0.0]]).repeat(4, 1))
+    sim.step()
+    assert (sim.net_cf == 0).all()
+
+    # Move the sphere onto the robot and the robot back to the origin, the derived tensors follow without a step
+    root_state = sim.root_state.clone()
+    root_state[:, 1, 0] = 0.4
+    dof_state = torch.zeros_like(sim.dof_state)
+    sim.set_root_state_tensor(root_state)
+    sim.set_dof_state_tensor(dof_state)
+
+    assert torch.equal(sim.root_state, root_state)
+    assert torch.equal(sim.dof_state, dof_state)
+    assert torch.equal(sim.rigid_body_state[:, 1], root_state[:, 1])
+    assert torch.equal(sim.rigid_body_state[:, 0, 0:2], torch.zeros(4, 2))
+    assert (sim.net_cf.view(4, sim.num_bodies, 3)[:, 0, 0] < 0).all()
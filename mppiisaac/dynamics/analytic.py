@@ -0,0 +1,196 @@
+import math
+import os
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence
+
+import torch
+
+import mppiisaac
+
+
+class AnalyticModel(ABC):
+    """
+    Batched pure torch model of a velocity controlled robot, usable as MPPIPlanner dynamics without a simulator.
+
+    Calling the model maps K x nx states and K x nu commands to the next states and the commands actually applied,
+    the signature MPPIPlanner expects from dynamics(state, u, t). States interleave positions and velocities per
+    coordinate like the dof state tensor of IsaacGym, state_layout names the columns and index() looks them up, so
+    objectives can read e.g. state[:, model.index('x', 'y')].
+    """
+
+    state_layout: Sequence[str] = ()
+    nu: int = 0
+
+    def __init__(self, dt: float = 0.05):
+        self.dt = dt
+
+    @property
+    def nx(self):
+        return len(self.state_layout)
+
+    def index(self, *names: str) -> List[int]:
+        return [self.state_layout.index(name) for name in names]
+
+    def initial_state(self, q, qdot=None, device="cpu", dtype=torch.float32):
+        """
+            nx state from positions and velocities ordered like the coordinates of state_layout
+        """
+        q = torch.as_tensor(q, device=device, dtype=dtype)
+        qdot = torch.zeros_like(q) if qdot is None else torch.as_tensor(qdot, device=device, dtype=dtype)
+        return torch.stack((q, qdot), dim=-1).reshape(-1)
+
+    @abstractmethod
+    def dynamics(self, state, u, t=None):
+        """
+            Next K x nx states and the K x nu commands actually applied
+        """
+
+    def __call__(self, state, u, t=None):
+        return self.dynamics(state, u, t)
+
+
+class JointIntegrator(AnalyticModel):
+    """
+    Velocity controlled joints, q <- q + dt * qdot with qdot the commanded velocity. Optional velocity and position
+    limits clamp the command and the position. Models the arms (panda) and the x, y, theta joints of the planar
+    bases (point_robot, heijn, omnipanda) in conf/actors.
+    """
+
+    def __init__(
+        self,
+        dof: int,
+        dt: float = 0.05,
+        q_min: Optional[List[float]] = None,
+        q_max: Optional[List[float]] = None,
+        qdot_max: Optional[List[float]] = None,
+        joint_names: Optional[List[str]] = None,
+        joint_types: Optional[List[str]] = None,
+    ):
+        super().__init__(dt)
+        self.nu = dof
+        joint_names = joint_names or [f"q{i}" for i in range(dof)]
+        assert len(joint_names) == dof
+        self.joint_types = joint_types or ["revolute"] * dof
+        self.state_layout = tuple(n for name in joint_names for n in (name, f"{name}_dot"))
+        self.q_min = torch.tensor(q_min) if q_min is not None else None
+        self.q_max = torch.tensor(q_max) if q_max is not None else None
+        self.qdot_max = torch.tensor(qdot_max) if qdot_max is not None else None
+
+    def dynamics(self, state, u, t=None):
+        if self.qdot_max is not None:
+            qdot_max = self.qdot_max.to(u.device)
+            u = torch.max(torch.min(u, qdot_max), -qdot_max)
+        q = state[:, 0::2] + self.dt * u
+        if self.q_min is not None:
+            q = torch.max(torch.min(q, self.q_max.to(q.device)), self.q_min.to(q.device))
+        return torch.stack((q, u), dim=2).reshape(state.shape), u
+
+
+class PointRobot(JointIntegrator):
+    """
+    Holonomic point robot of conf/actors/point_robot.yaml, world frame velocities of its x, y and theta joints
+    """
+
+    def __init__(self, dt: float = 0.05):
+        super().__init__(3, dt, joint_names=["x", "y", "theta"], joint_types=["prismatic", "prismatic", "revolute"])
+
+
+class OmniBase(AnalyticModel):
+    """
+    Omnidirectional base commanded with body frame velocities (v_x, v_y, omega), integrated into the world frame pose
+    x, y, theta at the mid-step heading
+    """
+
+    state_layout = ("x", "x_dot", "y", "y_dot", "theta", "theta_dot")
+    nu = 3
+
+    def dynamics(self, state, u, t=None):
+        theta = state[:, 4] + 0.5 * self.dt * u[:, 2]
+        cos, sin = torch.cos(theta), torch.sin(theta)
+        x_dot = cos * u[:, 0] - sin * u[:, 1]
+        y_dot = sin * u[:, 0] + cos * u[:, 1]
+        velocity = torch.stack((x_dot, y_dot, u[:, 2]), dim=1)
+        q = state[:, 0::2] + self.dt * velocity
+        return torch.stack((q, velocity), dim=2).reshape(state.shape), u
+
+
+class DifferentialDrive(AnalyticModel):
+    """
+    Differential drive base commanded with (v, omega) like IsaacGymWrapper: the command is mapped to wheel velocities
+    with the same wheel_radius / wheel_base inverse kinematics as RobotDofLayout, optionally clamped to
+    max_wheel_velocity, and the base moves with the velocities the wheels realize. The pose x, y, theta is integrated
+    at the mid-step heading.
+    """
+
+    state_layout = ("x", "x_dot", "y", "y_dot", "theta", "theta_dot")
+    nu = 2
+
+    def __init__(
+        self,
+        wheel_radius: float,
+        wheel_base: float,
+        wheel_count: int = 2,
+        dt: float = 0.05,
+        max_wheel_velocity: Optional[float] = None,
+    ):
+        super().__init__(dt)
+        self.wheel_radius = wheel_radius
+        self.wheel_base = wheel_base
+        self.wheel_count = wheel_count
+        self.max_wheel_velocity = max_wheel_velocity
+
+    @classmethod
+    def from_actor(cls, actor, dt: float = 0.05, max_wheel_velocity: Optional[float] = None):
+        """
+            Model of an actor config (ActorWrapper or the dict of a conf/actors yaml) with differential_drive
+        """
+        get = actor.get if isinstance(actor, dict) else lambda key: getattr(actor, key)
+        return cls(get("wheel_radius"), get("wheel_base"), int(get("wheel_count")), dt, max_wheel_velocity)
+
+    def wheel_velocities(self, u):
+        """
+            Left and right wheel velocities, repeated for every wheel set, same as RobotDofLayout
+        """
+        r, L = self.wheel_radius, self.wheel_base
+        left = (u[:, 0] / r) - ((L * u[:, 1]) / (2 * r))
+        right = (u[:, 0] / r) + ((L * u[:, 1]) / (2 * r))
+        return torch.stack((left, right), dim=1).repeat(1, self.wheel_count // 2)
+
+    def dynamics(self, state, u, t=None):
+        wheels = self.wheel_velocities(u)[:, :2]
+        if self.max_wheel_velocity is not None:
+            wheels = wheels.clamp(-self.max_wheel_velocity, self.max_wheel_velocity)
+        v = self.wheel_radius * (wheels[:, 0] + wheels[:, 1]) / 2
+        omega = self.wheel_radius * (wheels[:, 1] - wheels[:, 0]) / self.wheel_base
+        u = torch.stack((v, omega), dim=1)
+
+        theta = state[:, 4] + 0.5 * self.dt * omega
+        velocity = torch.stack((v * torch.cos(theta), v * torch.sin(theta), omega), dim=1)
+        q = state[:, 0::2] + self.dt * velocity
+        return torch.stack((q, velocity), dim=2).reshape(state.shape), u
+
+
+def model_for_actor(actor, dt: float = 0.05):
+    """
+        Analytic model of a robot actor config (ActorWrapper or the dict of a conf/actors yaml). Differential drive
+        actors get a DifferentialDrive, all others a JointIntegrator over the non fixed joints of their urdf, with the
+        urdf position and velocity limits, in the dof order of IsaacGym.
+    """
+    get = actor.get if isinstance(actor, dict) else lambda key: getattr(actor, key, None)
+    if get("differential_drive"):
+        return DifferentialDrive.from_actor(actor, dt)
+
+    urdf = f"{os.path.dirname(mppiisaac.__file__)}/../assets/urdf/{get('urdf_file')}"
+    names, types, q_min, q_max, qdot_max = [], [], [], [], []
+    for joint in ET.parse(urdf).getroot().findall("joint"):
+        if joint.get("type") == "fixed":
+            continue
+        limit = joint.find("limit")
+        unbounded = joint.get("type") == "continuous" or limit is None or limit.get("lower") is None
+        names.append(joint.get("name"))
+        types.append(joint.get("type"))
+        q_min.append(-math.inf if unbounded else float(limit.get("lower")))
+        q_max.append(math.inf if unbounded else float(limit.get("upper")))
+        qdot_max.append(math.inf if limit is None or limit.get("velocity") is None else float(limit.get("velocity")))
+    return JointIntegrator(len(names), dt, q_min, q_max, qdot_max, joint_names=names, joint_types=types)
@@ -0,0 +1,120 @@
+import torch
+from typing import Optional, Callable
+
+from mppiisaac.planner.mppi import MPPIPlanner, MPPIConfig
+
+
+class BatchedMPPIPlanner(MPPIPlanner):
+    """
+    MPPI for B independent problems sharing one configuration, solved together with batched ops.
+
+    All planner state gains a leading problem dimension: mean_action and best_traj are B x T x nu, cov_action
+    and scale_tril are B x nu and beta is B. Sampling, the rollout cost reduction and the weighted mean update run
+    for all problems at once, so a fleet of B robots costs one command() call instead of B.
+
+    The dynamics and running cost callbacks receive the B x K rollouts flattened problem major: rows b * K up to
+    (b + 1) * K belong to problem b. dynamics(state, u, t) gets (B * K) x nx states and (B * K) x nu actions and the
+    running cost returns B * K costs. A prior(state, t) returns B x nu actions, one per problem.
+
+    command() takes B x nx states (or B x K x nx to start every rollout from its own state) and returns the plans
+    of all problems. Only the 'halton-spline' mode is supported. In 'halton' sampling all problems share the same
+    noise bank, in 'random' sampling each problem draws its own noise.
+    """
+
+    def __init__(
+        self,
+        cfg: MPPIConfig,
+        nx: int,
+        dynamics: Callable,
+        running_cost: Callable,
+        num_problems: int,
+        prior: Optional[Callable] = None,
+        rollout_reset: Optional[Callable] = None,
+    ):
+        super().__init__(cfg, nx, dynamics, running_cost, prior, rollout_reset)
+        assert self.mppi_mode == 'halton-spline', "batched planning is only implemented for the 'halton-spline' mode"
+        assert not self.adaptive_samples, "adaptive samples are not supported by the batched planner"
+        assert not self.chunk_size, "chunked rollouts are not supported by the batched planner"
+        assert self.pruner is None, "rollout pruning is not supported by the batched planner"
+
+        self.B = num_problems
+
+        # Moments and best trajectory per problem
+        self.mean_action = torch.zeros((self.B, self.T, self.nu), **self.tensor_args)
+        self.best_traj = self.mean_action.clone()
+        self.cov_action = self.cov_action.to(**self.tensor_args).repeat(self.B, 1)
+        self.scale_tril = torch.sqrt(self.cov_action)
+        self.beta = self.beta.repeat(self.B)
+
+    def _shift_plan(self):
+        self.mean_action = torch.cat((self.mean_action[:, 1:], self.mean_action[:, -1:]), dim=1)
+
+    def _compute_total_cost_batch_halton(self):
+        """
+            Same as MPPIPlanner._compute_total_cost_batch_halton, the perturbed actions are B x K x T x nu
+        """
+        with self.profiler.span("sample"):
+            if self.sample_method == 'random':
+                self.delta = self.sample_noise((self.B, self.K, self.T))
+            elif self.delta == None and self.sample_method == 'halton':
+                self.delta = self.get_noise_bank()
+
+            # Add zero-noise seq so mean is always a part of samples
+            self.delta[..., -1, :, :] = self.Z_seq
+
+            act_seq = self._perturb_actions(
+                self.mean_action.unsqueeze(1),
+                self.delta,
+                self.scale_tril.view(self.B, 1, 1, self.nu),
+                self.u_min,
+                self.u_max,
+                squash_fn=self.squash_fn,
+            ).to(self.sample_args['dtype'])
+            act_seq[:, self.nu] = self.best_traj
+
+        self.perturbed_action = act_seq
+
+        self.cost_total, self.states, self.actions = self._compute_rollout_costs(self.perturbed_action)
+        self.actions /= self.u_scale
+        return self.cost_total
+
+    def _compute_rollout_costs(self, perturbed_actions):
+        """
+            Forward simulates all B x K perturbed action sequences and returns their B x K total costs,
+            B x K x T x nx states (None if states are not retained) and B x K x T x nu actions
+        """
+        B, K, T, nu = perturbed_actions.shape
+        assert nu == self.nu and B == self.B
+
+        if self.state.shape == (B, K, self.nx):
+            state = self.state.view(B * K, self.nx)
+        else:
+            state = self.state.view(B, self.nx).repeat_interleave(K, dim=0)
+
+        # Last and second to last rollout of every problem
+        first_idx = torch.arange(B, device=self.tensor_args['device']) * K
+        with self.profiler.span("rollout"):
+            cost_horizon, states, actions = self._rollout(
+                perturbed_actions.view(B * K, T, nu),
+                state,
+                null_idx=first_idx + K - 1 if self.sample_null_action else None,
+                prior_idx=first_idx + K - 2 if self.prior else None,
+            )
+
+        cost_total = self.workspace.cost_total
+        torch.sum(cost_horizon, dim=1, dtype=cost_total.dtype, out=cost_total)
+
+        if self.terminal_state_cost:
+            cost_total += self.terminal_state_cost(states, actions)
+
+        cost_total = cost_total.view(B, K)
+        cost_total += cost_total.mean(dim=1, keepdim=True)
+
+        actions = actions.view(B, K, T, nu)
+        if states is not None:
+            states = states.view(B, K, T, self.nx)
+
+        with self.profiler.span("update_distribution"):
+            self.noise = self._update_distribution(cost_horizon.view(B, K, T), actions)
+
+        return cost_total, states, actions
@@ -1,10 +1,9 @@
 from isaacgym import gymapi
 from isaacgym import gymtorch
-from dataclasses import dataclass, field
 import torch
 import numpy as np
-from enum import Enum
 from typing import List, Optional, Any
+from mppiisaac.planner.sim_backend import IsaacGymConfig, SupportedActorTypes, ActorWrapper, ObstaclePool, RobotDofLayout
 
 
 import pathlib
@@ -12,17 +11,6 @@ import pathlib
 file_path = pathlib.Path(__file__).parent.resolve()
 
 
-@dataclass
-class IsaacGymConfig(object):
-    dt: float = 0.05
-    substeps: int = 2
-    use_gpu_pipeline: bool = True
-    num_client_threads: int = 0
-    viewer: bool = False
-    num_obstacles: int = 10
-    spacing: float = 6.0
-
-
 def parse_isaacgym_config(cfg: IsaacGymConfig) -> gymapi.SimParams:
     sim_params = gymapi.SimParams()
     sim_params.dt = cfg.dt
@@ -44,42 +32,6 @@ def parse_isaacgym_config(cfg: IsaacGymConfig) -> gymapi.SimParams:
     return sim_params
 
 
-class SupportedActorTypes(Enum):
-    Axis = 1
-    Robot = 2
-    Sphere = 3
-    Box = 4
-
-
-@dataclass
-class ActorWrapper:
-    type: SupportedActorTypes
-    name: str
-    init_pos: List[float] = field(default_factory=lambda: [0, 0, 0])
-    init_ori: List[float] = field(default_factory=lambda: [0, 0, 0, 1])
-    size: List[float] = field(default_factory=lambda: [0.1, 0.1, 0.1])
-    mass: float = 1.0  # kg
-    color: List[float] = field(default_factory=lambda: [1.0, 1.0, 1.0])
-    fixed: bool = False
-    collision: bool = True
-    friction: float = 1.
-    handle: Optional[int] = None
-    flip_visual: bool = False
-    urdf_file: str = None
-    ee_link: str = None
-    gravity: bool = True
-    differential_drive: bool = False
-    wheel_radius: Optional[float] = None
-    wheel_base: Optional[float] = None
-    wheel_count: Optional[float] = None
-    left_wheel_joints: Optional[List[int]] = None
-    right_wheel_joints: Optional[List[int]] = None
-    caster_links: Optional[List[str]] = None
-    noise_sigma_size: Optional[List[float]] = None
-    noise_percentage_mass: float = 0.0
-    noise_percentage_friction: float = 0.0
-
-
 class IsaacGymWrapper:
     def __init__(
         self,
@@ -103,6 +55,12 @@ class IsaacGymWrapper:
         if viewer:
             self.cfg.viewer = viewer
         self.num_envs = num_envs
+        self.required_tensors = []
+
+        # Parked obstacle actors for obstacles that appear or change size without a restart
+        self.obstacle_pool = ObstaclePool.from_config(cfg)
+        if self.obstacle_pool is not None:
+            self.env_cfg += self.obstacle_pool.make_actors(len(self.env_cfg))
 
         self.start_sim()
 
@@ -147,42 +105,108 @@ class IsaacGymWrapper:
 
         self.gym.prepare_sim(self.sim)
 
-        self.root_state = gymtorch.wrap_tensor(
+        self._root_state = gymtorch.wrap_tensor(
             self.gym.acquire_actor_root_state_tensor(self.sim)
         ).view(self.num_envs, -1, 13)
         self.saved_root_state = None
-        self.dof_state = gymtorch.wrap_tensor(
+        self._dof_state = gymtorch.wrap_tensor(
             self.gym.acquire_dof_state_tensor(self.sim)
         ).view(self.num_envs, -1)
-        self.rigid_body_state = gymtorch.wrap_tensor(
+        self._rigid_body_state = gymtorch.wrap_tensor(
             self.gym.acquire_rigid_body_state_tensor(self.sim)
         ).view(self.num_envs, -1, 13)
 
-        self.net_cf = gymtorch.wrap_tensor(
+        self._net_cf = gymtorch.wrap_tensor(
             self.gym.acquire_net_contact_force_tensor(self.sim)
         )
 
+        # State tensors that went stale with the last step, refreshed on their first access
+        self._refresh_tensor = {
+            "root_state": self.gym.refresh_actor_root_state_tensor,
+            "dof_state": self.gym.refresh_dof_state_tensor,
+            "rigid_body_state": self.gym.refresh_rigid_body_state_tensor,
+            "net_cf": self.gym.refresh_net_contact_force_tensor,
+        }
+        self._stale = set()
+
         self.num_bodies = int(self.net_cf.size(dim=0) / self.num_envs)
 
-        # save buffer of ee states
-        if self.ee_link_present:
-            self.ee_positions_buffer = []
+        # save buffer of ee states, only filled when rollouts are recorded so the rigid body states stay lazy otherwise
+        self.record_rollouts = bool(getattr(self.cfg, "record_rollouts", False)) and self.ee_link_present
+        self.ee_positions_buffer = []
 
         # helpfull slices
         self.robot_indices = torch.tensor([i for i, a in enumerate(self.env_cfg) if a.type == "robot"], device="cuda:0")
 
-        self.obstacle_indices = torch.tensor([i for i, a in enumerate(self.env_cfg) if a.type in ["sphere", "box"]], device="cuda:0")
+        self._update_obstacle_indices()
 
-        if self.ee_link_present:
-            self.ee_positions = self.rigid_body_state[
-                :, self.robot_rigid_body_ee_idx, 0:3
-            ]  # [x, y, z]
+        # Command to dof mapping of the robots and the velocity target buffer it is written into every step
+        self.robot_dof_layout = RobotDofLayout(
+            [(a, self.gym.get_actor_dof_count(self.envs[0], a.handle)) for a in self.env_cfg if a.type == "robot"],
+            device="cuda:0",
+        )
+        self.dof_velocity_target = torch.zeros((self.num_envs, self.dof_state.size(1) // 2), device="cuda:0")
+
+        # Env_cfg index of every actor by name, and the sim domain index of every actor in every env (E x num_actors)
+        # for the indexed state pushes
+        self.actor_index_by_name = {a.name: i for i, a in enumerate(self.env_cfg)}
+        self.actor_ids = torch.tensor(
+            [[self.gym.get_actor_index(env, a.handle, gymapi.DOMAIN_SIM) for a in self.env_cfg] for env in self.envs],
+            dtype=torch.int32,
+            device="cuda:0",
+        )
+        base_indices = [self.robot_indices[i].item() for i in self.robot_dof_layout.base_robots]
+        self.base_handles = [self.env_cfg[i].handle for i in base_indices]
+        self.robot_actor_ids = self.actor_ids[:, self.robot_indices].flatten()
+        self.base_actor_ids = self.actor_ids[:, base_indices].flatten()
 
         self.gym.refresh_actor_root_state_tensor(self.sim)
         self.gym.refresh_dof_state_tensor(self.sim)
         self.gym.refresh_rigid_body_state_tensor(self.sim)
         self.gym.refresh_net_contact_force_tensor(self.sim)
 
+    def _fresh(self, name):
+        if name in self._stale:
+            self._stale.remove(name)
+            self._refresh_tensor[name](self.sim)
+        return getattr(self, "_" + name)
+
+    @property
+    def root_state(self):
+        return self._fresh("root_state")
+
+    @property
+    def dof_state(self):
+        return self._fresh("dof_state")
+
+    @property
+    def rigid_body_state(self):
+        return self._fresh("rigid_body_state")
+
+    @property
+    def net_cf(self):
+        return self._fresh("net_cf")
+
+    @property
+    def ee_positions(self):
+        return self.rigid_body_state[:, self.robot_rigid_body_ee_idx, 0:3]  # [x, y, z]
+
+    def require_tensors(self, names):
+        """
+        Refresh the named state tensors (root_state, dof_state, rigid_body_state, net_cf) right after every step
+        instead of on their first access, the others are only refreshed when they are read.
+        """
+        assert set(names) <= set(self._refresh_tensor), f"unknown state tensors in {names}"
+        self.required_tensors = list(names)
+
+    def _update_obstacle_indices(self):
+        parked = self.obstacle_pool.free if self.obstacle_pool is not None else set()
+        self.obstacle_indices = torch.tensor(
+            [i for i, a in enumerate(self.env_cfg) if a.type in ["sphere", "box"] and i not in parked],
+            dtype=torch.long,
+            device="cuda:0",
+        )
+
     @property
     def robot_positions(self):
         return torch.index_select(self.root_state, 1, self.robot_indices)[:, :, 0:3]
@@ -332,123 +356,83 @@ class IsaacGymWrapper:
         self.gym.add_ground(self.sim, plane_params)
 
     def set_dof_state_tensor(self, state):
+        # The written state is the current one, a pending refresh would overwrite it with the state of the last step
+        self._stale.discard("dof_state")
+        if state is not self._dof_state:
+            self._dof_state[:] = state.view(self._dof_state.shape)
         self.gym.set_dof_state_tensor(self.sim, gymtorch.unwrap_tensor(state))
 
+    def set_root_state_tensor(self, state):
+        self._stale.discard("root_state")
+        if state is not self._root_state:
+            self._root_state[:] = state.view(self._root_state.shape)
+        self.gym.set_actor_root_state_tensor(self.sim, gymtorch.unwrap_tensor(state))
+
     def set_dof_velocity_target_tensor(self, u):
         self.gym.set_dof_velocity_target_tensor(self.sim, gymtorch.unwrap_tensor(u))
 
-    def _ik(self, actor, u):
-        r = actor.wheel_radius
-        L = actor.wheel_base
-        wheel_sets = actor.wheel_count // 2
-
-        # Diff drive fk
-        u_ik = u.clone()
-        u_ik[:, 0] = (u[:, 0] / r) - ((L * u[:, 1]) / (2 * r))
-        u_ik[:, 1] = (u[:, 0] / r) + ((L * u[:, 1]) / (2 * r))
-
-        if wheel_sets > 1:
-            u_ik = u_ik.repeat(1, wheel_sets)
-
-        return u_ik
-
     def apply_robot_cmd_velocity(self, u_desired):
-        vel_dof_shape = list(self.dof_state.size())
-        vel_dof_shape[1] = vel_dof_shape[1] // 2
-        u = torch.zeros(vel_dof_shape, device="cuda:0")
-
-        u_desired_idx = 0
-        u_dof_idx = 0
-        for actor in self.env_cfg:
-            if actor.type != "robot":
-                continue
-            actor_dof_count = self.gym.get_actor_dof_count(self.envs[0], actor.handle)
-            dof_dict = self.gym.get_actor_dof_dict(self.envs[0], actor.handle)
-            for i in range(actor_dof_count):
-                if (
-                    actor.differential_drive
-                    and i >= actor_dof_count - actor.wheel_count
-                ):
-                    u_ik = self._ik(
-                        actor, u_desired[:, u_desired_idx : u_desired_idx + 2]
-                    )
-                    u[:, u_dof_idx : u_dof_idx + actor.wheel_count] = u_ik
-                    u_desired_idx += 2
-                    u_dof_idx += actor.wheel_count
-                    break
-                else:
-                    u[:, u_dof_idx] = u_desired[:, u_desired_idx]
-                    u_desired_idx += 1
-                    u_dof_idx += 1
-
-        self.gym.set_dof_velocity_target_tensor(self.sim, gymtorch.unwrap_tensor(u))
+        self.robot_dof_layout.velocity_targets(u_desired, out=self.dof_velocity_target)
+        self.gym.set_dof_velocity_target_tensor(self.sim, gymtorch.unwrap_tensor(self.dof_velocity_target))
 
     def reset_robot_state(self, q, qdot):
         """
         This function is mainly used for compatibility with gym_urdf_envs pybullet sim.
+        Differential drive robots take their base pose x, y, yaw in front of their other dofs, their wheels start at
+        rest. Only the robots are pushed to the simulator.
         """
-
-        q_idx = 0
-
-        dof_state = []
-        for actor in self.env_cfg:
-            if actor.type != "robot":
-                continue
-
-            actor_dof_count = self.gym.get_actor_dof_count(self.envs[0], actor.handle)
-
-            if actor.differential_drive:
-                actor_q_count = actor_dof_count - (actor.wheel_count - 3)
-            else:
-                actor_q_count = actor_dof_count
-
-            actor_q = q[q_idx : q_idx + actor_q_count]
-            actor_qdot = qdot[q_idx : q_idx + actor_q_count]
-
-            if actor.differential_drive:
-                pos = actor_q[:3]
-                vel = actor_qdot[:3]
-
-                self.set_state_tensor_by_pos_vel(actor.handle, pos, vel)
-
-                # assuming wheels at the back of the dof tensor
-                actor_q = list(actor_q[3:]) + [0] * actor.wheel_count
-                actor_qdot = list(actor_qdot[3:]) + [0] * actor.wheel_count
-
-            for _q, _qdot in zip(actor_q, actor_qdot):
-                dof_state.append(_q)
-                dof_state.append(_qdot)
-
-            q_idx += actor_q_count
-
-        dof_state_tensor = torch.tensor(dof_state).type(torch.float32).to("cuda:0")
-
-        dof_state_tensor = dof_state_tensor.repeat(self.num_envs, 1)
-        self.set_dof_state_tensor(dof_state_tensor)
-
-        self.gym.set_actor_root_state_tensor(
-            self.sim, gymtorch.unwrap_tensor(self.root_state)
+        base_q, base_qdot = self.robot_dof_layout.reset_state(q, qdot, out=self.dof_state)
+        self.gym.set_dof_state_tensor_indexed(
+            self.sim,
+            gymtorch.unwrap_tensor(self.dof_state),
+            gymtorch.unwrap_tensor(self.robot_actor_ids),
+            len(self.robot_actor_ids),
         )
 
+        if self.base_handles:
+            yaw = base_q[:, 2]
+            zeros = torch.zeros_like(yaw)
+            orientation = torch.stack((zeros, zeros, torch.sin(yaw / 2), torch.cos(yaw / 2)), dim=1)
+            for i, handle in enumerate(self.base_handles):
+                self.root_state[:, handle, :2] = base_q[i, :2]
+                self.root_state[:, handle, 3:7] = orientation[i]
+                self.root_state[:, handle, 7:10] = base_qdot[i]
+            self.gym.set_actor_root_state_tensor_indexed(
+                self.sim,
+                gymtorch.unwrap_tensor(self.root_state),
+                gymtorch.unwrap_tensor(self.base_actor_ids),
+                len(self.base_actor_ids),
+            )
+
     def step(self):
         self.gym.simulate(self.sim)
         self.gym.fetch_results(self.sim, True)
-        self.gym.refresh_actor_root_state_tensor(self.sim)
-        self.gym.refresh_dof_state_tensor(self.sim)
-        self.gym.refresh_rigid_body_state_tensor(self.sim)
-        self.gym.refresh_net_contact_force_tensor(self.sim)
+        self._stale.update(self._refresh_tensor)
+        for name in self.required_tensors:
+            self._fresh(name)
 
         if self.viewer is not None:
             self.gym.step_graphics(self.sim)
             self.gym.draw_viewer(self.viewer, self.sim, False)
             # self.gym.sync_frame_time(self.sim)
 
-        if self.ee_link_present:
+        if self.record_rollouts:
             self.ee_positions_buffer.append(self.ee_positions.clone())
 
     def set_root_state_tensor_by_actor_idx(self, state_tensor, idx):
-        for i in range(self.num_envs):
-            self.root_state[i, idx] = state_tensor
+        self.root_state[:, idx] = state_tensor
+
+    def set_actor_root_states(self, states, actor_indices):
+        """
+        Broadcasts the N x 13 root states into the actors at actor_indices (N env_cfg indices) of all envs in one
+        indexed assignment, and pushes only those actors to the simulator.
+        """
+        actor_indices = torch.as_tensor(actor_indices, dtype=torch.long, device="cuda:0")
+        self.root_state[:, actor_indices] = states.to(self.root_state)
+        actor_ids = self.actor_ids[:, actor_indices].flatten()
+        self.gym.set_actor_root_state_tensor_indexed(
+            self.sim, gymtorch.unwrap_tensor(self.root_state), gymtorch.unwrap_tensor(actor_ids), len(actor_ids)
+        )
 
     def save_root_state(self):
         self.saved_root_state = self.root_state.clone()
@@ -457,8 +441,7 @@ class IsaacGymWrapper:
         return self.saved_root_state
 
     def reset_root_state(self):
-        if self.ee_link_present:
-            self.ee_positions_buffer = []
+        self.ee_positions_buffer = []
 
         if self.saved_root_state is not None:
             self.gym.set_actor_root_state_tensor(
@@ -489,6 +472,7 @@ class IsaacGymWrapper:
         where each obstacle is a list of the following order [position, velocity, type, size]
         """
         env_cfg_changed = False
+        obst_indices, obst_states = [], []
 
         for i, obst in enumerate(list(obstacles.values())):
             pos = obst['position']
@@ -496,11 +480,17 @@ class IsaacGymWrapper:
             o_type = 'sphere'
             o_size = obst['size']
             name = f"{o_type}{i}"
-            try:
-                obst_idx = [
-                    idx for idx, actor in enumerate(self.env_cfg) if actor.name == name
-                ][0]
-            except:
+            if self.obstacle_pool is not None:
+                obst_idx, restart = self.obstacle_pool.serve(
+                    self.env_cfg, self.actor_index_by_name, name, o_type, o_size
+                )
+                env_cfg_changed |= restart
+                obst_indices.append(obst_idx)
+                obst_states.append([*pos, 0, 0, 0, 1, *vel, 0, 0, 0])
+                continue
+
+            obst_idx = self.actor_index_by_name.get(name)
+            if obst_idx is None:
                 self.env_cfg.append(
                     ActorWrapper(
                         **{
@@ -512,39 +502,38 @@ class IsaacGymWrapper:
                         }
                     )
                 )
+                self.actor_index_by_name[name] = len(self.env_cfg) - 1
                 env_cfg_changed = True
                 continue
 
-            obst_state = torch.tensor(
-                [*pos, 0, 0, 0, 1, *vel, 0, 0, 0], device="cuda:0"
-            )
-
             # Note: reset simulator if size changed, because this cannot be done at runtime.
             if not all([a == b for a, b in zip(o_size, self.env_cfg[obst_idx].size)]):
                 env_cfg_changed = True
                 self.env_cfg[obst_idx].size = o_size
 
-            for j, env in enumerate(self.envs):
-                self.root_state[j, obst_idx] = obst_state
+            obst_indices.append(obst_idx)
+            obst_states.append([*pos, 0, 0, 0, 1, *vel, 0, 0, 0])
+
+        # Obstacles that moved to another pool actor leave theirs parked
+        if self.obstacle_pool is not None:
+            for actor_idx in self.obstacle_pool.pop_parked():
+                obst_indices.append(actor_idx)
+                obst_states.append(self.obstacle_pool.park_state(actor_idx))
+            self._update_obstacle_indices()
 
         # restart sim for env changes
         if env_cfg_changed:
             self.stop_sim()
             self.start_sim()
 
-        self.gym.set_actor_root_state_tensor(
-            self.sim, gymtorch.unwrap_tensor(self.root_state)
-        )
+        if obst_indices:
+            self.set_actor_root_states(torch.tensor(obst_states, device="cuda:0"), obst_indices)
 
     def update_root_state_tensor_by_obstacles_tensor(self, obst_tensor):
-        for i, o_tensor in enumerate(obst_tensor):
-            if self.env_cfg[i + 3].fixed:
-                continue
-            self.root_state[:, i + 3] = o_tensor.repeat(self.num_envs, 1)
-
-        self.gym.set_actor_root_state_tensor(
-            self.sim, gymtorch.unwrap_tensor(self.root_state)
-        )
+        moving = [i for i in range(len(obst_tensor)) if not self.env_cfg[i + 3].fixed]
+        if moving:
+            states = torch.stack([torch.as_tensor(obst_tensor[i], device="cuda:0") for i in moving])
+            self.set_actor_root_states(states, [i + 3 for i in moving])
 
     def draw_lines(self, lines, env_idx=0):
         # convert list of vertices into line segments
@@ -1,13 +1,19 @@
 import torch
 import functools
+import time
 import numpy as np
 from typing import Optional, List, Callable
 from torch.distributions.multivariate_normal import MultivariateNormal
-from scipy import signal
 import scipy.interpolate as si
 from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
-from mppiisaac.utils.mppi_utils import generate_gaussian_halton_samples, scale_ctrl, cost_to_go
+from mppiisaac.utils.mppi_utils import generate_gaussian_halton_samples, scale_ctrl, bspline_batch, SavGolFilter
+from mppiisaac.utils.mppi_utils import discount_sequence, step_discounts, discounted_cost_to_go_
+from mppiisaac.utils.mppi_utils import mppi_update, perturb_actions, compile_fn, adapt_beta, OnlineWeightedMean
+from mppiisaac.utils.mppi_utils import SuccessiveHalving, RolloutTermination, split_running_cost
+from mppiisaac.utils.noise_bank import NoiseBankKey, noise_bank_cache
+from mppiisaac.utils.profiling import Profiler
+from mppiisaac.utils.low_discrepancy import ScrambledHalton, ScrambledSobol
 
 
 def _ensure_non_zero(cost, beta, factor):
@@ -16,7 +22,7 @@ def _ensure_non_zero(cost, beta, factor):
 def is_tensor_like(x):
     return torch.is_tensor(x) or type(x) is np.ndarray
 
-def bspline(c_arr, t_arr=None, n=100, degree=3):
+def bspline(c_arr, t_arr=None, n=100, degree=3, s=0.5):
     sample_device = c_arr.device
     sample_dtype = c_arr.dtype
     cv = c_arr.cpu().numpy()
@@ -25,13 +31,71 @@ def bspline(c_arr, t_arr=None, n=100, degree=3):
         t_arr = np.linspace(0, cv.shape[0], cv.shape[0])
     else:
         t_arr = t_arr.cpu().numpy()
-    spl = si.splrep(t_arr, cv, k=degree, s=0.5)
+    spl = si.splrep(t_arr, cv, k=degree, s=s)
     xx = np.linspace(0, cv.shape[0], n)
     samples = si.splev(xx, spl, ext=3)
     samples = torch.as_tensor(samples, device=sample_device, dtype=sample_dtype)
     return samples
 
 
+@dataclass
+class AnytimeReport(object):
+    """
+        Outcome of one MPPIPlanner.command call
+
+        :param iterations: number of optimization iterations that were completed
+        :param converged: whether the iterations stopped because the plan changed less than anytime_tol
+        :param elapsed_s: wall-clock duration of the call
+        :param plan_change: max abs change of the plan in the last iteration, None after a single iteration
+    """
+
+    iterations: int
+    converged: bool
+    elapsed_s: float
+    plan_change: Optional[float] = None
+
+
+class RolloutWorkspace(object):
+    """
+        Preallocated K x T buffers for the rollouts of one command. The buffers are reused between commands and only
+        reallocated when T or retain_states change or K grows beyond the largest K seen so far, a smaller K uses the
+        leading rows. They are overwritten by the next rollout. cost_to_go (K x T, dtype) is where the update scans
+        the discounted cost to go of the costs in place, so the per-step costs are kept.
+
+        :param retain_states: keep the K x T x nx rolled out states, disable if nobody reads MPPIPlanner.states
+        :param sample_dtype: dtype of the K x T x nu actions and K x T costs, defaults to dtype
+    """
+
+    def __init__(self, nx: int, nu: int, retain_states: bool = True, device: str = "cpu", dtype=torch.float32, sample_dtype=None):
+        self.nx = nx
+        self.nu = nu
+        self.retain_states = retain_states
+        self.tensor_args = {'device': device, 'dtype': dtype}
+        self.sample_args = {'device': device, 'dtype': sample_dtype or dtype}
+        self._layout = None
+
+        self.states = None
+        self.actions = None
+        self.costs = None
+        self.cost_to_go = None
+        self.cost_total = None
+
+    def resize(self, K: int, T: int):
+        if self._layout is None or K > self._layout[0] or (T, self.retain_states) != self._layout[1:]:
+            self._layout = (K, T, self.retain_states)
+            self._states = torch.empty((K, T, self.nx), **self.tensor_args) if self.retain_states else None
+            self._actions = torch.empty((K, T, self.nu), **self.sample_args)
+            self._costs = torch.empty((K, T), **self.sample_args)
+            self._cost_to_go = torch.empty((K, T), **self.tensor_args)
+            self._cost_total = torch.empty(K, **self.tensor_args)
+
+        self.states = self._states[:K] if self.retain_states else None
+        self.actions = self._actions[:K]
+        self.costs = self._costs[:K]
+        self.cost_to_go = self._cost_to_go[:K]
+        self.cost_total = self._cost_total[:K]
+
+
 # TODO: integrate with localplannerbench, using class inheritence
 @dataclass
 class MPPIConfig(object):
@@ -51,8 +115,53 @@ class MPPIConfig(object):
         :param u_init: (nu) what to initialize new end of trajectory control to be; defeaults to zero
         :param U_init: (T x nu) initial control sequence; defaults to noise
         :param rollout_var_discount: Discount cost over control horizon
+        :param rollout_discounts: Per-step discounts (T - 1) replacing rollout_var_discount, e.g. for non-uniform time grids
         :param sample_null_action: Whether to explicitly sample a null action (bad for starting in a local minima)
         :param noise_abs_cost: Whether to use the absolute value of the action noise to avoid bias when all states have the same cost   
+        :param noise_bank_dir: Directory where halton noise banks are stored and reused across processes; defaults to in-memory only
+        :param interpolating_splines: Whether to interpolate the halton knots with the batched interpolating (s=0) B-spline
+                                      instead of one scipy smoothing spline (s=0.5) per sample and action. Much faster to
+                                      generate, but the splines pass through the knots, which changes the noise distribution
+        :param retain_states: Whether to keep the rolled out states in self.states, disable to skip the K x T x nx copies
+        :param compile: Whether to torch.compile the distribution update and action perturbation of 'halton-spline' mode
+        :param anytime_tol: With a deadline, stop iterating once the plan changes less than this (max abs difference)
+        :param anytime_max_iterations: With a deadline, maximum number of optimization iterations per command
+        :param adaptive_samples: Whether to adapt the number of rolled out samples between commands ('halton-spline' mode),
+                                 between min_samples and num_samples, to keep the effective sample size in [ess_min, ess_max].
+                                 Only dynamics that simulate the given rows save work, MPPIisaacPlanner still steps all
+                                 num_samples simulator envs (the inactive ones with zero commands), there it only shrinks
+                                 the sampling and the distribution update
+        :param min_samples: Lower bound on the number of samples with adaptive_samples
+        :param ess_min: Grow the number of samples when the effective sample size drops below this
+        :param ess_max: Shrink the number of samples when the effective sample size exceeds this
+        :param samples_growth: Factor by which the number of samples grows or shrinks per command
+        :param chunk_size: Roll out the samples chunk_size at a time with an online weighted mean ('halton-spline' mode),
+                           bounding the rollout memory by the chunk size instead of K. rollout_reset is called between chunks
+        :param profile: Whether to time the phases of command() and every rollout step, see MPPIPlanner.stats()
+        :param profile_sync: Whether to synchronize the device around every profiled span, for exact cuda timings
+        :param seed: Seed of the planner's random generator and of the halton sequence
+        :param qmc_sequence: Low discrepancy sequence of 'halton' sampling: 'ghalton' (ghalton package), or the torch
+                             native 'halton' (randomly permuted) and 'sobol' (Owen scrambled) sequences. The
+                             planner draws the first block of the sequence once, where the torch native sequences
+                             are faster than ghalton. Blocks further into the sequence cost 20-30% more than the
+                             first one, drawing a fresh block per command is no speedup over re-drawing the first
+                             (see benchmarks/performance/qmc_sampling.py)
+        :param precision: dtype of the K x T noise, perturbed actions and per-step costs: 'float32', 'bfloat16' or
+                          'float16'. Dynamics and running costs are evaluated in float32 and the cost to go, weights
+                          and moments are accumulated in float32. float16 costs overflow above 65504. This saves
+                          memory, not time: the rollout buffers shrink by about a third (e.g. 48.8 to 33.6 MiB at
+                          K=8000, T=100, well below a MiB at the defaults) while the casts make commands slower on cpu
+                          (see benchmarks/performance/mixed_precision.py)
+        :param prune_segment: Successive halving over the horizon, after every prune_segment steps the worst
+                              prune_fraction of the surviving samples by partial cost is no longer simulated, see
+                              SuccessiveHalving. Needs dynamics and running costs that work on any subset of the rows
+                              (analytic models, sharded rollouts), not a simulator holding all K environments.
+                              Pruning costs bookkeeping for every segment, it is only faster when a step is expensive,
+                              with the analytic point robot at K=1000, T=30 it is slower than no pruning (see
+                              benchmarks/performance/rollout_pruning.py --substeps)
+        :param prune_fraction: Fraction of the surviving samples dropped after every prune_segment steps
+        :param termination_penalty: Added to the cost of a sample in the step the running cost flags it as terminated,
+                                    the cost is then frozen for the rest of the horizon, see MPPIPlanner
     """
 
     num_samples: int = 100
@@ -72,10 +181,31 @@ class MPPIConfig(object):
     u_scale: float = 1
     u_per_command: int = 1
     rollout_var_discount: float = 0.95
+    rollout_discounts: Optional[List[float]] = None
     sample_null_action: bool = False
     noise_abs_cost: bool = False
     filter_u: bool = False
     use_priors: bool = False
+    noise_bank_dir: Optional[str] = None
+    interpolating_splines: bool = False
+    retain_states: bool = True
+    compile: bool = False
+    anytime_tol: float = 1e-3
+    anytime_max_iterations: Optional[int] = None
+    adaptive_samples: bool = False
+    min_samples: int = 20
+    ess_min: float = 5.0
+    ess_max: float = 20.0
+    samples_growth: float = 1.5
+    chunk_size: Optional[int] = None
+    profile: bool = False
+    profile_sync: bool = False
+    seed: int = 0
+    qmc_sequence: str = "ghalton"
+    precision: str = "float32"
+    prune_segment: Optional[int] = None
+    prune_fraction: float = 0.5
+    termination_penalty: float = 0.0
 
 class MPPIPlanner(ABC):
     """
@@ -96,9 +226,24 @@ class MPPIPlanner(ABC):
                             mppi_mode = 'halton-spline', sample_mode = 'halton'
                             Alternatively, one can also sample random trajectories at each iteration using gradient mean update by setting
                             mppi_mode = 'halton-spline', sample_mode = 'random'
+
+    The running cost may return (costs, terminated) instead of costs, with terminated a K bool mask of samples that
+    became useless, e.g. collided. From then on their commands are zeroed and their cost is frozen at the cost of
+    that step plus termination_penalty. With prune_segment they are no longer simulated at all and their states are
+    held. terminated_at holds the step every sample of the last rollout terminated at, T if it did not, next to
+    states and actions.
     """
 
-    def __init__(self, cfg: MPPIConfig, nx: int, dynamics: Callable, running_cost: Callable, prior: Optional[Callable] = None):
+    # Optimization state of get_state(), next to the random generator, lambda_ and K_active
+    _state_fields = ['U', 'mean_action', 'best_traj', 'cov_action', 'scale_tril', 'beta', 'active_idx', 'delta']
+
+    def __init__(self, cfg: MPPIConfig, nx: int, dynamics: Callable, running_cost: Callable, prior: Optional[Callable] = None, rollout_reset: Optional[Callable] = None, rollout_engine=None):
+        """
+            :param rollout_reset: called before every extra optimization iteration of a command with a deadline, to reset
+                                  simulators that keep their own state back to the state of the command
+            :param rollout_engine: simulates the whole K x T rollout instead of dynamics and running_cost, e.g. a
+                                   ShardedRollout spreading the samples over worker processes
+        """
 
         # Parameters for mppi and sampling method
         self.mppi_mode = cfg.mppi_mode
@@ -106,16 +251,26 @@ class MPPIPlanner(ABC):
 
         # Utility vars
         self.K = cfg.num_samples        # N_SAMPLES 
+        self.K_active = self.K          # Samples rolled out, less than K with adaptive samples
         self.T = cfg.horizon            # TIMESTEPS
         self.filter_u = cfg.filter_u    # Flag for Sav-Gol filter
         self.lambda_ = cfg.lambda_
         self.tensor_args={'device':cfg.device, 'dtype':torch.float32}
+        # Storage of the K x T samples and costs, everything accumulated over them stays in tensor_args
+        assert cfg.precision in ['float32', 'bfloat16', 'float16'], f"unsupported precision {cfg.precision}"
+        self.sample_args={'device':cfg.device, 'dtype':getattr(torch, cfg.precision)}
         self.delta = None
         self.sample_null_action = cfg.sample_null_action
         self.u_per_command = cfg.u_per_command
         self.terminal_state_cost = None
         self.update_lambda = cfg.update_lambda
         self.update_cov = cfg.update_cov
+        self.anytime_tol = cfg.anytime_tol
+        self.anytime_max_iterations = cfg.anytime_max_iterations
+        self.adaptive_samples = cfg.adaptive_samples
+        self.chunk_size = cfg.chunk_size if cfg.chunk_size and cfg.chunk_size < cfg.num_samples else None
+        self.noise_bank_dir = cfg.noise_bank_dir
+        self.interpolating_splines = cfg.interpolating_splines
 
         # Bound actions
         self.u_min = cfg.u_min
@@ -144,6 +299,9 @@ class MPPIPlanner(ABC):
         self.dynamics = dynamics
         self.running_cost = running_cost
         self.prior = prior
+        self.rollout_reset = rollout_reset
+        self.rollout_engine = rollout_engine
+        assert rollout_engine is None or prior is None, "priors are evaluated in the planner process and cannot be used with a rollout engine"
 
         # Convert lists in cfg to tensors and put them on device
         self.noise_sigma = torch.tensor(cfg.noise_sigma, device=cfg.device)
@@ -152,6 +310,10 @@ class MPPIPlanner(ABC):
         self.noise_dist = MultivariateNormal(
             self.noise_mu, covariance_matrix=self.noise_sigma
         )
+
+        # All random sampling draws from this generator, so planners do not disturb each other and runs can be replayed
+        self.generator = torch.Generator(device=cfg.device)
+        self.generator.manual_seed(cfg.seed)
         self.u_init = torch.tensor(cfg.u_init, device=cfg.device)
         self.U = torch.tensor(cfg.U_init, device=cfg.device)
         # self.U = self.noise_dist.sample((self.T,))
@@ -166,11 +328,21 @@ class MPPIPlanner(ABC):
         self.mean_action = torch.zeros(self.nu, device=self.tensor_args['device'], dtype=self.tensor_args['dtype'])
         self.best_traj = self.mean_action.clone()
 
+        # Timing of the planner phases, a no-op unless cfg.profile
+        self.profiler = Profiler(cfg.profile, cfg.profile_sync, device=cfg.device)
+
+        # Reusable rollout buffers
+        self.workspace = RolloutWorkspace(self.nx, self.nu, cfg.retain_states, **self.tensor_args, sample_dtype=self.sample_args['dtype'])
+
         # Sampled results from last command
         self.state = None
         self.cost_total = None
         self.cost_total_non_zero = None
         self.omega = None
+        self.eta = None
+        self.ess = None
+        self.weighted_cost = None
+        self.report = None
         self.states = None
         self.actions = None
 
@@ -181,10 +353,18 @@ class MPPIPlanner(ABC):
     
         # Halton sampling 
         self.knot_scale = 2             # From mppi config storm is 4
-        self.seed_val = 0               # From mppi config storm
+        self.seed_val = cfg.seed        # From mppi config storm is 0
         self.n_knots = self.T//self.knot_scale
         self.ndims = self.n_knots * self.nu
         self.degree = 1                 # From sample_lib storm is 2
+        self.qmc_sequence = cfg.qmc_sequence
+        if self.qmc_sequence == 'halton':
+            self.qmc = ScrambledHalton(self.ndims, seed=self.seed_val, **self.tensor_args)
+        elif self.qmc_sequence == 'sobol':
+            self.qmc = ScrambledSobol(self.ndims, seed=self.seed_val, **self.tensor_args)
+        else:
+            assert self.qmc_sequence == 'ghalton', f"unknown qmc_sequence {self.qmc_sequence}"
+            self.qmc = None
         self.Z_seq = torch.zeros(1, self.T, self.nu, **self.tensor_args)
         self.cov_action = torch.diagonal(self.noise_sigma, 0)
         self.scale_tril = torch.sqrt(self.cov_action)
@@ -193,15 +373,24 @@ class MPPIPlanner(ABC):
 
         # Discount
         self.gamma = cfg.rollout_var_discount 
-        self.gamma_seq = torch.cumprod(torch.tensor([1.0] + [self.gamma] * (self.T - 1)),dim=0).reshape(1, self.T)
-        self.gamma_seq = self.gamma_seq.to(**self.tensor_args)
-        self.beta = 1 # param storm
+        self.gamma_seq = discount_sequence(cfg.rollout_discounts or self.gamma, self.T, **self.tensor_args)
+        self.discounts = step_discounts(cfg.rollout_discounts or self.gamma, self.T, **self.tensor_args)
+        self.beta = torch.tensor(1.0, **self.tensor_args) # param storm
+
+        # Successive halving of the rollouts, rollout_steps counts the sample steps simulated by the last rollout
+        self.pruner = SuccessiveHalving(cfg.prune_segment, cfg.prune_fraction, self.gamma_seq) if cfg.prune_segment else None
+        self.rollout_steps = None
+
+        # Samples flagged as terminated by the running cost
+        self.termination = RolloutTermination(cfg.termination_penalty)
+        self.terminated_at = None
 
         # Filtering
         self.sgf_window = 9
         self.sgf_order = 2
         if (self.sgf_window % 2) == 0:
             self.sgf_window -=1       # Some versions of the sav-go filter require odd window size
+        self.sgf = SavGolFilter(self.sgf_window, self.sgf_order, **self.tensor_args)
 
         # Lambda update, for now the update of lambda is not performed
         self.eta_max = 0.1      # 10%
@@ -217,36 +406,55 @@ class MPPIPlanner(ABC):
         self.beta_lm = 0.9
         self.beta_um = 1.2
 
+        # Adaptive number of samples, the zero-noise sample (last) is always part of the active ones
+        if self.adaptive_samples:
+            assert self.mppi_mode == 'halton-spline', "adaptive samples are only supported in 'halton-spline' mode"
+            assert self.nu + 2 < cfg.min_samples <= self.K, "min_samples must be in (nu + 2, num_samples]"
+        self.min_samples = cfg.min_samples
+        self.ess_min = cfg.ess_min
+        self.ess_max = cfg.ess_max
+        self.samples_growth = cfg.samples_growth
+        self.active_idx = torch.arange(self.K, device=self.tensor_args['device'])
+        if self.chunk_size:
+            assert self.mppi_mode == 'halton-spline', "chunked rollouts are only supported in 'halton-spline' mode"
+            assert not self.adaptive_samples, "chunked rollouts do not support adaptive samples"
+
+        # Fused update and perturbation, optionally compiled
+        self._mppi_update = compile_fn(mppi_update) if cfg.compile else mppi_update
+        self._perturb_actions = compile_fn(perturb_actions) if cfg.compile else perturb_actions
+
     def _dynamics(self, state, u, t=None):
         return self.dynamics(state, u, t=None)
 
     def _running_cost(self, state):
         return self.running_cost(state)
 
-    def _exp_util(self, costs, actions):
+    def _noise_bank_key(self):
+        return NoiseBankKey(
+            num_samples=self.K,
+            horizon=self.T,
+            nu=self.nu,
+            knot_scale=self.knot_scale,
+            degree=self.degree,
+            seed=self.seed_val,
+            dtype=str(self.tensor_args['dtype']),
+            sequence=self.qmc_sequence,
+            spline="interpolating" if self.interpolating_splines else "smoothing",
+        )
+
+    def get_noise_bank(self):
         """
-           Calculate weights using exponential utility given cost
+            Halton samples only depend on the sampling geometry, so they are shared between planners and restarts.
+            The bank is cached in float32 and returned in the sample precision.
         """
-        traj_costs = cost_to_go(costs, self.gamma_seq)
-        traj_costs = traj_costs[:,0]
-
-        #control_costs = self._control_costs(actions)
-        total_costs = traj_costs - torch.min(traj_costs) #+ self.beta * control_costs
-
-        # Normalization of the weights
-        exp_ = torch.exp((-1.0/self.beta) * total_costs)
-        eta = torch.sum(exp_)       # tells how many significant samples we have, more or less
-        w = 1/eta*exp_
-        # print(self.beta)
-        # beta update 
-        if eta > self.eta_u_bound:
-            self.beta = self.beta*self.beta_lm
-        elif eta < self.eta_l_bound:
-            self.beta = self.beta*self.beta_um
-        
-        #w = torch.softmax((-1.0/self.beta) * total_costs, dim=0)
-        self.total_costs = total_costs
-        return w
+        if self.qmc is not None:
+            self.qmc.reset()
+        return noise_bank_cache.get(
+            self._noise_bank_key(),
+            lambda: self.get_samples(self.K, base_seed=0),
+            device=self.tensor_args['device'],
+            cache_dir=self.noise_bank_dir,
+        ).to(self.sample_args['dtype'])
 
     def get_samples(self, sample_shape, **kwargs): 
         """
@@ -256,90 +464,233 @@ class MPPIPlanner(ABC):
         number of knots, later interpolated with a spline
         """
         if(self.sample_method=='halton'):
-            self.knot_points = generate_gaussian_halton_samples(
-                sample_shape,               # Number of samples
-                self.ndims,                 # n_knots * nu (knots per number of actions)
-                use_ghalton=True,
-                seed_val=self.seed_val,     # seed val is 0 
-                device=self.tensor_args['device'],
-                float_dtype=self.tensor_args['dtype'])
+            if self.qmc is not None:
+                # Consecutive calls draw consecutive blocks of the sequence
+                self.knot_points = self.qmc.draw_gaussian(sample_shape)
+            else:
+                self.knot_points = generate_gaussian_halton_samples(
+                    sample_shape,               # Number of samples
+                    self.ndims,                 # n_knots * nu (knots per number of actions)
+                    use_ghalton=True,
+                    seed_val=self.seed_val,     # seed val is 0 
+                    device=self.tensor_args['device'],
+                    float_dtype=self.tensor_args['dtype'])
             
             # Sample splines from knot points:
-            # iteratre over action dimension:
             knot_samples = self.knot_points.view(sample_shape, self.nu, self.n_knots) # n knots is T/knot_scale (30/4 = 7)
-            self.samples = torch.zeros((sample_shape, self.T, self.nu), **self.tensor_args)
-            for i in range(sample_shape):
-                for j in range(self.nu):
-                    self.samples[i,:,j] = bspline(knot_samples[i,j,:], n=self.T, degree=self.degree)
+            if self.interpolating_splines:
+                # all K x nu splines at once with the precomputed basis matrix
+                self.samples = bspline_batch(knot_samples, n=self.T, degree=self.degree).transpose(1, 2).contiguous()
+            else:
+                # smoothing splines choose their knots per sample, iterate over samples and action dimension on cpu
+                knot_samples = knot_samples.cpu()
+                samples = torch.zeros((sample_shape, self.T, self.nu), dtype=self.tensor_args['dtype'])
+                for i in range(sample_shape):
+                    for j in range(self.nu):
+                        samples[i,:,j] = bspline(knot_samples[i,j,:], n=self.T, degree=self.degree)
+                self.samples = samples.to(self.tensor_args['device'])
 
         elif(self.sample_method == 'random'):
-            self.samples = self.noise_dist.sample((self.K, self.T))
+            self.samples = self.sample_noise((sample_shape, self.T))
         
         return self.samples
 
-    def command(self, state):
+    def sample_noise(self, sample_shape):
         """
-            Given a state, returns the best action sequence
+            Draws sample_shape x nu samples of the gaussian noise distribution from the planner's generator, in the
+            sample precision
         """
-        
-        if not torch.is_tensor(state):
-            state = torch.tensor(state)
-        self.state = state.to(dtype=self.tensor_args['dtype'], device=self.tensor_args['device'])
+        eps = torch.randn((*sample_shape, self.nu), generator=self.generator, **self.tensor_args)
+        return (self.noise_mu + eps @ self.noise_dist.scale_tril.T).to(self.sample_args['dtype'])
 
-        if self.mppi_mode == 'simple':
-            self.U = torch.roll(self.U, -1, dims=0)
-            cost_total = self._compute_total_cost_batch_simple()
+    def get_state(self):
+        """
+            Snapshot of the planner's random generator and optimization state, restore it with set_state() to replay
+            the following commands bit for bit
+        """
+        state = {'generator': self.generator.get_state(), 'lambda_': self.lambda_, 'K_active': self.K_active}
+        for name in self._state_fields:
+            value = getattr(self, name)
+            state[name] = value.clone() if torch.is_tensor(value) else value
+        return state
 
-            beta = torch.min(cost_total)
-            self.cost_total_non_zero = _ensure_non_zero(cost_total, beta, 1 / self.lambda_)
+    def set_state(self, state):
+        """
+            Restores a snapshot taken with get_state()
+        """
+        self.generator.set_state(state['generator'])
+        for name, value in state.items():
+            if name != 'generator':
+                setattr(self, name, value.clone() if torch.is_tensor(value) else value)
 
-            eta = torch.sum(self.cost_total_non_zero)
-            self.omega = (1. / eta) * self.cost_total_non_zero
-            
-            self.U += torch.sum(self.omega.view(-1, 1, 1) * self.noise, dim=0)
+    def _iteration_state(self, best=None, improved=None):
+        """
+            Distribution state an optimization iteration leaves behind: the get_state() fields with the eta, ess and
+            weighted cost of its samples. Given the best state so far and where (per problem) the last iteration
+            improved on it, the state of the last iteration there and best elsewhere.
+        """
+        state = {}
+        for name in self._state_fields + ['eta', 'ess', 'weighted_cost']:
+            value = getattr(self, name)
+            if best is not None and torch.is_tensor(value) and value is not best[name]:
+                if value.shape[:improved.dim()] == improved.shape:
+                    mask = improved.view(improved.shape + (1,) * (value.dim() - improved.dim()))
+                    value = torch.where(mask, value, best[name])
+            # The noise bank is only ever replaced, the plan and its moments may be updated in place
+            elif torch.is_tensor(value) and name != 'delta':
+                value = value.clone()
+            state[name] = value
+        return state
+
+    def command(self, state, deadline_s: Optional[float] = None, return_report: bool = False):
+        """
+            Given a state, returns the best action sequence
 
-            action = self.U
+            Without a deadline a single K x T rollout is optimized. With deadline_s, optimization iterations around the
+            current plan are repeated as long as another iteration is expected to finish within deadline_s seconds of
+            the call, until the plan changes less than anytime_tol or anytime_max_iterations is reached. The first
+            iteration always runs. The plan of the iteration with the lowest weighted cost of its samples is returned
+            and kept as the plan to shift into the next command. With return_report, returns (action, AnytimeReport).
+        """
+        with self.profiler.span("command"):
+            return self._command(state, deadline_s, return_report)
 
-        elif self.mppi_mode == 'halton-spline':
-            # shift command 1 time step
-            saved_action = self.mean_action[-1]
-            self.mean_action = torch.roll(self.mean_action, -1, dims=0)
-            self.mean_action[-1] = saved_action
-            cost_total = self._compute_total_cost_batch_halton()
-              
-            action = torch.clone(self.mean_action)
+    def _command(self, state, deadline_s, return_report):
+        t_start = time.perf_counter()
+
+        if not torch.is_tensor(state):
+            state = torch.tensor(state)
+        self.state = state.to(dtype=self.tensor_args['dtype'], device=self.tensor_args['device'])
+
+        with self.profiler.span("shift_plan"):
+            self._shift_plan()
+        plan = self._optimize()
+        iterations = 1
+        converged = False
+        plan_change = None
+
+        if deadline_s is not None:
+            best = self._iteration_state()
+            while self.anytime_max_iterations is None or iterations < self.anytime_max_iterations:
+                elapsed = time.perf_counter() - t_start
+                if elapsed + elapsed / iterations > deadline_s:
+                    break
+
+                if self.rollout_reset:
+                    self.rollout_reset()
+                previous_plan = plan.clone()
+                plan = self._optimize()
+                iterations += 1
+
+                # Per problem for the batched planner, without leaving the device
+                best = self._iteration_state(best, self.weighted_cost < best['weighted_cost'])
+
+                plan_change = torch.max(torch.abs(plan - previous_plan)).item()
+                if plan_change < self.anytime_tol:
+                    converged = True
+                    break
+
+            # The next command samples around the best plan with its covariance and injects its best sample
+            for name, value in best.items():
+                setattr(self, name, value)
+            plan = self.U if self.mppi_mode == 'simple' else self.mean_action
+
+        self.report = AnytimeReport(
+            iterations=iterations,
+            converged=converged,
+            elapsed_s=time.perf_counter() - t_start,
+            plan_change=plan_change,
+        )
 
-        # Lambda update
-        if self.update_lambda:
-            if eta > self.eta_max*self.K:
+        # Lambda update, lambda only weights the samples in 'simple' mode
+        if self.update_lambda and self.mppi_mode == 'simple':
+            if self.eta > self.eta_max*self.K:
                 self.lambda_ = (1+self.lambda_mult)*self.lambda_
-            elif eta < self.eta_min*self.K:
+            elif self.eta < self.eta_min*self.K:
                 self.lambda_ = (1-self.lambda_mult)*self.lambda_
 
+        if self.adaptive_samples:
+            self._adapt_num_samples()
+
+        action = torch.clone(plan)
+
         # Smoothing with Savitzky-Golay filter
         if self.filter_u:
-            u_ = action.cpu().numpy()
-            u_filtered = signal.savgol_filter(
-                u_, 
-                self.sgf_window, 
-                self.sgf_order, 
-                deriv=0, 
-                delta=1.0, 
-                axis=0, 
-                mode='interp', 
-                cval=0.0
-                )
-            if self.tensor_args['device'] == "cpu":
-                action = torch.from_numpy(u_filtered).to('cpu')
-            else:
-                action = torch.from_numpy(u_filtered).to('cuda')
+            with self.profiler.span("filter"):
+                action = self.sgf(action)
         
         # Reduce dimensionality if we only need the first command
         if self.u_per_command == 1:
-            action = action[0]
+            action = action[..., 0, :]
 
+        if return_report:
+            return action, self.report
         return action
 
+    def stats(self):
+        """
+            Rolling timing statistics per profiled phase (command, shift_plan, sample, rollout, dynamics, running_cost,
+            update_distribution, filter), see Profiler.stats(). Empty unless the planner was configured with profile
+        """
+        return self.profiler.stats()
+
+    def _adapt_num_samples(self):
+        """
+            Grow or shrink the number of active samples for the next command to keep the effective sample size
+            of the last update within [ess_min, ess_max]
+        """
+        ess = self.ess.item()
+        if ess < self.ess_min:
+            K_active = int(self.K_active * self.samples_growth)
+        elif ess > self.ess_max:
+            K_active = int(self.K_active / self.samples_growth)
+        else:
+            return
+        K_active = min(max(K_active, self.min_samples), self.K)
+        if K_active != self.K_active:
+            self.K_active = K_active
+            self.active_idx = torch.cat((
+                torch.arange(K_active - 1, device=self.tensor_args['device']),
+                torch.tensor([self.K - 1], device=self.tensor_args['device']),
+            ))
+
+    def _shift_plan(self):
+        """
+            Shift the plan one time step forward, repeating the last action
+        """
+        if self.mppi_mode == 'simple':
+            self.U = torch.roll(self.U, -1, dims=0)
+
+        elif self.mppi_mode == 'halton-spline':
+            saved_action = self.mean_action[-1]
+            self.mean_action = torch.roll(self.mean_action, -1, dims=0)
+            self.mean_action[-1] = saved_action
+
+    def _optimize(self):
+        """
+            One MPPI iteration around the current plan from self.state, returns the updated plan
+        """
+        if self.mppi_mode == 'simple':
+            cost_total = self._compute_total_cost_batch_simple()
+
+            with self.profiler.span("update_distribution"):
+                beta = torch.min(cost_total)
+                self.cost_total_non_zero = _ensure_non_zero(cost_total, beta, 1 / self.lambda_)
+
+                self.eta = torch.sum(self.cost_total_non_zero)
+                self.omega = (1. / self.eta) * self.cost_total_non_zero
+                self.weighted_cost = torch.sum(self.omega * cost_total)
+                
+                self.U += torch.sum(self.omega.view(-1, 1, 1) * self.noise, dim=0)
+            return self.U
+
+        elif self.mppi_mode == 'halton-spline':
+            if self.chunk_size:
+                self._compute_total_cost_batch_chunked()
+            else:
+                self._compute_total_cost_batch_halton()
+            return self.mean_action
+
     def _compute_rollout_costs(self, perturbed_actions):
         """
             Given a sequence of perturbed actions, forward simulates their effects and calculates costs for each rollout
@@ -347,66 +698,230 @@ class MPPIPlanner(ABC):
         K, T, nu = perturbed_actions.shape
         assert nu == self.nu
 
-        cost_total = torch.zeros(K, device=self.tensor_args['device'], dtype=self.tensor_args['dtype'])
-        cost_horizon = torch.zeros([K, T], device=self.tensor_args['device'], dtype=self.tensor_args['dtype'])
-        cost_samples = cost_total
-
         # allow propagation of a sample of states (ex. to carry a distribution), or to start with a single state
         if self.state.shape == (K, self.nx):
             state = self.state
+        elif self.state.shape == (self.K, self.nx):
+            state = self.state[self.active_idx]
         else:
             state = self.state.view(1, -1).repeat(K, 1)
 
-        states = []
-        actions = []
+        with self.profiler.span("rollout"):
+            cost_horizon, states, actions = self._rollout(
+                perturbed_actions,
+                state,
+                null_idx=K - 1 if self.sample_null_action else None,
+                prior_idx=K - 2 if self.prior else None,
+            )
+
+        cost_total = self.workspace.cost_total
+        torch.sum(cost_horizon, dim=1, dtype=cost_total.dtype, out=cost_total)
+
+        # action perturbation cost
+        if self.terminal_state_cost:
+            c = self.terminal_state_cost(states, actions)
+            cost_total += c
+        cost_total += cost_total.mean(dim=0)
+        
+        if self.mppi_mode == 'halton-spline':
+            with self.profiler.span("update_distribution"):
+                self.noise = self._update_distribution(cost_horizon, actions)
+
+        return cost_total, states, actions
+
+    def _rollout(self, perturbed_actions, state, null_idx=None, prior_idx=None):
+        """
+            Forward simulates the K x T x nu perturbed actions from the K x nx states into the rollout workspace.
+            Rollout null_idx is replaced by the null action and prior_idx by the prior, perturbed_actions is updated
+            with the actions that were actually applied. Returns the K x T costs, K x T x nx states (None if states are
+            not retained) and K x T x nu actions.
+        """
+        K, T, nu = perturbed_actions.shape
+
+        # Terminal costs need the full state trajectories
+        self.workspace.retain_states = self.workspace.retain_states or bool(self.terminal_state_cost)
+        self.workspace.resize(K, T)
+        states = self.workspace.states
+        actions = self.workspace.actions
+        cost_horizon = self.workspace.costs
+
+        if self.rollout_engine is not None:
+            u = self.u_scale * perturbed_actions.to(self.tensor_args['dtype'])
+            if null_idx is not None:
+                u[null_idx] = 0.0
+            pruning = None
+            if self.pruner is not None:
+                pruning = (self.pruner.segment, self.pruner.fraction, self.gamma_seq.reshape(-1).tolist(), [null_idx])
+            engine_costs, engine_states, engine_actions = self.rollout_engine.rollout(
+                u, state, pruning=pruning, termination_penalty=self.termination.penalty
+            )
+            self.rollout_steps = self.rollout_engine.sample_steps
+            self.terminated_at = self.rollout_engine.terminated_at.to(self.tensor_args['device'])
+
+            perturbed_actions.copy_(engine_actions)
+            cost_horizon.copy_(engine_costs)
+            actions.copy_(engine_actions)
+            if states is not None:
+                assert engine_states is not None, "the rollout engine does not retain states"
+                states.copy_(engine_states)
+            return cost_horizon, states, actions
+
+        # Indices of the samples still simulated once the pruner dropped some, None while all are
+        alive = None
+        if self.pruner is not None:
+            self.pruner.reset(K, protected=[null_idx, prior_idx])
+        termination = self.termination
+        termination.reset(K, T, device=self.tensor_args['device'])
 
         for t in range(T):
-            u = self.u_scale * perturbed_actions[:, t]
+            u = self.u_scale * perturbed_actions[:, t].to(self.tensor_args['dtype'])
 
             # Last rollout is a braking manover
-            if self.sample_null_action:
-                u[self.K - 1, :] = torch.zeros_like(u[self.K -1, :])
-                self.perturbed_action[self.K - 1][t] = u[self.K -1, :]
+            if null_idx is not None:
+                u[null_idx, :] = 0.0
+                perturbed_actions[null_idx, t] = 0.0
 
-            if self.prior:
-                u[self.K - 2] = self.prior(state, t)
-                self.perturbed_action[self.K - 2][t] = u[self.K - 2]
+            if prior_idx is not None:
+                u[prior_idx] = self.prior(state, t)
+                perturbed_actions[prior_idx, t] = u[prior_idx].to(perturbed_actions.dtype)
+
+            termination.zero_commands(u)
+
+            # Dropped samples keep their planned action
+            if alive is not None:
+                actions[:, t] = u
+                u = u[alive]
                 
-            state, u = self._dynamics(state, u, t)
-            c = self._running_cost(state)
+            with self.profiler.span("dynamics"):
+                state, u = self._dynamics(state, u, t)
+            with self.profiler.span("running_cost"):
+                c, flags = split_running_cost(self._running_cost(state))
+            c = termination.update(t, c, flags, alive)
+
+            if alive is None:
+                # Update action if there were changes in fusion mppi due for instance to suction constraints
+                perturbed_actions[:, t] = u
+                cost_horizon[:, t] = c 
+
+                # Save total states/actions
+                # Actions is K x T x nu
+                # States is K x T x nx
+                if states is not None:
+                    states[:, t] = state
+                actions[:, t] = u
+            else:
+                perturbed_actions[alive, t] = u.to(perturbed_actions.dtype)
+                cost_horizon[alive, t] = c.to(cost_horizon.dtype)
+                if states is not None:
+                    states[alive, t] = state.to(states.dtype)
+                actions[alive, t] = u.to(actions.dtype)
+
+            if self.pruner is not None:
+                keep = self.pruner.step(t, c, termination.terminated)
+                if keep is not None:
+                    state = state[keep]
+                    alive = self.pruner.alive
+
+        if self.pruner is not None:
+            self.pruner.finalize(cost_horizon, states, termination.terminated, termination.frozen_costs)
+            self.rollout_steps = self.pruner.sample_steps
+        else:
+            self.rollout_steps = K * T
+        self.terminated_at = termination.terminated_at
 
-            # Update action if there were changes in fusion mppi due for instance to suction constraints
-            self.perturbed_action[:,t] = u
-            cost_samples += c
-            cost_horizon[:, t] = c 
+        return cost_horizon, states, actions
 
-            # Save total states/actions
-            states.append(state)
-            actions.append(u)
+    def _compute_total_cost_batch_chunked(self):
+        """
+            Same as _compute_total_cost_batch_halton, but the samples are rolled out chunk_size at a time. Their
+            weights and weighted actions are accumulated online, so the update is exact while the K x T trajectories
+            are never held at once. states, actions and noise are not kept.
+        """
+        if self.delta == None and self.sample_method == 'halton':
+            self.delta = self.get_noise_bank()
+            self.delta[-1,:,:] = self.Z_seq
+
+        cost_total = torch.empty(self.K, **self.tensor_args)
+        traj_costs = torch.empty(self.K, **self.tensor_args)
+        accumulator = OnlineWeightedMean(self.beta)
+
+        for start in range(0, self.K, self.chunk_size):
+            end = min(start + self.chunk_size, self.K)
+            if start > 0 and self.rollout_reset:
+                self.rollout_reset()
+
+            if self.sample_method == 'random':
+                delta = self.get_samples(end - start).to(self.sample_args['dtype'])
+                if end == self.K:
+                    delta[-1,:,:] = self.Z_seq
+            else:
+                delta = self.delta[start:end]
 
-        # Actions is K x T x nu
-        # States is K x T x nx
-        actions = torch.stack(actions, dim=-2)
-        states = torch.stack(states, dim=-2)
+            with self.profiler.span("sample"):
+                act_seq = self._perturb_actions(self.mean_action, delta, self.scale_tril, self.u_min, self.u_max, squash_fn=self.squash_fn)
+                act_seq = act_seq.to(self.sample_args['dtype'])
+                if start <= self.nu < end:
+                    act_seq[self.nu - start] = self.best_traj
+            self.perturbed_action = act_seq
 
-        # action perturbation cost
-        if self.terminal_state_cost:
-            c = self.terminal_state_cost(states, actions)
-            cost_samples += c
-        cost_total += cost_samples.mean(dim=0)
-        
-        if self.mppi_mode == 'halton-spline':
-            self.noise = self._update_distribution(cost_horizon, actions)
+            if self.state.shape == (self.K, self.nx):
+                state = self.state[start:end]
+            else:
+                state = self.state.view(1, -1).repeat(end - start, 1)
+
+            with self.profiler.span("rollout"):
+                cost_horizon, states, actions = self._rollout(
+                    act_seq,
+                    state,
+                    null_idx=self.K - 1 - start if self.sample_null_action and end == self.K else None,
+                    prior_idx=self.K - 2 - start if self.prior and start <= self.K - 2 < end else None,
+                )
+
+            cost_total[start:end] = torch.sum(cost_horizon, dim=1, dtype=cost_total.dtype)
+            if self.terminal_state_cost:
+                cost_total[start:end] += self.terminal_state_cost(states, actions)
+
+            cost_to_go = self.workspace.cost_to_go.copy_(cost_horizon)
+            traj_costs[start:end] = discounted_cost_to_go_(cost_to_go, self.discounts)[:, 0]
+            accumulator.add(traj_costs[start:end], actions)
+
+        cost_total += cost_total.mean(dim=0)
+        with self.profiler.span("update_distribution"):
+            self._update_distribution_online(accumulator)
+        self.total_costs = traj_costs - torch.min(traj_costs)
+
+        self.cost_total, self.states, self.actions, self.noise = cost_total, None, None, None
+        return self.cost_total
 
-        return cost_total, states, actions
- 
     def _update_distribution(self, costs, actions):
         """
             Update moments using sample trajectories.
             So far only mean is updated, eventually one could also update the covariance
         """
-        w = self._exp_util(costs, actions)
-        
+        # The update scans the costs in place into their cost to go, in the float32 buffer next to the per-step costs
+        cost_to_go = self.workspace.cost_to_go.view(costs.shape).copy_(costs)
+        update = self._mppi_update(
+            cost_to_go,
+            actions,
+            self.mean_action,
+            self.cov_action,
+            self.beta,
+            self.discounts,
+            step_size_mean=self.step_size_mean,
+            step_size_cov=self.step_size_cov,
+            kappa=self.kappa,
+            update_cov=self.update_cov,
+            eta_u_bound=self.eta_u_bound,
+            eta_l_bound=self.eta_l_bound,
+            beta_lm=self.beta_lm,
+            beta_um=self.beta_um,
+        )
+        self.beta = update['beta']
+        self.eta = update['eta']
+        self.ess = update['ess']
+        self.weighted_cost = update['weighted_cost']
+        self.total_costs = update['total_costs']
+
         # Compute also top n best actions to plot
         # top_values, top_idx = torch.topk(self.total_costs, 10)
         # self.top_values = top_values
@@ -414,61 +929,71 @@ class MPPIPlanner(ABC):
         # self.top_trajs = torch.index_select(actions, 0, top_idx).squeeze(0)
 
         # Update best action
-        best_idx = torch.argmax(w)
-        self.best_idx = best_idx
-        self.best_traj = torch.index_select(actions, 0, best_idx).squeeze(0)
-       
-        weighted_seq = w * actions.T
-
-        sum_seq = torch.sum(weighted_seq.T, dim=0)
-        new_mean = sum_seq
+        self.best_idx = update['best_idx']
+        self.best_traj = update['best_traj'].to(self.tensor_args['dtype'])
 
         # Gradient update for the mean
-        self.mean_action = (1.0 - self.step_size_mean) * self.mean_action +\
-            self.step_size_mean * new_mean 
-       
-        delta = actions - self.mean_action.unsqueeze(0)
+        self.mean_action = update['mean_action']
 
         #Update Covariance
         if self.update_cov:
-            #Diagonal covariance of size AxA
-            weighted_delta = w * (delta ** 2).T
-            # cov_update = torch.diag(torch.mean(torch.sum(weighted_delta.T, dim=0), dim=0))
-            cov_update = torch.mean(torch.sum(weighted_delta.T, dim=0), dim=0)
-    
-            self.cov_action = (1.0 - self.step_size_cov) * self.cov_action + self.step_size_cov * cov_update
-            self.cov_action += self.kappa #* self.init_cov_action
+            self.cov_action = update['cov_action']
             # self.cov_action[self.cov_action < 0.0005] = 0.0005
             self.scale_tril = torch.sqrt(self.cov_action)
-        return delta
+        return update['delta']
+
+    def _update_distribution_online(self, accumulator):
+        """
+            Same update as _update_distribution from the accumulated weights of a chunked rollout
+        """
+        self.eta = accumulator.sum_exp
+        self.ess = accumulator.ess
+        self.weighted_cost = accumulator.weighted_cost
+        self.beta = adapt_beta(self.beta, self.eta, self.eta_u_bound, self.eta_l_bound, self.beta_lm, self.beta_um)
+
+        # Update best action
+        self.best_traj = accumulator.best_traj
+
+        # Gradient update for the mean
+        new_mean = accumulator.mean
+        self.mean_action = (1.0 - self.step_size_mean) * self.mean_action + self.step_size_mean * new_mean
+
+        #Update Covariance, sum_k w_k (a_k - m)^2 = E[a^2] - 2 m E[a] + m^2
+        if self.update_cov:
+            weighted_delta = accumulator.mean_sq - 2 * self.mean_action * new_mean + self.mean_action ** 2
+            cov_update = torch.mean(weighted_delta, dim=0)
+            self.cov_action = (1.0 - self.step_size_cov) * self.cov_action + self.step_size_cov * cov_update + self.kappa
+            self.scale_tril = torch.sqrt(self.cov_action)
 
     def get_action_cost(self):
+        noise = self.noise.to(self.noise_sigma_inv.dtype)
         if self.noise_abs_cost:
-            action_cost = self.lambda_ * torch.abs(self.noise) @ self.noise_sigma_inv
+            action_cost = self.lambda_ * torch.abs(noise) @ self.noise_sigma_inv
             # NOTE: The original paper does self.lambda_ * torch.abs(self.noise) @ self.noise_sigma_inv, but this biases
             # the actions with low noise if all states have the same cost. With abs(noise) we prefer actions close to the
             # nomial trajectory.
         else:
-            action_cost = self.lambda_ * self.noise @ self.noise_sigma_inv # Like original paper
+            action_cost = self.lambda_ * noise @ self.noise_sigma_inv # Like original paper
         return action_cost
 
     def _compute_total_cost_batch_simple(self):
         """
             Samples random noise and computes perturbed action sequence at each iteration. Returns total cost
         """
-        # Resample noise each time we take an action
-        self.noise = self.noise_dist.sample((self.K, self.T))
-        # Broadcast own control to noise over samples; now it's K x T x nu
-        self.perturbed_action = self.U + self.noise
-        
-        # Naively bound control
-        self.perturbed_action = self._bound_action(self.perturbed_action)
+        with self.profiler.span("sample"):
+            # Resample noise each time we take an action
+            self.noise = self.sample_noise((self.K, self.T))
+            # Broadcast own control to noise over samples; now it's K x T x nu
+            self.perturbed_action = self.U + self.noise
+            
+            # Naively bound control
+            self.perturbed_action = self._bound_action(self.perturbed_action).to(self.sample_args['dtype'])
 
         self.cost_total, self.states, self.actions = self._compute_rollout_costs(self.perturbed_action)
         self.actions /= self.u_scale
 
         # Bounded noise after bounding (some got cut off, so we don't penalize that in action cost)
-        self.noise = self.perturbed_action - self.U
+        self.noise = (self.perturbed_action - self.U).to(self.sample_args['dtype'])
 
         action_cost = self.get_action_cost()
 
@@ -482,25 +1007,28 @@ class MPPIPlanner(ABC):
             Samples Halton splines once and then shifts mean according to control distribution. If random sampling is selected 
             then samples random noise at each step. Mean of control distribution is updated using gradient
         """
-        if self.sample_method == 'random':
-            self.delta = self.get_samples(self.K, base_seed=0)
-        elif self.delta == None and self.sample_method == 'halton':
-            self.delta = self.get_samples(self.K, base_seed=0)
-            #add zero-noise seq so mean is always a part of samples
-
-        # Add zero-noise seq so mean is always a part of samples
-        self.delta[-1,:,:] = self.Z_seq
-        # Keeps the size but scales values
-        scaled_delta = torch.matmul(self.delta, torch.diag(self.scale_tril)).view(self.delta.shape[0], self.T, self.nu)
-        
-        # First time mean is zero then it is updated in the distribution
-        act_seq = self.mean_action + scaled_delta
-
-        # Scales action within bounds. act_seq is the same as perturbed actions
-        act_seq = scale_ctrl(act_seq, self.u_min, self.u_max, squash_fn=self.squash_fn)
-        act_seq[self.nu, :, :] = self.best_traj
-        
-        self.perturbed_action = torch.clone(act_seq)
+        with self.profiler.span("sample"):
+            if self.sample_method == 'random':
+                self.delta = self.get_samples(self.K_active, base_seed=0).to(self.sample_args['dtype'])
+            elif self.delta == None and self.sample_method == 'halton':
+                self.delta = self.get_noise_bank()
+                #add zero-noise seq so mean is always a part of samples
+
+            # Add zero-noise seq so mean is always a part of samples
+            self.delta[-1,:,:] = self.Z_seq
+
+            # Only the active samples of the halton noise bank are rolled out
+            delta = self.delta
+            if delta.shape[0] != self.K_active:
+                delta = delta[self.active_idx]
+
+            # Scales noise, shifts it around the mean (zero at first, then updated in the distribution) and
+            # scales action within bounds. act_seq is the same as perturbed actions
+            act_seq = self._perturb_actions(self.mean_action, delta, self.scale_tril, self.u_min, self.u_max, squash_fn=self.squash_fn)
+            act_seq = act_seq.to(self.sample_args['dtype'])
+            act_seq[self.nu, :, :] = self.best_traj
+            
+            self.perturbed_action = torch.clone(act_seq)
 
         self.cost_total, self.states, self.actions = self._compute_rollout_costs(self.perturbed_action)
 
@@ -1,4 +1,10 @@
-from mppiisaac.planner.isaacgym_wrapper import IsaacGymWrapper, ActorWrapper
+# Note: isaacgym has to be imported before torch, without it only the torch backend is available
+try:
+    from mppiisaac.planner.isaacgym_wrapper import IsaacGymWrapper
+except ImportError:
+    IsaacGymWrapper = None
+from mppiisaac.planner.sim_backend import ActorWrapper
+from mppiisaac.planner.torch_sim_wrapper import TorchSimWrapper
 from mppiisaac.planner.mppi import MPPIPlanner
 import mppiisaac
 from typing import Callable, Optional
@@ -7,7 +13,6 @@ import os
 import yaml
 from yaml.loader import SafeLoader
 
-from isaacgym import gymtorch
 import torch
 
 torch.set_printoptions(precision=2, sci_mode=False)
@@ -41,12 +46,28 @@ class MPPIisaacPlanner(object):
                 actors.append(ActorWrapper(**yaml.load(f, Loader=SafeLoader)))
 
         print(actors)
-        self.sim = IsaacGymWrapper(
-            cfg.isaacgym,
-            actors=actors,
-            init_positions=cfg.initial_actor_positions,
-            num_envs=cfg.mppi.num_samples,
-        )
+        if cfg.isaacgym.backend == "torch":
+            self.sim = TorchSimWrapper(
+                cfg.isaacgym,
+                actors=actors,
+                init_positions=cfg.initial_actor_positions,
+                num_envs=cfg.mppi.num_samples,
+                device=cfg.mppi.device,
+            )
+        else:
+            assert IsaacGymWrapper is not None, "isaacgym is not installed, use the 'torch' backend"
+            self.sim = IsaacGymWrapper(
+                cfg.isaacgym,
+                actors=actors,
+                init_positions=cfg.initial_actor_positions,
+                num_envs=cfg.mppi.num_samples,
+            )
+
+        # Note: objectives may declare the state tensors they read (required_tensors), the simulator refreshes those
+        # right after every step and all others only when something reads them
+        required_tensors = getattr(objective, "required_tensors", None)
+        if required_tensors is not None:
+            self.sim.require_tensors(required_tensors)
 
         if prior:
             self.prior = lambda state, t: prior.compute_command(self.sim)
@@ -59,6 +80,7 @@ class MPPIisaacPlanner(object):
             dynamics=self.dynamics,
             running_cost=self.running_cost,
             prior=self.prior,
+            rollout_reset=self.rollout_reset,
         )
 
         # Note: place_holder variable to pass to mppi so it doesn't complain, while the real state is actually the isaacgym simulator itself.
@@ -68,17 +90,41 @@ class MPPIisaacPlanner(object):
         # Note: normally mppi passes the state as the first parameter in a dynamics call, but using isaacgym the state is already saved in the simulator itself, so we ignore it.
         # Note: t is an unused step dependent dynamics variable
 
+        # Note: with adaptive samples fewer rollouts than envs are active, the remaining envs get zero commands. The
+        # simulator always steps all envs, so adaptive samples do not make the simulation itself any cheaper
+        num_active = u.shape[0]
+        if num_active < self.sim.num_envs:
+            u = torch.cat((u, torch.zeros((self.sim.num_envs - num_active, u.shape[1]), device=u.device)))
+
         self.sim.apply_robot_cmd_velocity(u)
 
         self.sim.step()
 
-        return (self.state_place_holder, u)
+        return (self.state_place_holder[:num_active], u[:num_active])
 
-    def running_cost(self, _):
+    def running_cost(self, state):
         # Note: again normally mppi passes the state as a parameter in the running cost call, but using isaacgym the state is already saved and accesible in the simulator itself, so we ignore it and pass a handle to the simulator.
-        return self.objective.compute_cost(self.sim)
+        # Note: objectives may also return (cost, terminated) to flag useless rollouts, e.g. after a collision
+        cost = self.objective.compute_cost(self.sim)
+        if isinstance(cost, tuple):
+            return tuple(c[: state.shape[0]] for c in cost)
+        return cost[: state.shape[0]]
+
+    def save_rollout_start(self):
+        # Note: extra optimization iterations and chunks of samples of a command restart from the state the command
+        # started from, saved once per command
+        self.start_dof_state = self.sim.dof_state.clone()
+        self.start_root_state = self.sim.root_state.clone()
+
+    def rollout_reset(self):
+        self.sim.ee_positions_buffer = []
+        self.sim.dof_state[:] = self.start_dof_state
+        self.sim.root_state[:] = self.start_root_state
+
+        self.sim.set_dof_state_tensor(self.sim.dof_state)
+        self.sim.set_root_state_tensor(self.sim.root_state)
 
-    def compute_action(self, q, qdot, obst=None, obst_tensor=None):
+    def compute_action(self, q, qdot, obst=None, obst_tensor=None, deadline_s=None):
         self.sim.reset_root_state()
         self.sim.reset_robot_state(q, qdot)
 
@@ -91,7 +137,8 @@ class MPPIisaacPlanner(object):
             self.sim.update_root_state_tensor_by_obstacles_tensor(obst_tensor)
 
         self.sim.save_root_state()
-        actions = self.mppi.command(self.state_place_holder).cpu()
+        self.save_rollout_start()
+        actions = self.mppi.command(self.state_place_holder, deadline_s=deadline_s).cpu()
         return actions
 
     def reset_rollout_sim(
@@ -102,8 +149,9 @@ class MPPIisaacPlanner(object):
         self.sim.root_state[:] = bytes_to_torch(root_state_tensor)
         self.sim.rigid_body_state[:] = bytes_to_torch(rigid_body_state_tensor)
 
-        self.sim.gym.set_dof_state_tensor(self.sim.sim, gymtorch.unwrap_tensor(self.sim.dof_state))
-        self.sim.gym.set_actor_root_state_tensor(self.sim.sim, gymtorch.unwrap_tensor(self.sim.root_state))
+        self.sim.set_dof_state_tensor(self.sim.dof_state)
+        self.sim.set_root_state_tensor(self.sim.root_state)
+        self.save_rollout_start()
 
     def command(self):
         return torch_to_bytes(self.mppi.command(self.state_place_holder))
@@ -112,5 +160,6 @@ class MPPIisaacPlanner(object):
         self.sim.add_to_envs(env_cfg_additions)
 
     def get_rollouts(self):
+        assert getattr(self.sim, "record_rollouts", False), "rollouts are only recorded with isaacgym.record_rollouts and an ee link"
         return torch_to_bytes(torch.stack(self.sim.ee_positions_buffer))
 
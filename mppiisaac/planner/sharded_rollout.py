@@ -0,0 +1,197 @@
+import traceback
+from typing import Callable, List, Tuple
+
+import torch
+import torch.multiprocessing as mp
+
+from mppiisaac.utils.mppi_utils import SuccessiveHalving, RolloutTermination, split_running_cost
+
+
+def _rollout_worker(worker_idx, model_factory, start, end, buffers, conn):
+    # Note: workers share the machine, one thread each avoids oversubscribing the cores
+    torch.set_num_threads(1)
+    actions, initial_state, costs, states, terminated_at = buffers
+
+    try:
+        model = model_factory(worker_idx, end - start)
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+        return
+    conn.send(("ready", None))
+
+    while True:
+        command, K, T, options = conn.recv()
+        if command == "close":
+            break
+
+        try:
+            stop = min(end, K)
+            sample_steps = 0
+            if start < stop:
+                state = initial_state[start:stop].clone()
+                if hasattr(model, "reset"):
+                    model.reset(state)
+
+                termination = RolloutTermination(options["termination_penalty"])
+                termination.reset(stop - start, T)
+                if options["pruning"] is None:
+                    for t in range(T):
+                        state, u = model.dynamics(state, termination.zero_commands(actions[start:stop, t]), t)
+                        c, flags = split_running_cost(model.running_cost(state))
+                        actions[start:stop, t] = u
+                        costs[start:stop, t] = termination.update(t, c, flags)
+                        if states is not None:
+                            states[start:stop, t] = state
+                    sample_steps = (stop - start) * T
+                else:
+                    sample_steps = _pruned_rollout(model, state, start, stop, T, buffers, options["pruning"], termination)
+                terminated_at[start:stop] = termination.terminated_at
+            conn.send(("done", sample_steps))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+def _pruned_rollout(model, state, start, stop, T, buffers, pruning, termination):
+    """
+        Rollout of the shard with successive halving among its own samples, returns the simulated sample steps
+    """
+    actions, _, costs, states, _ = buffers
+    segment, fraction, gamma_seq, protected = pruning
+    pruner = SuccessiveHalving(segment, fraction, torch.tensor(gamma_seq[:T]))
+    pruner.reset(stop - start, protected=[i - start for i in protected if i is not None and start <= i < stop])
+
+    shard_actions, shard_costs = actions[start:stop, :T], costs[start:stop, :T]
+    shard_states = states[start:stop, :T] if states is not None else None
+    alive = torch.arange(stop - start)
+    for t in range(T):
+        termination.zero_commands(shard_actions[:, t])
+        state, u = model.dynamics(state, shard_actions[alive, t], t)
+        c, flags = split_running_cost(model.running_cost(state))
+        c = termination.update(t, c, flags, alive)
+        shard_actions[alive, t] = u
+        shard_costs[alive, t] = c
+        if shard_states is not None:
+            shard_states[alive, t] = state
+
+        keep = pruner.step(t, c, termination.terminated)
+        if keep is not None:
+            state = state[keep]
+            alive = pruner.alive
+
+    pruner.finalize(shard_costs, shard_states, termination.terminated, termination.frozen_costs)
+    return pruner.sample_steps
+
+
+class ShardedRollout(object):
+    """
+    Rolls out K samples split over num_workers processes, so the rollouts of one command use all cpu cores.
+
+    Every worker owns its own model, built inside the worker by model_factory(worker_idx, shard_size). The model
+    provides dynamics(state, u, t) -> (state, u) and running_cost(state) -> costs for its shard of samples, and
+    optionally reset(state) which is called with the initial states of the shard before every rollout, e.g. to reset
+    a simulator. model_factory must be picklable, i.e. a module level function or class.
+
+    The actions, initial states, per-step costs and states are exchanged through shared memory buffers sized for
+    num_samples x horizon, every sample is simulated by exactly one worker so the merged result equals a rollout
+    in a single process.
+
+    With pruning, every worker runs successive halving among the samples of its shard, so the model has to handle
+    any subset of the rows of its shard. The running cost may flag terminated samples like the one of MPPIPlanner.
+    """
+
+    def __init__(
+        self,
+        model_factory: Callable,
+        num_workers: int,
+        num_samples: int,
+        horizon: int,
+        nx: int,
+        nu: int,
+        retain_states: bool = True,
+        dtype=torch.float32,
+        start_method: str = "spawn",
+    ):
+        assert 0 < num_workers <= num_samples, "there must be between 1 and num_samples workers"
+        self.num_samples = num_samples
+        self.horizon = horizon
+        self.sample_steps = None
+        self.terminated_at = None
+
+        self._actions = torch.zeros((num_samples, horizon, nu), dtype=dtype).share_memory_()
+        self._initial_state = torch.zeros((num_samples, nx), dtype=dtype).share_memory_()
+        self._costs = torch.zeros((num_samples, horizon), dtype=dtype).share_memory_()
+        self._states = torch.zeros((num_samples, horizon, nx), dtype=dtype).share_memory_() if retain_states else None
+        self._terminated_at = torch.zeros(num_samples, dtype=torch.long).share_memory_()
+        buffers = (self._actions, self._initial_state, self._costs, self._states, self._terminated_at)
+
+        # Contiguous shards of (almost) equal size
+        self.shards: List[Tuple[int, int]] = []
+        start = 0
+        for worker_idx in range(num_workers):
+            size = num_samples // num_workers + (1 if worker_idx < num_samples % num_workers else 0)
+            self.shards.append((start, start + size))
+            start += size
+
+        ctx = mp.get_context(start_method)
+        self._connections = []
+        self._workers = []
+        for worker_idx, (start, end) in enumerate(self.shards):
+            parent_conn, child_conn = ctx.Pipe()
+            worker = ctx.Process(
+                target=_rollout_worker,
+                args=(worker_idx, model_factory, start, end, buffers, child_conn),
+                daemon=True,
+            )
+            worker.start()
+            self._connections.append(parent_conn)
+            self._workers.append(worker)
+
+        try:
+            self._gather()
+        except RuntimeError:
+            self.close()
+            raise
+
+    def _gather(self):
+        errors, messages = [], []
+        for worker_idx, conn in enumerate(self._connections):
+            status, message = conn.recv()
+            if status == "error":
+                errors.append(f"rollout worker {worker_idx} failed:\n{message}")
+            messages.append(message)
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return messages
+
+    def rollout(self, actions, state, pruning=None, termination_penalty: float = 0.0):
+        """
+            Forward simulates the K x T x nu actions from the K x nx initial states over the workers.
+            Returns the K x T costs, K x T x nx states (None if states are not retained) and the K x T x nu actions
+            that were actually applied. The returned tensors are views of the shared buffers.
+
+            pruning is None or (segment, fraction, T cumulative discounts, protected sample indices), see
+            SuccessiveHalving. Afterwards sample_steps holds the number of simulated sample steps and terminated_at
+            the step every sample terminated at, see RolloutTermination.
+        """
+        K, T, _ = actions.shape
+        assert K <= self.num_samples and T <= self.horizon, "rollout does not fit in the shared buffers"
+
+        self._actions[:K, :T] = actions
+        self._initial_state[:K] = state
+        for conn in self._connections:
+            conn.send(("rollout", K, T, {"pruning": pruning, "termination_penalty": termination_penalty}))
+        self.sample_steps = sum(self._gather())
+        self.terminated_at = self._terminated_at[:K]
+
+        states = self._states[:K, :T] if self._states is not None else None
+        return self._costs[:K, :T], states, self._actions[:K, :T]
+
+    def close(self):
+        for conn, worker in zip(self._connections, self._workers):
+            if worker.is_alive():
+                conn.send(("close", 0, 0, None))
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._connections = []
+        self._workers = []
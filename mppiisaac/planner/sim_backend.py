@@ -0,0 +1,354 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+import torch
+
+
+@dataclass
+class IsaacGymConfig(object):
+    dt: float = 0.05
+    substeps: int = 2
+    use_gpu_pipeline: bool = True
+    num_client_threads: int = 0
+    viewer: bool = False
+    num_obstacles: int = 10
+    spacing: float = 6.0
+    backend: str = "isaacgym"  # or "torch" for the kinematic TorchSimWrapper
+    # Parked obstacle actors per sphere radius and box size that serve new or resized obstacles without a restart,
+    # 0 disables the pool, see ObstaclePool
+    obstacle_pool_slots: int = 0
+    obstacle_pool_sphere_radii: List[float] = field(default_factory=lambda: [0.05, 0.1, 0.2, 0.4])
+    obstacle_pool_box_sizes: List[List[float]] = field(
+        default_factory=lambda: [[0.1, 0.1, 0.1], [0.2, 0.2, 0.2], [0.4, 0.4, 0.4]]
+    )
+    obstacle_pool_tolerance: float = 0.25
+    # Record the end-effector positions of every rollout step for MPPIisaacPlanner.get_rollouts, this reads the rigid
+    # body states after every step
+    record_rollouts: bool = False
+
+
+class SupportedActorTypes(Enum):
+    Axis = 1
+    Robot = 2
+    Sphere = 3
+    Box = 4
+
+
+@dataclass
+class ActorWrapper:
+    type: SupportedActorTypes
+    name: str
+    init_pos: List[float] = field(default_factory=lambda: [0, 0, 0])
+    init_ori: List[float] = field(default_factory=lambda: [0, 0, 0, 1])
+    size: List[float] = field(default_factory=lambda: [0.1, 0.1, 0.1])
+    mass: float = 1.0  # kg
+    color: List[float] = field(default_factory=lambda: [1.0, 1.0, 1.0])
+    fixed: bool = False
+    collision: bool = True
+    friction: float = 1.
+    handle: Optional[int] = None
+    flip_visual: bool = False
+    urdf_file: str = None
+    ee_link: str = None
+    gravity: bool = True
+    differential_drive: bool = False
+    wheel_radius: Optional[float] = None
+    wheel_base: Optional[float] = None
+    wheel_count: Optional[float] = None
+    left_wheel_joints: Optional[List[int]] = None
+    right_wheel_joints: Optional[List[int]] = None
+    caster_links: Optional[List[str]] = None
+    noise_sigma_size: Optional[List[float]] = None
+    noise_percentage_mass: float = 0.0
+    noise_percentage_friction: float = 0.0
+
+
+class RobotDofLayout(object):
+    """
+    Layout of the robot dofs in the dof tensors of a simulator, compiled once from the robots in env_cfg order with
+    their dof counts, so that mapping commands onto dofs is a few tensor ops instead of a python loop over the dofs.
+
+    Every dof takes one command, except the wheels of differential drive robots (the last wheel_count dofs), which
+    share the commands forward velocity and yaw rate, turned into left and right wheel velocities alternating over
+    the wheel sets. Per dof the velocity target is u[:, cmd_a] * gain_a + u[:, cmd_b] * gain_b.
+
+    Robot states q / qdot (as passed to reset_robot_state) hold one entry per dof, except for differential drive
+    robots, which hold their base pose x, y, yaw followed by the dofs in front of the wheels. Per dof q_idx is its
+    entry in q, or num_q for the wheels, which start at rest, and base_q holds the x, y, yaw entries of every
+    differential drive robot, the robot at position base_robots among the robots.
+    """
+
+    def __init__(self, robots: List[Tuple[ActorWrapper, int]], device="cpu", dtype=torch.float32):
+        dofs, cmd_a, cmd_b, gain_a, gain_b = [], [], [], [], []
+        q_idx, base_q, self.base_robots = [], [], []
+        u_idx, dof_idx, q_count = 0, 0, 0
+        for robot_idx, (actor, dof_count) in enumerate(robots):
+            wheel_count = int(actor.wheel_count) if actor.differential_drive else 0
+            direct = dof_count - wheel_count
+            if actor.differential_drive:
+                base_q.append([q_count, q_count + 1, q_count + 2])
+                self.base_robots.append(robot_idx)
+                q_count += 3
+            q_idx += list(range(q_count, q_count + direct))
+            q_count += direct
+            for i in range(direct):
+                dofs.append(dof_idx + i)
+                cmd_a.append(u_idx + i)
+                cmd_b.append(u_idx + i)
+                gain_a.append(1.0)
+                gain_b.append(0.0)
+            u_idx += direct
+
+            if wheel_count:
+                q_idx += [-1] * wheel_count
+                r, L = actor.wheel_radius, actor.wheel_base
+                for i in range(wheel_count):
+                    dofs.append(dof_idx + direct + i)
+                    cmd_a.append(u_idx)
+                    cmd_b.append(u_idx + 1)
+                    gain_a.append(1 / r)
+                    gain_b.append((L if i % 2 else -L) / (2 * r))
+                u_idx += 2
+            dof_idx += dof_count
+
+        self.num_commands = u_idx
+        self.num_dofs = dof_idx
+        self.num_q = q_count
+        self.q_idx = torch.tensor([q_count if i < 0 else i for i in q_idx], dtype=torch.long, device=device)
+        self.base_q = torch.tensor(base_q, dtype=torch.long, device=device).view(-1, 3)
+        # Persistent device copy of the last q / qdot, the extra last column stays zero for the wheels
+        self.q_buffer = torch.zeros((2, q_count + 1), device=device, dtype=dtype)
+        self.dofs = torch.tensor(dofs, dtype=torch.long, device=device)
+        self.cmd_a = torch.tensor(cmd_a, dtype=torch.long, device=device)
+        self.cmd_b = torch.tensor(cmd_b, dtype=torch.long, device=device)
+        self.gain_a = torch.tensor(gain_a, device=device, dtype=dtype)
+        self.gain_b = torch.tensor(gain_b, device=device, dtype=dtype)
+
+    def velocity_targets(self, u: torch.Tensor, out: torch.Tensor) -> torch.Tensor:
+        """
+            Writes the dof velocity targets of the E x num_commands commands u into out (E x num_dofs)
+        """
+        u = u.to(out.dtype)
+        out[:, self.dofs] = u[:, self.cmd_a] * self.gain_a + u[:, self.cmd_b] * self.gain_b
+        return out
+
+    def reset_state(self, q, qdot, out: torch.Tensor):
+        """
+            Writes the dof state of the robot state q / qdot (arrays or tensors of at least num_q entries) into every
+            row of out (E x 2 num_dofs). Returns the pose and velocity (num_bases x 3 each) of the differential drive
+            bases.
+        """
+        self.q_buffer[0, : self.num_q] = torch.as_tensor(q[: self.num_q], dtype=self.q_buffer.dtype)
+        self.q_buffer[1, : self.num_q] = torch.as_tensor(qdot[: self.num_q], dtype=self.q_buffer.dtype)
+        dof_state = self.q_buffer[:, self.q_idx].t().reshape(-1)
+        out.copy_(dof_state.expand_as(out))
+        return self.q_buffer[0, self.base_q], self.q_buffer[1, self.base_q]
+
+
+class ObstaclePool(object):
+    """
+    Parked sphere and box actors that serve obstacles which appear or change size at runtime, so the simulator does
+    not have to be restarted for them.
+
+    make_actors() creates slots_per_size fixed actors per sphere radius and box size, appended to env_cfg before the
+    simulator starts. serve() moves a new or resized obstacle onto the free slot of its type whose size is closest,
+    if every dimension is within tolerance (relative), by renaming the slot. The actor the obstacle leaves is parked
+    and joins the pool with its size. Only if no slot fits, a new actor of the exact size is appended to env_cfg and
+    the simulator has to restart, counted as exhausted in stats().
+
+    Parked actors sit apart from each other below park_position, the wrapper moves the ones parked since the last
+    pop_parked() there.
+    """
+
+    def __init__(
+        self,
+        sphere_radii: List[float],
+        box_sizes: List[List[float]],
+        slots_per_size: int,
+        tolerance: float = 0.25,
+        park_position: Tuple[float, float, float] = (0.0, 0.0, -10.0),
+    ):
+        self.sphere_radii = list(sphere_radii)
+        self.box_sizes = [list(size) for size in box_sizes]
+        self.slots_per_size = slots_per_size
+        self.tolerance = tolerance
+        self.park_position = park_position
+
+        # Type and actual size of every pool actor by env_cfg index, the parked ones and the requested size of the
+        # obstacles on a pool actor
+        self.slots: Dict[int, Tuple[str, List[float]]] = {}
+        self.free = set()
+        self.requested: Dict[str, List[float]] = {}
+        self._parked = []
+        self.counts = {"served": 0, "released": 0, "exhausted": 0}
+
+    @classmethod
+    def from_config(cls, cfg):
+        """
+            Pool of an IsaacGymConfig (or a config with its keys), None if it has no slots
+        """
+        defaults = IsaacGymConfig()
+        get = lambda key: getattr(cfg, key, None) if getattr(cfg, key, None) is not None else getattr(defaults, key)
+        if not get("obstacle_pool_slots"):
+            return None
+        return cls(
+            get("obstacle_pool_sphere_radii"),
+            get("obstacle_pool_box_sizes"),
+            get("obstacle_pool_slots"),
+            get("obstacle_pool_tolerance"),
+        )
+
+    def park_state(self, actor_idx: int) -> List[float]:
+        x, y, z = self.park_position
+        return [x + 2.0 * actor_idx, y, z, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0]
+
+    def make_actors(self, first_idx: int) -> List[ActorWrapper]:
+        """
+            Parked pool actors, to be appended to an env_cfg of first_idx actors
+        """
+        sizes = [("sphere", [r]) for r in self.sphere_radii] + [("box", size) for size in self.box_sizes]
+        actors = []
+        for o_type, size in sizes:
+            for _ in range(self.slots_per_size):
+                actor_idx = first_idx + len(actors)
+                actors.append(
+                    ActorWrapper(
+                        type=o_type,
+                        name=f"pool_{actor_idx}",
+                        init_pos=self.park_state(actor_idx)[:3],
+                        size=list(size),
+                        fixed=True,
+                    )
+                )
+                self.slots[actor_idx] = (o_type, list(size))
+                self.free.add(actor_idx)
+        return actors
+
+    def acquire(self, o_type: str, size: List[float]) -> Optional[int]:
+        """
+            Free slot of o_type closest in size to size within tolerance, None if there is none
+        """
+        best, best_error = None, self.tolerance
+        for actor_idx in self.free:
+            slot_type, slot_size = self.slots[actor_idx]
+            if slot_type != o_type:
+                continue
+            error = max(abs(a - b) / max(abs(b), 1e-9) for a, b in zip(slot_size, size))
+            if error <= best_error and (best is None or error < best_error or actor_idx < best):
+                best, best_error = actor_idx, error
+        if best is not None:
+            self.free.remove(best)
+        return best
+
+    def release(self, actor: ActorWrapper, actor_idx: int):
+        """
+            Parks the actor at actor_idx and makes it a free slot of its size
+        """
+        actor.name = f"pool_{actor_idx}"
+        actor.init_pos = self.park_state(actor_idx)[:3]
+        self.slots[actor_idx] = (actor.type, list(actor.size))
+        self.free.add(actor_idx)
+        self._parked.append(actor_idx)
+        self.counts["released"] += 1
+
+    def pop_parked(self) -> List[int]:
+        parked, self._parked = self._parked, []
+        return parked
+
+    def serve(self, env_cfg: List[ActorWrapper], actor_index_by_name: Dict[str, int], name: str, o_type: str, size):
+        """
+            Env_cfg index of the actor of obstacle name with the requested size, and whether the simulator has to
+            restart because a new actor was appended. Updates env_cfg and actor_index_by_name.
+        """
+        actor_idx = actor_index_by_name.get(name)
+        if actor_idx is not None and list(self.requested.get(name, env_cfg[actor_idx].size)) == list(size):
+            return actor_idx, False
+
+        slot = self.acquire(o_type, size)
+        restart = slot is None
+        if restart:
+            env_cfg.append(ActorWrapper(type=o_type, name=name, handle=None, size=list(size), fixed=True))
+            slot = len(env_cfg) - 1
+            self.counts["exhausted"] += 1
+        else:
+            del actor_index_by_name[env_cfg[slot].name]
+            env_cfg[slot].name = name
+            self.counts["served"] += 1
+
+        if actor_idx is not None:
+            self.release(env_cfg[actor_idx], actor_idx)
+            actor_index_by_name[env_cfg[actor_idx].name] = actor_idx
+        actor_index_by_name[name] = slot
+        self.requested[name] = list(size)
+        return slot, restart
+
+    def stats(self):
+        """
+            Returns {served, released, exhausted} counts and the number of slots and free slots
+        """
+        return {**self.counts, "slots": len(self.slots), "free": len(self.free)}
+
+
+@runtime_checkable
+class SimBackend(Protocol):
+    """
+    Batched simulator as used by MPPIisaacPlanner and the objectives, every env simulates one rollout.
+
+    Tensor layouts, with E = num_envs:
+        root_state:       E x num_actors x 13, per actor in env_cfg order position (3), quaternion xyzw (4),
+                          linear velocity (3) and angular velocity (3)
+        dof_state:        E x (2 * num_dofs), position and velocity of every dof interleaved, robots in env_cfg order
+        rigid_body_state: E x num_bodies x 13, same layout as root_state per rigid body
+        net_cf:           (E * num_bodies) x 3, net contact force on every rigid body, env major
+
+    The state tensors are refreshed lazily, on their first access after a step, except the ones named in
+    require_tensors(), which are refreshed right after every step.
+
+    IsaacGymWrapper implements it with IsaacGym, TorchSimWrapper is a pure torch kinematic reference.
+    """
+
+    env_cfg: List[ActorWrapper]
+    actor_index_by_name: Dict[str, int]
+    num_envs: int
+    num_bodies: int
+    root_state: torch.Tensor
+    dof_state: torch.Tensor
+    rigid_body_state: torch.Tensor
+    net_cf: torch.Tensor
+
+    def apply_robot_cmd_velocity(self, u_desired: torch.Tensor) -> None:
+        ...
+
+    def step(self) -> None:
+        ...
+
+    def require_tensors(self, names: List[str]) -> None:
+        ...
+
+    def save_root_state(self) -> None:
+        ...
+
+    def reset_root_state(self) -> None:
+        ...
+
+    def reset_robot_state(self, q, qdot) -> None:
+        ...
+
+    def set_dof_state_tensor(self, state: torch.Tensor) -> None:
+        ...
+
+    def set_root_state_tensor(self, state: torch.Tensor) -> None:
+        ...
+
+    def set_actor_root_states(self, states: torch.Tensor, actor_indices) -> None:
+        ...
+
+    def update_root_state_tensor_by_obstacles(self, obstacles) -> None:
+        ...
+
+    def update_root_state_tensor_by_obstacles_tensor(self, obst_tensor) -> None:
+        ...
+
+    def add_to_envs(self, additions) -> None:
+        ...
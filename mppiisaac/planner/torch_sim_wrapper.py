@@ -0,0 +1,359 @@
+import torch
+from typing import List
+
+from mppiisaac.dynamics.analytic import DifferentialDrive, model_for_actor
+from mppiisaac.planner.sim_backend import IsaacGymConfig, ActorWrapper, ObstaclePool, RobotDofLayout
+
+
+def _yaw_to_quat(yaw):
+    zeros = torch.zeros_like(yaw)
+    return torch.stack((zeros, zeros, torch.sin(yaw / 2), torch.cos(yaw / 2)), dim=-1)
+
+
+def _quat_to_yaw(quat):
+    x, y, z, w = quat.unbind(-1)
+    return torch.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+
+
+class TorchSimWrapper:
+    """
+    Pure torch kinematic reference implementation of the SimBackend of IsaacGymWrapper, with the same tensor layouts,
+    so objectives run unchanged on machines without IsaacGym and the cost of the simulator can be measured apart from
+    the planner.
+
+    Robots are the velocity controlled analytic models of model_for_actor: joint robots integrate their dofs and
+    differential drive robots move their root and spin their wheels, their only dofs. Spheres and boxes are
+    kinematic, the ones that are not fixed keep moving with their root velocity. Every actor is a single rigid body
+    (there are no links, so no end-effector). Robots collide as spheres of contact_radius at their planar base
+    position with the spheres and axis aligned boxes with collision, the contact forces are a penalty of
+    contact_stiffness times the penetration depth.
+    """
+
+    def __init__(
+        self,
+        cfg: IsaacGymConfig,
+        actors: List[ActorWrapper],
+        init_positions: List[List[float]],
+        num_envs: int,
+        viewer: bool = False,
+        device: str = "cpu",
+        contact_radius: float = 0.2,
+        contact_stiffness: float = 1000.0,
+    ):
+        self.env_cfg = actors
+
+        assert len([a for a in self.env_cfg if a.type == "robot"]) == len(
+            init_positions
+        )
+
+        for init_pos, actor_cfg in zip(init_positions, self.env_cfg):
+            actor_cfg.init_pos = init_pos
+
+        self.cfg = cfg
+        self.num_envs = num_envs
+        self.device = device
+        self.contact_radius = contact_radius
+        self.contact_stiffness = contact_stiffness
+        self.viewer = None
+        self.required_tensors = []
+
+        # Parked obstacle actors for obstacles that appear or change size without a restart
+        self.obstacle_pool = ObstaclePool.from_config(cfg)
+        if self.obstacle_pool is not None:
+            self.env_cfg += self.obstacle_pool.make_actors(len(self.env_cfg))
+
+        self.start_sim()
+
+    def start_sim(self):
+        tensor_args = {"device": self.device, "dtype": torch.float32}
+        E, A = self.num_envs, len(self.env_cfg)
+
+        # Robot models and their slices of the dof state and of the commands
+        self.robots = []
+        dof_offset = 0
+        for actor_idx, actor in enumerate(self.env_cfg):
+            actor.handle = actor_idx
+            if actor.type != "robot":
+                continue
+            model = model_for_actor(actor, self.cfg.dt)
+            dof_count = int(actor.wheel_count) if isinstance(model, DifferentialDrive) else model.nu
+            self.robots.append((actor_idx, model, dof_offset, dof_count))
+            dof_offset += dof_count
+        self.num_dofs = dof_offset
+        self.robot_dof_layout = RobotDofLayout(
+            [(self.env_cfg[actor_idx], dof_count) for actor_idx, _, _, dof_count in self.robots], device=self.device
+        )
+        self.base_indices = [self.robots[i][0] for i in self.robot_dof_layout.base_robots]
+        self.u_desired = torch.zeros((E, sum(m.nu for _, m, _, _ in self.robots)), **tensor_args)
+
+        self.root_state = torch.zeros((E, A, 13), **tensor_args)
+        for actor_idx, actor in enumerate(self.env_cfg):
+            self.root_state[:, actor_idx, 0:3] = torch.tensor(actor.init_pos, **tensor_args)
+            self.root_state[:, actor_idx, 3:7] = torch.tensor(actor.init_ori, **tensor_args)
+        self.saved_root_state = None
+        self.dof_state = torch.zeros((E, 2 * self.num_dofs), **tensor_args)
+
+        # One rigid body per actor
+        self.num_bodies = A
+        self._rigid_body_state = self.root_state.clone()
+        self._net_cf = torch.zeros((E * A, 3), **tensor_args)
+
+        self.ee_link_present = False
+        self.record_rollouts = False
+        self.ee_positions_buffer = []
+
+        self.actor_index_by_name = {a.name: i for i, a in enumerate(self.env_cfg)}
+
+        # helpfull slices
+        self.robot_indices = torch.tensor([i for i, a in enumerate(self.env_cfg) if a.type == "robot"], device=self.device)
+        self._update_obstacle_indices()
+        self.moving_indices = torch.tensor(
+            [i for i, a in enumerate(self.env_cfg) if a.type in ["sphere", "box"] and not a.fixed], device=self.device, dtype=torch.long
+        )
+
+        # Collision geometry, spheres have their radius as first half extent
+        colliders = [i for i, a in enumerate(self.env_cfg) if a.type in ["sphere", "box"] and a.collision]
+        self.collider_indices = torch.tensor(colliders, device=self.device, dtype=torch.long)
+        self.collider_is_box = torch.tensor([self.env_cfg[i].type == "box" for i in colliders], device=self.device)
+        self.collider_half_extents = torch.tensor(
+            [
+                [s / 2 for s in self.env_cfg[i].size[:2]] if self.env_cfg[i].type == "box" else [self.env_cfg[i].size[0]] * 2
+                for i in colliders
+            ],
+            **tensor_args,
+        ).view(-1, 2)
+
+        self._invalidate()
+
+    def _update_obstacle_indices(self):
+        parked = self.obstacle_pool.free if self.obstacle_pool is not None else set()
+        self.obstacle_indices = torch.tensor(
+            [i for i, a in enumerate(self.env_cfg) if a.type in ["sphere", "box"] and i not in parked],
+            dtype=torch.long,
+            device=self.device,
+        )
+
+    @property
+    def robot_positions(self):
+        return torch.index_select(self.root_state, 1, self.robot_indices)[:, :, 0:3]
+
+    @property
+    def robot_velocities(self):
+        return torch.index_select(self.root_state, 1, self.robot_indices)[:, :, 7:10]
+
+    @property
+    def obstacle_positions(self):
+        return torch.index_select(self.root_state, 1, self.obstacle_indices)[:, :, 0:3]
+
+    @property
+    def obstacle_velocities(self):
+        return torch.index_select(self.root_state, 1, self.obstacle_indices)[:, :, 7:10]
+
+    def stop_sim(self):
+        pass
+
+    def add_to_envs(self, additions):
+        for a in additions:
+            self.env_cfg.append(ActorWrapper(**a))
+        self.start_sim()
+
+    def set_dof_state_tensor(self, state):
+        self.dof_state[:] = state.view(self.dof_state.shape)
+        self._invalidate()
+
+    def set_root_state_tensor(self, state):
+        if state is not self.root_state:
+            self.root_state[:] = state.view(self.root_state.shape)
+        self._invalidate()
+
+    def apply_robot_cmd_velocity(self, u_desired):
+        self.u_desired = u_desired.to(self.root_state)
+
+    def _base_state(self, actor_idx):
+        root = self.root_state[:, actor_idx]
+        yaw = _quat_to_yaw(root[:, 3:7])
+        return torch.stack((root[:, 0], root[:, 7], root[:, 1], root[:, 8], yaw, root[:, 12]), dim=1)
+
+    def step(self):
+        dt = self.cfg.dt
+        u_idx = 0
+        for actor_idx, model, dof_offset, dof_count in self.robots:
+            u = self.u_desired[:, u_idx : u_idx + model.nu]
+            u_idx += model.nu
+            dofs = slice(2 * dof_offset, 2 * (dof_offset + dof_count))
+
+            if isinstance(model, DifferentialDrive):
+                base, u = model(self._base_state(actor_idx), u)
+                root = self.root_state[:, actor_idx]
+                root[:, 0:2] = base[:, [0, 2]]
+                root[:, 3:7] = _yaw_to_quat(base[:, 4])
+                root[:, 7:9] = base[:, [1, 3]]
+                root[:, 12] = base[:, 5]
+
+                wheels = self.dof_state[:, dofs]
+                wheel_velocities = model.wheel_velocities(u)
+                wheels[:, 0::2] += dt * wheel_velocities
+                wheels[:, 1::2] = wheel_velocities
+            else:
+                self.dof_state[:, dofs], _ = model(self.dof_state[:, dofs], u)
+
+        if len(self.moving_indices):
+            self.root_state[:, self.moving_indices, 0:3] += dt * self.root_state[:, self.moving_indices, 7:10]
+
+        self._invalidate()
+
+    @property
+    def rigid_body_state(self):
+        if self._stale:
+            self._refresh()
+        return self._rigid_body_state
+
+    @property
+    def net_cf(self):
+        if self._stale:
+            self._refresh()
+        return self._net_cf
+
+    def require_tensors(self, names):
+        """
+        Same as IsaacGymWrapper.require_tensors, only rigid_body_state and net_cf are derived, from the root and dof
+        states, the others are always current
+        """
+        assert set(names) <= {"root_state", "dof_state", "rigid_body_state", "net_cf"}, f"unknown state tensors in {names}"
+        self.required_tensors = list(names)
+
+    def _invalidate(self):
+        """
+            Rigid body states and contact forces are recomputed on their next access, or right away if required
+        """
+        self._stale = True
+        if {"rigid_body_state", "net_cf"} & set(self.required_tensors):
+            self._refresh()
+
+    def _refresh(self):
+        """
+            Rigid body states and contact forces from the root and dof states
+        """
+        self._stale = False
+        self._rigid_body_state[:] = self.root_state
+
+        # Planar joint robots (x, y, theta joints) move their body with the first dofs
+        for actor_idx, model, dof_offset, dof_count in self.robots:
+            if getattr(model, "joint_types", [])[:2] == ["prismatic", "prismatic"]:
+                dofs = self.dof_state[:, 2 * dof_offset :]
+                body = self._rigid_body_state[:, actor_idx]
+                body[:, 0:2] += dofs[:, [0, 2]]
+                body[:, 7:9] = dofs[:, [1, 3]]
+                if dof_count > 2 and model.joint_types[2] == "revolute":
+                    body[:, 3:7] = _yaw_to_quat(dofs[:, 4])
+                    body[:, 12] = dofs[:, 5]
+
+        net_cf = self._net_cf.view(self.num_envs, self.num_bodies, 3)
+        net_cf.zero_()
+        if len(self.collider_indices) == 0:
+            return
+
+        # Closest point of every collider to every robot, penalty force along the contact normal
+        centers = self._rigid_body_state[:, self.collider_indices, 0:2]
+        for actor_idx in self.robot_indices.tolist():
+            p = self._rigid_body_state[:, actor_idx, 0:2].unsqueeze(1)
+            closest = torch.max(torch.min(p, centers + self.collider_half_extents), centers - self.collider_half_extents)
+            offset = torch.where(self.collider_is_box.view(1, -1, 1), closest - p, centers - p)
+            distance = torch.linalg.norm(offset, dim=2)
+            gap = torch.where(self.collider_is_box, distance, distance - self.collider_half_extents[:, 0])
+            depth = torch.clamp(self.contact_radius - gap, min=0)
+
+            normal = offset / torch.clamp(distance, min=1e-9).unsqueeze(2)
+            force = self.contact_stiffness * depth.unsqueeze(2) * normal
+            net_cf[:, self.collider_indices, 0:2] += force
+            net_cf[:, actor_idx, 0:2] -= torch.sum(force, dim=1)
+
+    def set_root_state_tensor_by_actor_idx(self, state_tensor, idx):
+        self.root_state[:, idx] = state_tensor
+        self._invalidate()
+
+    def set_actor_root_states(self, states, actor_indices):
+        self.root_state[:, torch.as_tensor(actor_indices, dtype=torch.long, device=self.device)] = states.to(self.root_state)
+        self._invalidate()
+
+    def save_root_state(self):
+        self.saved_root_state = self.root_state.clone()
+
+    def get_saved_root_state(self):
+        return self.saved_root_state
+
+    def reset_root_state(self):
+        if self.saved_root_state is not None:
+            self.root_state[:] = self.saved_root_state
+            self._invalidate()
+
+    def set_state_tensor_by_pos_vel(self, handle, pos, vel):
+        self.root_state[:, handle, 0:2] = torch.tensor([float(p) for p in pos[:2]], device=self.device)
+        self.root_state[:, handle, 3:7] = _yaw_to_quat(torch.tensor(float(pos[2]), device=self.device))
+        self.root_state[:, handle, 7:9] = torch.tensor([float(v) for v in vel[:2]], device=self.device)
+        self.root_state[:, handle, 12] = float(vel[2])
+
+    def reset_robot_state(self, q, qdot):
+        """
+        Same convention as IsaacGymWrapper.reset_robot_state, differential drive robots take their base pose
+        x, y, yaw instead of their wheels
+        """
+        base_q, base_qdot = self.robot_dof_layout.reset_state(q, qdot, out=self.dof_state)
+        orientation = _yaw_to_quat(base_q[:, 2])
+        for i, actor_idx in enumerate(self.base_indices):
+            self.root_state[:, actor_idx, 0:2] = base_q[i, :2]
+            self.root_state[:, actor_idx, 3:7] = orientation[i]
+            self.root_state[:, actor_idx, 7:9] = base_qdot[i, :2]
+            self.root_state[:, actor_idx, 12] = base_qdot[i, 2]
+        self._invalidate()
+
+    def update_root_state_tensor_by_obstacles(self, obstacles):
+        """
+        Note: obstacles param should be a dict of obstacles with a position, velocity and size each, added as spheres.
+        New obstacles or size changes only rebuild the tensors, there is no simulator to restart.
+        """
+        obst_indices, obst_states = [], []
+        env_cfg_changed = False
+
+        for i, obst in enumerate(list(obstacles.values())):
+            name = f"sphere{i}"
+            obst_idx = self.actor_index_by_name.get(name)
+            if self.obstacle_pool is not None:
+                obst_idx, restart = self.obstacle_pool.serve(
+                    self.env_cfg, self.actor_index_by_name, name, "sphere", obst["size"]
+                )
+                env_cfg_changed |= restart
+            elif obst_idx is None:
+                self.env_cfg.append(ActorWrapper(type="sphere", name=name, handle=None, size=obst["size"], fixed=True))
+                obst_idx = self.actor_index_by_name[name] = len(self.env_cfg) - 1
+                env_cfg_changed = True
+            elif list(obst["size"]) != list(self.env_cfg[obst_idx].size):
+                self.env_cfg[obst_idx].size = obst["size"]
+                env_cfg_changed = True
+            obst_indices.append(obst_idx)
+            obst_states.append([*obst["position"], 0, 0, 0, 1, *obst["velocity"], 0, 0, 0])
+
+        if self.obstacle_pool is not None:
+            for actor_idx in self.obstacle_pool.pop_parked():
+                obst_indices.append(actor_idx)
+                obst_states.append(self.obstacle_pool.park_state(actor_idx))
+            self._update_obstacle_indices()
+
+        if env_cfg_changed:
+            root_state, dof_state = self.root_state, self.dof_state
+            self.start_sim()
+            self.root_state[:, : root_state.shape[1]] = root_state
+            self.dof_state[:] = dof_state
+
+        if obst_indices:
+            self.set_actor_root_states(torch.tensor(obst_states, device=self.device), obst_indices)
+        else:
+            self._invalidate()
+
+    def update_root_state_tensor_by_obstacles_tensor(self, obst_tensor):
+        moving = [i for i in range(len(obst_tensor)) if not self.env_cfg[i + 3].fixed]
+        if moving:
+            states = torch.stack([torch.as_tensor(obst_tensor[i], device=self.device) for i in moving])
+            self.set_actor_root_states(states, [i + 3 for i in moving])
+        else:
+            self._invalidate()
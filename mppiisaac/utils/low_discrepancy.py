@@ -0,0 +1,155 @@
+import math
+from abc import ABC, abstractmethod
+
+import torch
+
+_MASK_32 = 0xFFFFFFFF
+
+
+def first_primes(num: int):
+    """
+        First num prime numbers, sieve of Eratosthenes up to the upper bound n (ln n + ln ln n) of the n-th prime
+    """
+    if num < 1:
+        return []
+    limit = 15 if num < 6 else int(num * (math.log(num) + math.log(math.log(num)))) + 1
+    sieve = torch.ones(limit + 1, dtype=torch.bool)
+    sieve[:2] = False
+    for p in range(2, int(limit ** 0.5) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = False
+    return torch.nonzero(sieve).view(-1)[:num].tolist()
+
+
+def _reverse_bits_32(x):
+    x = ((x >> 1) & 0x55555555) | ((x & 0x55555555) << 1)
+    x = ((x >> 2) & 0x33333333) | ((x & 0x33333333) << 2)
+    x = ((x >> 4) & 0x0F0F0F0F) | ((x & 0x0F0F0F0F) << 4)
+    x = ((x >> 8) & 0x00FF00FF) | ((x & 0x00FF00FF) << 8)
+    return ((x >> 16) & 0x0000FFFF) | ((x & 0x0000FFFF) << 16)
+
+
+def owen_scramble(x, seed):
+    """
+        Nested uniform (Owen) scrambling of 32 bit integers x with the hash based permutation of Burley,
+        'Practical Hash-based Owen Scrambling', JCGT 2020. seed broadcasts against x, e.g. one seed per dimension
+    """
+    x = _reverse_bits_32(x)
+    x = (x + seed) & _MASK_32
+    # int64 products wrap around, their low 32 bits are the 32 bit products
+    for c in (0x6C50B47C, 0xB82F1E52, 0xC7AFE638, 0x8D22F6E6):
+        x ^= (x * c) & _MASK_32
+    return _reverse_bits_32(x)
+
+
+class _LowDiscrepancySequence(ABC):
+    def __init__(self, ndims: int, device="cpu", dtype=torch.float32):
+        self.ndims = ndims
+        self.device = device
+        self.dtype = dtype
+        self.index = 0
+
+    @abstractmethod
+    def _points(self, start: int, n: int):
+        """
+            Points start up to start + n of the sequence, n x ndims in [0, 1)
+        """
+
+    def draw(self, n: int):
+        """
+            Next n x ndims points in [0, 1)
+        """
+        points = self._points(self.index, n)
+        self.index += n
+        return points.to(device=self.device, dtype=self.dtype)
+
+    def draw_gaussian(self, n: int):
+        """
+            Next n x ndims points mapped to standard normal samples by the inverse cdf
+        """
+        u = self._points(self.index, n).clamp(1e-10, 1.0 - 1e-10)
+        self.index += n
+        return (math.sqrt(2.0) * torch.erfinv(2 * u - 1)).to(device=self.device, dtype=self.dtype)
+
+    def fast_forward(self, n: int):
+        """
+            Skips the next n points
+        """
+        self.index += n
+        return self
+
+    def reset(self):
+        self.index = 0
+        return self
+
+
+class ScrambledHalton(_LowDiscrepancySequence):
+    """
+        Halton sequence with one random digit permutation per dimension (generalized Halton), computed on device.
+
+        Dimension d uses the d-th prime as base, the digits of the index are permuted by a permutation of the base
+        that keeps 0 fixed, so the sequence keeps its stratification. Point i of the sequence is the radical inverse
+        of i + 1, the all zero point is skipped. Without scramble this is the plain Halton sequence.
+    """
+
+    def __init__(self, ndims: int, scramble: bool = True, seed: int = 0, device="cpu", dtype=torch.float32):
+        super().__init__(ndims, device, dtype)
+        self.bases_cpu = torch.tensor(first_primes(ndims), dtype=torch.int64)
+        self.bases = self.bases_cpu.to(device)
+
+        generator = torch.Generator().manual_seed(seed)
+        perms = []
+        for base in self.bases.tolist():
+            perm = torch.arange(base)
+            if scramble:
+                perm[1:] = 1 + torch.randperm(base - 1, generator=generator)
+            perms.append(perm)
+        # Digit permutations of all dimensions concatenated, offsets index the permutation of every dimension
+        self.perms = torch.cat(perms).to(device)
+        self.offsets = (torch.cumsum(self.bases, 0) - self.bases)
+
+    def _points(self, start: int, n: int):
+        idx = torch.arange(start + 1, start + n + 1, dtype=torch.int64, device=self.bases.device).view(-1, 1)
+        points = torch.zeros((n, self.ndims), dtype=torch.float64, device=self.bases.device)
+        inv_bases = 1.0 / self.bases.to(torch.float64)
+
+        # One vectorized step per digit. The bases are increasing, so the dimensions that still have non zero
+        # digits are a shrinking prefix: large bases only need one or two steps
+        scale = inv_bases.clone()
+        remainder = idx.expand(-1, self.ndims)
+        power, m = 0, self.ndims
+        while m > 0:
+            quotient = remainder[:, :m] // self.bases[:m]
+            digits = remainder[:, :m] - quotient * self.bases[:m]
+            points[:, :m] += self.perms[self.offsets[:m] + digits] * scale[:m]
+            remainder = quotient
+            scale = scale * inv_bases
+            # Digit power can only be non zero for bases with base^power <= largest index
+            power += 1
+            m = int(torch.sum(self.bases_cpu.to(torch.float64) ** power <= start + n))
+        return points
+
+
+class ScrambledSobol(_LowDiscrepancySequence):
+    """
+        Sobol sequence (direction numbers of torch.quasirandom.SobolEngine) with Owen scrambling, one hash seed per
+        dimension. Without scramble this is the plain Sobol sequence starting at the zero point.
+    """
+
+    def __init__(self, ndims: int, scramble: bool = True, seed: int = 0, device="cpu", dtype=torch.float32):
+        super().__init__(ndims, device, dtype)
+        self.scramble = scramble
+        self.engine = torch.quasirandom.SobolEngine(ndims, scramble=False)
+        generator = torch.Generator().manual_seed(seed)
+        self.seeds = torch.randint(0, 2 ** 32, (ndims,), generator=generator, dtype=torch.int64).to(device)
+
+    def _points(self, start: int, n: int):
+        if self.engine.num_generated > start:
+            self.engine.reset()
+        self.engine.fast_forward(start - self.engine.num_generated)
+        # SobolEngine points are multiples of 2^-30, exact in float64
+        points = self.engine.draw(n, dtype=torch.float64).to(self.seeds.device)
+        if not self.scramble:
+            return points
+        x = torch.round(points * 2.0 ** 32).to(torch.int64)
+        return (owen_scramble(x, self.seeds).to(torch.float64) + 0.5) / 2.0 ** 32
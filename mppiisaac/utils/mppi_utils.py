@@ -21,10 +21,16 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.#
 
+import functools
+import warnings
 import numpy as np
 import torch
 from torch.distributions.multivariate_normal import MultivariateNormal
-import ghalton
+from mppiisaac.utils.low_discrepancy import ScrambledHalton, first_primes
+try:
+    import ghalton
+except ImportError:
+    ghalton = None
 
 def scale_ctrl(ctrl, action_lows, action_highs, squash_fn='clamp'):
     if len(ctrl.shape) == 1:
@@ -43,28 +49,332 @@ def scale_ctrl(ctrl, action_lows, action_highs, squash_fn='clamp'):
         return ctrl
     return act_mid_range.unsqueeze(0) + ctrl * act_half_range.unsqueeze(0)
 
+def perturb_actions(mean_action, delta, scale_tril, action_lows, action_highs, squash_fn='clamp'):
+    """
+        Shift and scale the (K x T x nu) noise around the (T x nu) mean and squash the result within the action bounds
+    """
+    act_seq = mean_action + delta * scale_tril
+    return scale_ctrl(act_seq, action_lows, action_highs, squash_fn=squash_fn)
+
+def exp_util(costs, discounts, beta):
+    """
+        Weights (... x K) from the exponential utility of the (... x K x T) cost sequences at inverse temperature
+        1 / beta, the costs are overwritten with their discounted cost to go (see discounted_cost_to_go_). Also
+        returns eta, the sum of the unnormalized weights which tells how many significant samples we have, the total
+        costs relative to the best sample and the cost of the best sample. Leading dimensions are independent
+        problems.
+    """
+    traj_costs = discounted_cost_to_go_(costs, discounts)[..., 0]
+    min_costs = torch.min(traj_costs, dim=-1, keepdim=True).values
+    total_costs = traj_costs - min_costs
+    exp_ = torch.exp((-1.0 / beta.unsqueeze(-1)) * total_costs)
+    eta = torch.sum(exp_, dim=-1)
+    w = exp_ / eta.unsqueeze(-1)
+    return w, eta, total_costs, min_costs.squeeze(-1)
+
+def adapt_beta(beta, eta, eta_u_bound, eta_l_bound, beta_lm, beta_um):
+    """
+        Shrink beta when more than eta_u_bound samples are significant, grow it when fewer than eta_l_bound are.
+        Stays on device, beta and eta are tensors.
+    """
+    return torch.where(
+        eta > eta_u_bound, beta * beta_lm, torch.where(eta < eta_l_bound, beta * beta_um, beta)
+    )
+
+def mppi_update(costs, actions, mean_action, cov_action, beta, discounts, step_size_mean=1.0, step_size_cov=0.7,
+                kappa=0.005, update_cov=False, eta_u_bound=10, eta_l_bound=5, beta_lm=0.9, beta_um=1.2):
+    """
+        One MPPI distribution update from K rollouts without host synchronization: weights, beta adaptation,
+        mean (T x nu) and diagonal covariance (nu) update. Returns a dict with the new moments, the weights, their
+        effective sample size, the weighted cost of the samples, the best sample and the deviation of every sample
+        from the new mean. The costs are scanned in place into their cost to go with the T - 1 per-step discounts,
+        pass a buffer that may be overwritten.
+
+        All inputs may have the same leading problem dimensions, e.g. costs B x K x T, actions B x K x T x nu,
+        mean_action B x T x nu, cov_action B x nu and beta B, to update independent problems at once.
+    """
+    w, eta, total_costs, min_costs = exp_util(costs, discounts, beta)
+    beta = adapt_beta(beta, eta, eta_u_bound, eta_l_bound, beta_lm, beta_um)
+    w_seq = w.unsqueeze(-1).unsqueeze(-1)
+
+    best_idx = torch.argmax(w, dim=-1)
+    best_traj = torch.take_along_dim(actions, best_idx[..., None, None, None], dim=-3).squeeze(-3)
+    new_mean = torch.sum(w_seq * actions, dim=-3)
+    mean_action = (1.0 - step_size_mean) * mean_action + step_size_mean * new_mean
+
+    # Reduced precision actions keep their deviations in the same precision
+    delta = (actions - mean_action.unsqueeze(-3)).to(actions.dtype)
+
+    if update_cov:
+        cov_update = torch.mean(torch.sum(w_seq * delta ** 2, dim=-3), dim=-2)
+        cov_action = (1.0 - step_size_cov) * cov_action + step_size_cov * cov_update + kappa
+
+    return {
+        'w': w,
+        'eta': eta,
+        'ess': 1.0 / torch.sum(w ** 2, dim=-1),
+        'beta': beta,
+        'total_costs': total_costs,
+        'weighted_cost': min_costs + torch.sum(w * total_costs, dim=-1),
+        'best_idx': best_idx,
+        'best_traj': best_traj,
+        'mean_action': mean_action,
+        'cov_action': cov_action,
+        'delta': delta,
+    }
+
+class OnlineWeightedMean(object):
+    """
+        Running mean and mean square of actions and weighted mean cost, with weights exp(-cost / beta), accumulated
+        over chunks of samples with a running log-sum-exp, so the result is exact without holding all samples at once.
+        sum_exp equals eta of exp_util, the sum of the weights relative to the best sample.
+    """
+
+    def __init__(self, beta):
+        self.beta = beta
+        self.max_logit = None
+        self.sum_exp = None
+        self.sum_exp_sq = None
+        self.sum_costs = None
+        self.sum_actions = None
+        self.sum_actions_sq = None
+        self.best_cost = None
+        self.best_traj = None
+
+    def add(self, traj_costs, actions):
+        """
+            Add the (k) trajectory costs and (k x T x nu) actions of a chunk of samples
+        """
+        logits = (-1.0 / self.beta) * traj_costs
+        chunk_max = torch.max(logits)
+        chunk_best = torch.argmin(traj_costs)
+        chunk_best_traj = torch.index_select(actions, 0, chunk_best.view(1)).squeeze(0).to(traj_costs.dtype)
+
+        if self.max_logit is None:
+            max_logit = chunk_max
+            scale = torch.zeros_like(chunk_max)
+            self.sum_exp, self.sum_exp_sq, self.sum_costs = 0.0, 0.0, 0.0
+            self.sum_actions, self.sum_actions_sq = 0.0, 0.0
+            self.best_cost, self.best_traj = traj_costs[chunk_best], chunk_best_traj
+        else:
+            max_logit = torch.maximum(self.max_logit, chunk_max)
+            scale = torch.exp(self.max_logit - max_logit)
+            improved = traj_costs[chunk_best] < self.best_cost
+            self.best_cost = torch.where(improved, traj_costs[chunk_best], self.best_cost)
+            self.best_traj = torch.where(improved, chunk_best_traj, self.best_traj)
+
+        exp_ = torch.exp(logits - max_logit)
+        exp_seq = exp_.view(-1, 1, 1)
+        self.sum_exp = scale * self.sum_exp + torch.sum(exp_)
+        self.sum_exp_sq = scale ** 2 * self.sum_exp_sq + torch.sum(exp_ ** 2)
+        self.sum_costs = scale * self.sum_costs + torch.sum(exp_ * traj_costs)
+        self.sum_actions = scale * self.sum_actions + torch.sum(exp_seq * actions, dim=0)
+        self.sum_actions_sq = scale * self.sum_actions_sq + torch.sum(exp_seq * actions ** 2, dim=0)
+        self.max_logit = max_logit
+
+    @property
+    def mean(self):
+        return self.sum_actions / self.sum_exp
+
+    @property
+    def mean_sq(self):
+        return self.sum_actions_sq / self.sum_exp
+
+    @property
+    def weighted_cost(self):
+        return self.sum_costs / self.sum_exp
+
+    @property
+    def ess(self):
+        return self.sum_exp ** 2 / self.sum_exp_sq
+
+class SuccessiveHalving(object):
+    """
+        Successive halving of K rollouts over the horizon. After every segment of steps the worst fraction of the
+        surviving samples by partial discounted cost is dropped, only the survivors are simulated further. Protected
+        samples (e.g. the null action) are never dropped and at least min_samples survive. Samples flagged as
+        terminated (see RolloutTermination) stop being simulated right away.
+
+        finalize() gives the dropped samples a conservative cost for the steps they were not simulated: the highest
+        cost of any sample simulated in that step. A dropped sample had a partial cost at least as high as every
+        unprotected survivor, so its cost to go stays at least as high as theirs and the weights stay well defined.
+        Terminated samples keep their frozen cost instead. States are held at the last simulated state.
+    """
+
+    def __init__(self, segment: int, fraction: float, gamma_seq, min_samples: int = 2):
+        assert segment > 0 and 0.0 <= fraction < 1.0
+        self.segment = segment
+        self.fraction = fraction
+        self.gamma_seq = gamma_seq.reshape(-1)
+        self.min_samples = min_samples
+        self.alive = None
+
+    def reset(self, K: int, protected=()):
+        """
+            Start pruning a rollout of K samples, all of them alive
+        """
+        device = self.gamma_seq.device
+        self.K = K
+        self.alive = torch.arange(K, device=device)
+        self.alive_mask = torch.ones(K, dtype=torch.bool, device=device)
+        self.protected = torch.zeros(K, dtype=torch.bool, device=device)
+        self.protected[[i for i in protected if i is not None]] = True
+        self.partial_costs = torch.zeros(K, dtype=self.gamma_seq.dtype, device=device)
+        self.pruned_at = torch.full((K,), self.gamma_seq.shape[0], dtype=torch.long, device=device)
+        self.pruned = False
+
+    def step(self, t: int, costs, terminated=None):
+        """
+            Add the costs of the alive samples at step t and drop the ones in the K terminated mask. At the end of a
+            segment the worst samples are dropped. If samples were dropped, a mask over the previously alive samples
+            that selects the survivors is returned, otherwise None
+        """
+        self.partial_costs[self.alive] += self.gamma_seq[t] * costs.to(self.partial_costs.dtype)
+        changed = False
+
+        if terminated is not None:
+            stopped = self.alive[terminated[self.alive]]
+            if stopped.shape[0] > 0:
+                self.alive_mask[stopped] = False
+                self.pruned_at[stopped] = t + 1
+                changed = True
+
+        if (t + 1) % self.segment == 0 and t + 1 < self.gamma_seq.shape[0]:
+            alive = self.alive[self.alive_mask[self.alive]]
+            candidates = alive[~self.protected[alive]]
+            num_drop = min(int(self.fraction * candidates.shape[0]), alive.shape[0] - self.min_samples)
+            if num_drop > 0:
+                dropped = candidates[torch.topk(self.partial_costs[candidates], num_drop).indices]
+                self.alive_mask[dropped] = False
+                self.pruned_at[dropped] = t + 1
+                changed = True
+
+        if not changed:
+            return None
+        keep = self.alive_mask[self.alive]
+        self.alive = self.alive[keep]
+        self.pruned = True
+        return keep
+
+    def finalize(self, costs, states=None, terminated=None, frozen_costs=None):
+        """
+            Fill the K x T costs and K x T x nx states of the dropped samples in place, terminated samples get their
+            K frozen_costs
+        """
+        if not self.pruned:
+            return
+        T = costs.shape[1]
+        steps = torch.arange(T, device=costs.device)
+        simulated = steps < self.pruned_at.unsqueeze(1)
+        step_max = torch.where(simulated, costs, torch.full_like(costs, -float('inf'))).amax(dim=0)
+        fill = step_max.expand_as(costs)
+        if terminated is not None:
+            fill = torch.where(terminated.unsqueeze(1), frozen_costs.to(costs.dtype).unsqueeze(1), fill)
+        costs.copy_(torch.where(simulated, costs, fill))
+
+        if states is not None:
+            last = torch.minimum(steps, self.pruned_at.unsqueeze(1) - 1)
+            states.copy_(torch.gather(states, 1, last.unsqueeze(-1).expand(-1, -1, states.shape[-1])))
+
+    @property
+    def sample_steps(self):
+        """
+            Number of simulated sample steps of the last rollout, K x T without pruning
+        """
+        return int(self.pruned_at.sum())
+
+class RolloutTermination(object):
+    """
+        Samples of a rollout that the running cost flagged as terminated, e.g. because they collided. From the step
+        a sample is flagged on, its commands are zeroed and its cost is frozen at the cost of that step plus penalty.
+        terminated_at holds the step every sample terminated at, T if it did not.
+    """
+
+    def __init__(self, penalty: float = 0.0):
+        self.penalty = penalty
+        self.terminated = None
+        self.frozen_costs = None
+        self.terminated_at = None
+
+    def reset(self, K: int, T: int, device='cpu'):
+        self.terminated = None
+        self.frozen_costs = None
+        self.terminated_at = torch.full((K,), T, dtype=torch.long, device=device)
+
+    def zero_commands(self, u):
+        """
+            Zero the commands of the terminated samples in the K x nu commands u in place
+        """
+        if self.terminated is not None:
+            u[self.terminated] = 0.0
+        return u
+
+    def update(self, t: int, costs, flags=None, rows=None):
+        """
+            Costs at step t of the simulated rows (indices into the K samples, None for all of them) with the frozen
+            costs of the terminated samples. flags marks the rows the running cost flagged as terminated.
+        """
+        if flags is None and self.terminated is None:
+            return costs
+        if self.terminated is None:
+            K = self.terminated_at.shape[0]
+            self.terminated = torch.zeros(K, dtype=torch.bool, device=costs.device)
+            self.frozen_costs = torch.zeros(K, dtype=costs.dtype, device=costs.device)
+
+        idx = slice(None) if rows is None else rows
+        was = self.terminated[idx]
+        costs = torch.where(was, self.frozen_costs[idx].to(costs.dtype), costs)
+        if flags is not None:
+            new = flags.to(torch.bool) & ~was
+            costs = torch.where(new, costs + self.penalty, costs)
+            self.frozen_costs[idx] = torch.where(new, costs, self.frozen_costs[idx])
+            self.terminated_at[idx] = torch.where(new, t, self.terminated_at[idx])
+            self.terminated[idx] = was | new
+        return costs
+
+def split_running_cost(result):
+    """
+        (costs, terminated flags or None) from a running cost that returns costs or (costs, terminated)
+    """
+    if isinstance(result, tuple):
+        return result
+    return result, None
+
+def compile_fn(fn):
+    """
+        torch.compile fn if available, falling back to eager execution when torch.compile is missing or compiling
+        fails on the first call. A first call that also fails eagerly is a bug in fn and raises, later calls are not
+        guarded. The batch size may change between calls (adaptive samples, chunks), with dynamic=None a change
+        recompiles once with a dynamic batch dimension instead of once per size.
+    """
+    if not hasattr(torch, 'compile'):
+        warnings.warn(f"torch.compile is not available, running {fn.__name__} eagerly")
+        return fn
+    compiled = torch.compile(fn, dynamic=None)
+    first_call = True
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        nonlocal compiled, first_call
+        if not first_call:
+            return compiled(*args, **kwargs)
+        first_call = False
+        try:
+            return compiled(*args, **kwargs)
+        except Exception as e:
+            result = fn(*args, **kwargs)
+            warnings.warn(f"compiling {fn.__name__} failed, running it eagerly: {e}")
+            compiled = fn
+            return result
+
+    return wrapper
+
 ###########################
 ## Quasi-Random Sampling ##
 ###########################
 
 def generate_prime_numbers(num):
-    def is_prime(n):
-        for j in range(2, ((n //2) + 1),1):
-            if n % j == 0:
-                return False
-        return True
-
-    primes = [0] * num #torch.zeros(num, device=device)
-    primes[0] = 2
-    curr_num = 1
-    for i in range(1, num):
-        while True:
-            curr_num += 2
-            if is_prime(curr_num):
-                primes[i] = curr_num
-                break
-            
-    return primes
+    return first_primes(num)
 
 def generate_van_der_corput_samples_batch(idx_batch, base):
     inp_device = idx_batch.device
@@ -78,14 +388,18 @@ def generate_van_der_corput_samples_batch(idx_batch, base):
     return r
 
 def generate_halton_samples(num_samples, ndims, bases=None, use_ghalton=True, seed_val=123, device=torch.device('cpu'), float_dtype=torch.float64):
-    if not use_ghalton:
+    if bases:
         samples = torch.zeros(num_samples, ndims, device=device, dtype=float_dtype)
-        if not bases:
-            bases = generate_prime_numbers(ndims)
         idx_batch = torch.arange(1,num_samples+1, device=device)
         for dim in range(ndims):
             samples[:, dim] = generate_van_der_corput_samples_batch(idx_batch, bases[dim])
+    elif not use_ghalton:
+        # Vectorized plain halton sequence
+        samples = ScrambledHalton(ndims, scramble=False, device=device, dtype=float_dtype).draw(num_samples)
     else:
+        # No silent fallback, noise banks are cached under the name of the sequence
+        if ghalton is None:
+            raise ImportError("ghalton is not installed, install it or use the qmc_sequence 'halton' or 'sobol'")
         
         if ndims <= 100:
             perms = ghalton.EA_PERMS[:ndims]
@@ -103,11 +417,149 @@ def generate_gaussian_halton_samples(num_samples, ndims, bases=None, use_ghalton
     
     return gaussian_halton_samples
 
-def cost_to_go(cost_seq, gamma_seq):
+def step_discounts(discounts, horizon, device='cpu', dtype=torch.float32):
+    """
+        T - 1 per-step discounts from a scalar discount or a list of them, where g_t discounts step t + 1 relative
+        to step t (e.g. gamma^(dt_t / dt) on a non-uniform time grid)
+    """
+    if isinstance(discounts, (int, float)):
+        discounts = [discounts] * (horizon - 1)
+    discounts = torch.as_tensor(discounts, dtype=torch.float64)
+    assert discounts.shape == (horizon - 1,), "expected one discount per step transition"
+    return discounts.to(device=device, dtype=dtype)
+
+def discount_sequence(discounts, horizon, device='cpu', dtype=torch.float32):
+    """
+        1 x T cumulative discounts [1, g_0, g_0 g_1, ...] of the per-step discounts of step_discounts
+    """
+    discounts = step_discounts(discounts, horizon, dtype=torch.float64)
+    gamma_seq = torch.cumprod(torch.cat((torch.ones(1, dtype=torch.float64), discounts)), dim=0)
+    return gamma_seq.reshape(1, horizon).to(device=device, dtype=dtype)
+
+def discounted_cost_to_go_(cost_seq, discounts):
+    """
+        In place discounted cost to go over the last dimension of the (... x T) costs, a reverse scan
+        cost_seq[..., t] += g_t cost_seq[..., t + 1] with the T - 1 per-step discounts g_t of step_discounts (or a
+        scalar). Every step of the scan works on all leading rows at once and never divides by a discount, so it is
+        exact for any horizon and for zero discounts. Returns cost_seq.
+    """
+    for t in range(cost_seq.shape[-1] - 2, -1, -1):
+        if torch.is_tensor(discounts):
+            cost_seq[..., t].addcmul_(cost_seq[..., t + 1], discounts[t])
+        else:
+            cost_seq[..., t].add_(cost_seq[..., t + 1], alpha=discounts)
+    return cost_seq
+
+
+#######################
+## B-Spline Sampling ##
+#######################
+
+def _bspline_knots(x, degree):
     """
-        Calculate (discounted) cost to go for given cost sequence
+        Knot vector used by scipy.interpolate.splrep for an interpolating (s=0) spline through x
     """
-    cost_seq = gamma_seq * cost_seq  # discounted cost sequence
-    cost_seq = torch.fliplr(torch.cumsum(torch.fliplr(cost_seq), axis=-1))  # cost to go (but scaled by [1 , gamma, gamma*2 and so on])
-    cost_seq /= gamma_seq  # un-scale it to get true discounted cost to go
-    return cost_seq
\ No newline at end of file
+    m = x.shape[0]
+    if degree % 2 == 1:
+        h = (degree + 1) // 2
+        interior = x[h:m - h]
+    else:
+        h = degree // 2
+        interior = 0.5 * (x[h:m - h - 1] + x[h + 1:m - h])
+    return torch.cat((x[:1].repeat(degree + 1), interior, x[-1:].repeat(degree + 1)))
+
+def _bspline_basis(x, knots, degree):
+    """
+        Evaluate all B-spline basis functions at x with the Cox-de Boor recursion, returns len(x) x n_basis
+    """
+    n_basis = knots.shape[0] - degree - 1
+    # Degree zero, half-open intervals except for the last non-empty one which also contains the end point
+    x = x.unsqueeze(-1)
+    basis = ((knots[:-1] <= x) & (x < knots[1:])).to(x.dtype)
+    last = n_basis + degree - 1 - torch.argmax(torch.flip(knots[1:] > knots[:-1], dims=(0,)).int())
+    basis[x.squeeze(-1) == knots[-1], last] = 1.0
+
+    for d in range(1, degree + 1):
+        left_den = knots[d:-1] - knots[:-d - 1]
+        right_den = knots[d + 1:] - knots[1:-d]
+        left = torch.where(left_den > 0, (x - knots[:-d - 1]) / torch.where(left_den > 0, left_den, 1.0), 0.0)
+        right = torch.where(right_den > 0, (knots[d + 1:] - x) / torch.where(right_den > 0, right_den, 1.0), 0.0)
+        basis = left * basis[:, :-1] + right * basis[:, 1:]
+    return basis[:, :n_basis]
+
+@functools.lru_cache(maxsize=16)
+def bspline_basis_matrix(n_points, n_knots, degree=3, device='cpu', float_dtype=torch.float32):
+    """
+        Linear map (n_points x n_knots) from n_knots control values to the interpolating B-spline of given degree
+        evaluated at n_points equally spaced points, i.e. splrep(linspace(0, n_knots, n_knots), c, k=degree, s=0)
+        followed by splev(linspace(0, n_knots, n_points)). Computed once in float64 and cached per geometry.
+    """
+    assert 0 < degree < n_knots, "the spline degree must be positive and smaller than the number of knots"
+    x = torch.linspace(0, n_knots, n_knots, dtype=torch.float64)
+    xx = torch.linspace(0, n_knots, n_points, dtype=torch.float64)
+    knots = _bspline_knots(x, degree)
+
+    collocation = _bspline_basis(x, knots, degree)
+    evaluation = _bspline_basis(xx, knots, degree)
+    basis_matrix = torch.linalg.solve(collocation.T, evaluation.T).T
+    return basis_matrix.to(device=device, dtype=float_dtype)
+
+def bspline_batch(c_arr, n=100, degree=3):
+    """
+        Interpolate a batch of knot sequences (... x n_knots) with B-splines, returns (... x n) samples
+        with a single matmul against the cached basis matrix
+    """
+    basis_matrix = bspline_basis_matrix(n, c_arr.shape[-1], degree, str(c_arr.device), c_arr.dtype)
+    return torch.matmul(c_arr, basis_matrix.T)
+
+
+###############
+## Filtering ##
+###############
+
+class SavGolFilter(object):
+    """
+        Savitzky-Golay filter along the time axis of (T x nu) or batched (B x T x nu) action sequences,
+        equivalent to scipy.signal.savgol_filter(u, window_length, polyorder, axis=-2, mode='interp').
+
+        The convolution coefficients and the polynomial fits used for the first and last window_length // 2 steps
+        are computed once, filtering is a single conv1d plus two small matmuls for the edges on the input's device.
+    """
+
+    def __init__(self, window_length, polyorder, device='cpu', dtype=torch.float32):
+        if window_length % 2 == 0:
+            raise ValueError("window_length must be odd")
+        if polyorder >= window_length:
+            raise ValueError("polyorder must be less than window_length")
+        self.window_length = window_length
+        self.polyorder = polyorder
+        half = window_length // 2
+
+        # Least squares polynomial fit over a window, evaluated at every offset within that window
+        z = torch.arange(-half, half + 1, dtype=torch.float64)
+        vander = z.unsqueeze(-1) ** torch.arange(polyorder + 1, dtype=torch.float64)
+        fit = vander @ torch.linalg.pinv(vander)
+
+        self.weight = fit[half].view(1, 1, -1).to(device=device, dtype=dtype)
+        self.head = fit[:half].to(device=device, dtype=dtype)
+        self.tail = fit[half + 1:].to(device=device, dtype=dtype)
+
+    def __call__(self, u):
+        batched = u.dim() == 3
+        if not batched:
+            u = u.unsqueeze(0)
+        B, T, nu = u.shape
+        if T < self.window_length:
+            raise ValueError("the action sequence must be at least window_length long in mode 'interp'")
+        weight = self.weight.to(u.dtype)
+
+        # Interior with one conv1d over every (batch, action) channel
+        channels = u.transpose(1, 2).reshape(B * nu, 1, T)
+        interior = torch.nn.functional.conv1d(channels, weight).view(B, nu, -1).transpose(1, 2)
+
+        # Edges use the polynomial fitted to the first and last window
+        head = torch.matmul(self.head.to(u.dtype), u[:, :self.window_length])
+        tail = torch.matmul(self.tail.to(u.dtype), u[:, -self.window_length:])
+
+        u_filtered = torch.cat((head, interior, tail), dim=1)
+        return u_filtered if batched else u_filtered.squeeze(0)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+import torch
+
+# Bump whenever the way halton noise banks are generated changes, so banks stored on disk by an older version are
+# regenerated instead of silently reused.
+NOISE_BANK_VERSION = 1
+
+# Banks on disk whose contents matched the digest of their sidecar in this process, (path, digest)
+_verified_banks = set()
+
+
+class NoiseBankKey(NamedTuple):
+    """
+        Sampling geometry that fully determines a halton noise bank
+    """
+    num_samples: int
+    horizon: int
+    nu: int
+    knot_scale: int
+    degree: int
+    seed: int
+    dtype: str
+    sequence: str = "ghalton"
+    spline: str = "smoothing"
+
+    def digest(self):
+        key = json.dumps({"version": NOISE_BANK_VERSION, **self._asdict()}, sort_keys=True)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _content_digest(bank: np.ndarray):
+    return hashlib.sha256(np.ascontiguousarray(bank).data).hexdigest()
+
+
+def _replace_atomically(path: str, write: Callable):
+    """
+        Writes path through a unique temporary file in the same directory, so concurrent servers never read a half
+        written file or write to each other's temporary file
+    """
+    directory, name = os.path.split(path)
+    f = tempfile.NamedTemporaryFile(dir=directory, prefix=name + ".", suffix=".tmp", delete=False)
+    try:
+        with f:
+            write(f)
+        os.replace(f.name, path)
+    except BaseException:
+        if os.path.exists(f.name):
+            os.remove(f.name)
+        raise
+
+
+class NoiseBankCache(object):
+    """
+        Cache of halton noise banks (K x T x nu tensors) keyed by sampling geometry.
+
+        Banks are kept on cpu in an in-process LRU with at most max_entries banks. If cache_dir is given they are also
+        stored there as .npy files next to a .json sidecar holding the key, shape and a sha256 digest of the contents,
+        and loaded memory-mapped, so the cached bank shares the page cache with other processes instead of holding its
+        own copy. The digest is checked on the first load of a bank in a process, which reads the whole file once. A
+        bank whose sidecar, shape or contents do not match its key is regenerated.
+    """
+
+    def __init__(self, max_entries: int = 8, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._banks = OrderedDict()
+
+    def __len__(self):
+        return len(self._banks)
+
+    def __contains__(self, key: NoiseBankKey):
+        return key in self._banks
+
+    def clear(self):
+        self._banks.clear()
+
+    def _paths(self, key: NoiseBankKey, cache_dir: str):
+        name = f"halton_{key.digest()}"
+        return os.path.join(cache_dir, name + ".npy"), os.path.join(cache_dir, name + ".json")
+
+    def _load(self, key: NoiseBankKey, cache_dir: str):
+        bank_path, meta_path = self._paths(key, cache_dir)
+        if not (os.path.isfile(bank_path) and os.path.isfile(meta_path)):
+            return None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Copy-on-write mapping, the cached tensor is never written to but torch expects a writable array
+            bank = np.load(bank_path, mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+
+        expected_shape = [key.num_samples, key.horizon, key.nu]
+        if (
+            meta.get("version") != NOISE_BANK_VERSION
+            or meta.get("key") != list(key)
+            or meta.get("shape") != expected_shape
+            or list(bank.shape) != expected_shape
+        ):
+            return None
+
+        # Catches banks corrupted or rewritten in place, once per process
+        verified = (bank_path, meta.get("sha256"))
+        if verified not in _verified_banks:
+            if _content_digest(bank) != meta.get("sha256"):
+                return None
+            _verified_banks.add(verified)
+        return torch.from_numpy(bank)
+
+    def _store(self, key: NoiseBankKey, bank: torch.Tensor, cache_dir: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        bank_path, meta_path = self._paths(key, cache_dir)
+        bank = bank.numpy()
+        meta = {"version": NOISE_BANK_VERSION, "key": list(key), "shape": list(bank.shape), "sha256": _content_digest(bank)}
+        # The bank is replaced before its sidecar, a bank without a matching sidecar is regenerated
+        _replace_atomically(bank_path, lambda f: np.save(f, bank))
+        _replace_atomically(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+
+    def _insert(self, key: NoiseBankKey, bank: torch.Tensor):
+        self._banks[key] = bank
+        self._banks.move_to_end(key)
+        while len(self._banks) > self.max_entries:
+            self._banks.popitem(last=False)
+
+    def get(self, key: NoiseBankKey, generate: Callable[[], torch.Tensor], device="cpu", cache_dir: Optional[str] = None):
+        """
+            Returns a copy of the bank for key on device, loading it from memory or disk or calling generate() to
+            create it. The copy can be modified in place without affecting the cache, planners write their zero-noise
+            sample into it. Every call copies the whole bank, also from a memory-mapped file.
+        """
+        cache_dir = cache_dir or self.cache_dir
+
+        bank = self._banks.get(key)
+        if bank is not None:
+            self._banks.move_to_end(key)
+        else:
+            if cache_dir:
+                bank = self._load(key, cache_dir)
+            if bank is None:
+                bank = generate().detach().to("cpu").contiguous()
+                if cache_dir:
+                    self._store(key, bank, cache_dir)
+            self._insert(key, bank)
+
+        return bank.to(device=device, copy=True)
+
+
+noise_bank_cache = NoiseBankCache()
@@ -0,0 +1,93 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+import torch
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Profiler(object):
+    """
+        Named timing spans around the phases of a planner.
+
+        Every span keeps the durations of its last window calls for rolling percentiles, and the last max_events spans
+        are kept as Chrome trace events (chrome://tracing, Perfetto). With synchronize, the device is synchronized at
+        the start and end of every span so asynchronous cuda work is attributed to the span that launched it.
+
+        When disabled, span() returns a shared no-op context manager, so instrumented code pays a method call only.
+    """
+
+    def __init__(self, enabled: bool = False, synchronize: bool = False, device="cpu", window: int = 1000, max_events: int = 100000):
+        self.enabled = enabled
+        self.synchronize = synchronize and torch.device(device).type == "cuda"
+        self.device = device
+        self.window = window
+        self._durations = defaultdict(lambda: deque(maxlen=self.window))
+        self._events = deque(maxlen=max_events)
+        self._t0 = time.perf_counter()
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextlib.contextmanager
+    def _span(self, name: str):
+        if self.synchronize:
+            torch.cuda.synchronize(self.device)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.synchronize:
+                torch.cuda.synchronize(self.device)
+            end = time.perf_counter()
+            self._durations[name].append(end - start)
+            self._events.append((name, start, end, threading.get_ident()))
+
+    def reset(self):
+        self._durations.clear()
+        self._events.clear()
+
+    def stats(self):
+        """
+            Returns {span name: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}} over the last window calls per span
+        """
+        stats = {}
+        for name, durations in self._durations.items():
+            ms = np.asarray(durations) * 1e3
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            stats[name] = {
+                "count": len(ms),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(ms.max()),
+            }
+        return stats
+
+    def export_chrome_trace(self, path: str):
+        """
+            Writes the recorded spans as a Chrome trace JSON file
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._t0) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, start, end, tid in self._events
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
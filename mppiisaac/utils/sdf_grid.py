@@ -0,0 +1,193 @@
+import math
+from typing import Dict, List, Sequence
+
+import torch
+import torch.nn.functional as F
+
+
+def _yaw(quaternion: Sequence[float]) -> float:
+    x, y, z, w = quaternion
+    return math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+
+
+class SignedDistanceGrid(object):
+    """
+        Signed distance to sphere and box obstacles baked into a regular 2D (x, y) or 3D (x, y, z) grid, with grid
+        points every resolution from lower up to (at least) upper.
+
+        distance(points) evaluates any batch of points with one bilinear / trilinear lookup, so an obstacle cost no
+        longer scales with the number of obstacles. Points outside the grid get the distance at the closest border.
+
+        Spheres have their radius in size[0], boxes their full extents in size and are rotated by yaw about z, a 2D
+        grid holds the cross sections in the xy plane. set_obstacle only marks obstacles that moved or changed, the
+        next lookup (or update) rebuilds incrementally: the grid points a changed obstacle was closest to are
+        recomputed from all obstacles, all other grid points take the minimum with the new distance of the changed
+        obstacle. Distances are capped at the diagonal of the grid, which is also the value of a grid without
+        obstacles.
+    """
+
+    def __init__(
+        self,
+        lower: Sequence[float],
+        upper: Sequence[float],
+        resolution: float,
+        device="cpu",
+        dtype=torch.float32,
+        chunk_size: int = 65536,
+    ):
+        assert len(lower) == len(upper) and len(lower) in (2, 3), "the grid is either 2D or 3D"
+        assert all(u > l for l, u in zip(lower, upper)), "upper has to be larger than lower on every axis"
+        assert resolution > 0, "resolution has to be positive"
+        self.ndim = len(lower)
+        self.resolution = resolution
+        self.chunk_size = chunk_size
+        self.tensor_args = {"device": device, "dtype": dtype}
+
+        # Grid points per axis in x, y(, z) order, the grid itself is indexed [(z,) y, x] like the input of grid_sample
+        self.shape = [int(math.ceil((u - l) / resolution - 1e-9)) + 1 for l, u in zip(lower, upper)]
+        self.lower = torch.tensor(lower, **self.tensor_args)
+        self.upper = self.lower + resolution * (torch.tensor(self.shape, **self.tensor_args) - 1)
+        self.max_distance = torch.linalg.norm(self.upper - self.lower).item()
+
+        axes = [self.lower[i] + resolution * torch.arange(n, **self.tensor_args) for i, n in enumerate(self.shape)]
+        mesh = torch.meshgrid(*reversed(axes), indexing="ij")
+        self.points = torch.stack(list(reversed(mesh)), dim=-1).reshape(-1, self.ndim)
+
+        self.grid = torch.full(tuple(reversed(self.shape)), self.max_distance, **self.tensor_args)
+        # Slot of the obstacle closest to every grid point, -1 if none is within max_distance
+        self.owner = torch.full((self.points.shape[0],), -1, dtype=torch.long, device=device)
+
+        # Per obstacle slot: center (3), half extents or radius (3), yaw, is box
+        self.slots: Dict[str, int] = {}
+        self.params = torch.zeros((0, 8), **self.tensor_args)
+        self.active = torch.zeros(0, dtype=torch.bool, device=device)
+        self.dirty = set()
+        # Obstacle distances evaluated by the last update, to compare incremental against full rebuilds
+        self.evaluations = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def set_obstacle(self, name: str, type: str, position: Sequence[float], size: Sequence[float], yaw: float = 0.0):
+        """
+            Adds the obstacle or moves / resizes the one with the same name, a no-op if nothing changed
+        """
+        assert type in ("sphere", "box"), f"obstacles of type {type} are not supported"
+        center = list(position[:3]) + [0.0] * (3 - len(position[:3]))
+        if type == "box":
+            extents = list(size[:3]) + [0.0] * (3 - len(size[:3]))
+            half = [s / 2 for s in extents]
+        else:
+            half = [size[0]] * 3
+        params = torch.tensor([*center, *half, yaw, 1.0 if type == "box" else 0.0], **self.tensor_args)
+
+        slot = self.slots.get(name)
+        if slot is None:
+            free = torch.nonzero(~self.active).flatten()
+            if free.numel() > 0:
+                slot = free[0].item()
+            else:
+                slot = self.params.shape[0]
+                self.params = torch.cat((self.params, params.unsqueeze(0)))
+                self.active = torch.cat((self.active, self.active.new_zeros(1)))
+            self.slots[name] = slot
+        elif torch.equal(self.params[slot], params):
+            return
+
+        self.params[slot] = params
+        self.active[slot] = True
+        self.dirty.add(slot)
+
+    def remove_obstacle(self, name: str):
+        slot = self.slots.pop(name)
+        self.active[slot] = False
+        self.dirty.add(slot)
+
+    def add_actors(self, actors: List):
+        """
+            Adds the sphere and box actors of an env_cfg (ActorWrapper) at their initial pose, other actors are skipped
+        """
+        for actor in actors:
+            if actor.type in ("sphere", "box"):
+                self.set_obstacle(actor.name, actor.type, actor.init_pos, actor.size, yaw=_yaw(actor.init_ori))
+
+    def _obstacle_distance(self, points, slots):
+        """
+            Analytic signed distance of the P x ndim points to the obstacles in slots, P x len(slots)
+        """
+        params = self.params[slots]
+        center, half, yaw, is_box = params[:, : self.ndim], params[:, 3 : 3 + self.ndim], params[:, 6], params[:, 7] > 0
+
+        rel = points.unsqueeze(1) - center
+        cos, sin = torch.cos(yaw), torch.sin(yaw)
+        local = torch.cat(
+            (
+                (cos * rel[..., 0] + sin * rel[..., 1]).unsqueeze(-1),
+                (cos * rel[..., 1] - sin * rel[..., 0]).unsqueeze(-1),
+                rel[..., 2:],
+            ),
+            dim=-1,
+        )
+        q = torch.abs(local) - half
+        box = torch.linalg.norm(torch.clamp(q, min=0), dim=-1) + torch.clamp(q.max(dim=-1).values, max=0)
+        sphere = torch.linalg.norm(rel, dim=-1) - half[:, 0]
+
+        distance = torch.where(is_box, box, sphere)
+        return torch.where(self.active[slots], distance, torch.full_like(distance, self.max_distance))
+
+    def _closest(self, points, slots):
+        distance, closest = self._obstacle_distance(points, slots).min(dim=1)
+        return torch.clamp(distance, max=self.max_distance), slots[closest]
+
+    def update(self):
+        """
+            Rebuilds the grid points affected by the obstacles changed since the last update
+        """
+        if not self.dirty:
+            return
+        dirty = torch.tensor(sorted(self.dirty), dtype=torch.long, device=self.owner.device)
+        self.dirty.clear()
+        grid = self.grid.view(-1)
+        self.evaluations = 0
+
+        # Grid points that were closest to a changed obstacle are recomputed from all present obstacles
+        slots = torch.nonzero(self.active).flatten()
+        stale = torch.nonzero(torch.isin(self.owner, dirty)).flatten()
+        for idx in stale.split(self.chunk_size):
+            if slots.numel() == 0:
+                grid[idx], self.owner[idx] = self.max_distance, -1
+                continue
+            distance, closest = self._closest(self.points[idx], slots)
+            grid[idx] = distance
+            self.owner[idx] = torch.where(distance < self.max_distance, closest, torch.full_like(closest, -1))
+            self.evaluations += idx.numel() * slots.numel()
+
+        # All other grid points can only get closer to the changed obstacles that are still present
+        changed = dirty[self.active[dirty]]
+        if changed.numel() == 0:
+            return
+        for start in range(0, self.points.shape[0], self.chunk_size):
+            end = min(start + self.chunk_size, self.points.shape[0])
+            distance, closest = self._closest(self.points[start:end], changed)
+            closer = distance < grid[start:end]
+            grid[start:end] = torch.where(closer, distance, grid[start:end])
+            self.owner[start:end] = torch.where(closer, closest, self.owner[start:end])
+        self.evaluations += self.points.shape[0] * changed.numel()
+
+    def distance(self, points: torch.Tensor) -> torch.Tensor:
+        """
+            Interpolated signed distance of points (... x d with d >= ndim, extra coordinates are ignored), shaped ...
+        """
+        self.update()
+        batch_shape = points.shape[:-1]
+        points = points[..., : self.ndim].reshape(-1, self.ndim).to(self.grid.dtype)
+
+        normalized = 2 * (points - self.lower) / (self.upper - self.lower) - 1
+        distance = F.grid_sample(
+            self.grid[None, None],
+            normalized.view((1,) * self.ndim + (-1, self.ndim)),
+            mode="bilinear",
+            padding_mode="border",
+            align_corners=True,
+        )
+        return distance.reshape(batch_shape)